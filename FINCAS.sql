@@ -0,0 +1,296 @@
+-- Varias fincas en un mismo proyecto de Supabase
+-- Ejecutar en Supabase SQL Editor después de RESUMEN_DIARIO.sql y
+-- SINCRONIZACION.sql, antes de activar FINCAS en la app
+--
+-- Cada registro, fila del resumen diario y lápida lleva la finca a la que
+-- pertenece, y los índices empiezan por finca_id: las consultas de una finca
+-- recorren solo su tramo del índice, sin importar cuánto historial tengan las
+-- demás. Los registros existentes quedan en la finca 'principal' (cambiar los
+-- DEFAULT si FINCA_DEFECTO es otra).
+--
+-- Las funciones RPC reciben p_finca_id; sin él usan 'principal', así una app
+-- configurada con una sola finca sigue funcionando igual.
+
+ALTER TABLE riegos
+ADD COLUMN IF NOT EXISTS finca_id TEXT NOT NULL DEFAULT 'principal';
+
+CREATE INDEX IF NOT EXISTS idx_riegos_finca_fecha ON riegos(finca_id, fecha);
+CREATE INDEX IF NOT EXISTS idx_riegos_finca_timestamp_id ON riegos(finca_id, timestamp DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_riegos_finca_id ON riegos(finca_id, id);
+CREATE INDEX IF NOT EXISTS idx_riegos_finca_version ON riegos(finca_id, version);
+
+ALTER TABLE riegos_resumen_diario
+ADD COLUMN IF NOT EXISTS finca_id TEXT NOT NULL DEFAULT 'principal';
+
+ALTER TABLE riegos_resumen_diario DROP CONSTRAINT IF EXISTS riegos_resumen_diario_pkey;
+ALTER TABLE riegos_resumen_diario ADD PRIMARY KEY (finca_id, fecha, modulo);
+
+ALTER TABLE riegos_borrados
+ADD COLUMN IF NOT EXISTS finca_id TEXT NOT NULL DEFAULT 'principal';
+
+CREATE INDEX IF NOT EXISTS idx_riegos_borrados_finca_version ON riegos_borrados(finca_id, version);
+
+-- Resumen diario: igual que en RESUMEN_DIARIO.sql, agrupando también por finca
+CREATE OR REPLACE FUNCTION riegos_resumen_aplicar(p_filas JSONB, p_signo INTEGER)
+RETURNS VOID
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+BEGIN
+    INSERT INTO riegos_resumen_diario AS r (
+        finca_id, fecha, modulo, n_agua, n_comida, n_ducha, n_goteo,
+        minutos_ducha, minutos_goteo, minutos_total, n_registros
+    )
+    SELECT f->>'finca_id',
+           (f->>'fecha')::DATE,
+           f->>'modulo',
+           p_signo * COUNT(*) FILTER (WHERE f->>'tipo_riego' = 'agua'),
+           p_signo * COUNT(*) FILTER (WHERE f->>'tipo_riego' = 'comida'),
+           p_signo * COUNT(*) FILTER (WHERE f->>'sistema_riego' = 'ducha'),
+           p_signo * COUNT(*) FILTER (WHERE f->>'sistema_riego' = 'goteo'),
+           p_signo * COALESCE(SUM((f->>'tiempo_minutos')::INTEGER) FILTER (WHERE f->>'sistema_riego' = 'ducha'), 0),
+           p_signo * COALESCE(SUM((f->>'tiempo_minutos')::INTEGER) FILTER (WHERE f->>'sistema_riego' = 'goteo'), 0),
+           p_signo * COALESCE(SUM((f->>'tiempo_minutos')::INTEGER), 0),
+           p_signo * COUNT(*)
+    FROM jsonb_array_elements(p_filas) AS f
+    GROUP BY 1, 2, 3
+    ON CONFLICT (finca_id, fecha, modulo) DO UPDATE SET
+        n_agua = r.n_agua + EXCLUDED.n_agua,
+        n_comida = r.n_comida + EXCLUDED.n_comida,
+        n_ducha = r.n_ducha + EXCLUDED.n_ducha,
+        n_goteo = r.n_goteo + EXCLUDED.n_goteo,
+        minutos_ducha = r.minutos_ducha + EXCLUDED.minutos_ducha,
+        minutos_goteo = r.minutos_goteo + EXCLUDED.minutos_goteo,
+        minutos_total = r.minutos_total + EXCLUDED.minutos_total,
+        n_registros = r.n_registros + EXCLUDED.n_registros;
+
+    IF p_signo < 0 THEN
+        DELETE FROM riegos_resumen_diario AS r
+        USING (SELECT DISTINCT f->>'finca_id' AS finca_id, (f->>'fecha')::DATE AS fecha, f->>'modulo' AS modulo
+               FROM jsonb_array_elements(p_filas) AS f) AS tocadas
+        WHERE r.finca_id = tocadas.finca_id
+          AND r.fecha = tocadas.fecha
+          AND r.modulo = tocadas.modulo
+          AND r.n_registros <= 0;
+    END IF;
+END;
+$$;
+
+-- Sin p_finca_id recalcula todas las fincas
+DROP FUNCTION IF EXISTS recalcular_resumen_diario(DATE, DATE);
+CREATE OR REPLACE FUNCTION recalcular_resumen_diario(
+    p_desde DATE DEFAULT NULL, p_hasta DATE DEFAULT NULL, p_finca_id TEXT DEFAULT NULL)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    v_filas INTEGER;
+BEGIN
+    DELETE FROM riegos_resumen_diario
+    WHERE (p_finca_id IS NULL OR finca_id = p_finca_id)
+      AND (p_desde IS NULL OR fecha >= p_desde)
+      AND (p_hasta IS NULL OR fecha <= p_hasta);
+
+    INSERT INTO riegos_resumen_diario (
+        finca_id, fecha, modulo, n_agua, n_comida, n_ducha, n_goteo,
+        minutos_ducha, minutos_goteo, minutos_total, n_registros
+    )
+    SELECT finca_id,
+           fecha,
+           modulo,
+           COUNT(*) FILTER (WHERE tipo_riego = 'agua'),
+           COUNT(*) FILTER (WHERE tipo_riego = 'comida'),
+           COUNT(*) FILTER (WHERE sistema_riego = 'ducha'),
+           COUNT(*) FILTER (WHERE sistema_riego = 'goteo'),
+           COALESCE(SUM(tiempo_minutos) FILTER (WHERE sistema_riego = 'ducha'), 0),
+           COALESCE(SUM(tiempo_minutos) FILTER (WHERE sistema_riego = 'goteo'), 0),
+           COALESCE(SUM(tiempo_minutos), 0),
+           COUNT(*)
+    FROM riegos
+    WHERE (p_finca_id IS NULL OR finca_id = p_finca_id)
+      AND (p_desde IS NULL OR fecha >= p_desde)
+      AND (p_hasta IS NULL OR fecha <= p_hasta)
+    GROUP BY finca_id, fecha, modulo;
+
+    GET DIAGNOSTICS v_filas = ROW_COUNT;
+    RETURN v_filas;
+END;
+$$;
+
+DROP FUNCTION IF EXISTS reemplazar_modulo_dia(DATE, TEXT, JSONB);
+CREATE OR REPLACE FUNCTION reemplazar_modulo_dia(
+    p_fecha DATE, p_modulo TEXT, p_registros JSONB, p_finca_id TEXT DEFAULT 'principal')
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_eliminados JSONB;
+    v_insertados JSONB;
+    v_sistema TEXT;
+    v_tiempo INTEGER;
+BEGIN
+    WITH borrados AS (
+        DELETE FROM riegos
+        WHERE finca_id = p_finca_id AND fecha = p_fecha AND modulo = p_modulo
+        RETURNING *
+    )
+    SELECT COALESCE(jsonb_agg(to_jsonb(borrados)), '[]'::jsonb)
+    INTO v_eliminados
+    FROM borrados;
+
+    SELECT e->>'sistema_riego', (e->>'tiempo_minutos')::INTEGER
+    INTO v_sistema, v_tiempo
+    FROM jsonb_array_elements(v_eliminados) AS e
+    WHERE e->>'sistema_riego' IS NOT NULL AND e->>'sistema_riego' <> 'N/A'
+    LIMIT 1;
+
+    WITH nuevos AS (
+        INSERT INTO riegos (finca_id, fecha, modulo, tipo_riego, sistema_riego, tiempo_minutos, timestamp)
+        SELECT p_finca_id,
+               (r->>'fecha')::DATE,
+               r->>'modulo',
+               r->>'tipo_riego',
+               COALESCE(r->>'sistema_riego', v_sistema),
+               COALESCE((r->>'tiempo_minutos')::INTEGER, v_tiempo),
+               COALESCE((r->>'timestamp')::TIMESTAMPTZ, NOW())
+        FROM jsonb_array_elements(p_registros) AS r
+        RETURNING *
+    )
+    SELECT COALESCE(jsonb_agg(to_jsonb(nuevos)), '[]'::jsonb)
+    INTO v_insertados
+    FROM nuevos;
+
+    RETURN jsonb_build_object('eliminados', v_eliminados, 'insertados', v_insertados);
+END;
+$$;
+
+-- Las lápidas conservan la finca de la fila borrada
+CREATE OR REPLACE FUNCTION riegos_sync_eliminar()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO riegos_borrados (uuid, actualizado_en, finca_id)
+    SELECT uuid, NOW(), finca_id FROM viejas
+    ON CONFLICT (uuid) DO UPDATE SET
+        actualizado_en = EXCLUDED.actualizado_en,
+        finca_id = EXCLUDED.finca_id,
+        version = nextval('riegos_version_seq');
+    RETURN NULL;
+END;
+$$;
+
+DROP FUNCTION IF EXISTS riegos_cambios_desde(BIGINT, INTEGER);
+CREATE OR REPLACE FUNCTION riegos_cambios_desde(
+    p_version BIGINT, p_limite INTEGER DEFAULT 1000, p_finca_id TEXT DEFAULT 'principal')
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+AS $$
+    WITH cambios AS (
+        (SELECT r.version, to_jsonb(r) AS dato, FALSE AS borrado
+         FROM riegos r WHERE r.finca_id = p_finca_id AND r.version > p_version
+         ORDER BY r.version LIMIT p_limite)
+        UNION ALL
+        (SELECT b.version, to_jsonb(b), TRUE
+         FROM riegos_borrados b WHERE b.finca_id = p_finca_id AND b.version > p_version
+         ORDER BY b.version LIMIT p_limite)
+    ),
+    pagina AS (
+        SELECT * FROM cambios ORDER BY version LIMIT p_limite
+    )
+    SELECT jsonb_build_object(
+        'filas', COALESCE((SELECT jsonb_agg(dato ORDER BY version) FROM pagina WHERE NOT borrado), '[]'::jsonb),
+        'borrados', COALESCE((SELECT jsonb_agg(dato ORDER BY version) FROM pagina WHERE borrado), '[]'::jsonb),
+        'version', COALESCE((SELECT MAX(version) FROM pagina), p_version),
+        'mas', (SELECT COUNT(*) FROM pagina) = p_limite
+    );
+$$;
+
+-- Como en SINCRONIZACION.sql, pero un cliente solo toca filas y lápidas de su
+-- finca: un uuid que pertenece a otra finca se ignora
+DROP FUNCTION IF EXISTS riegos_aplicar_cambios(JSONB, JSONB);
+CREATE OR REPLACE FUNCTION riegos_aplicar_cambios(
+    p_filas JSONB, p_borrados JSONB, p_finca_id TEXT DEFAULT 'principal')
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    v_anteriores JSONB;
+    v_nuevas JSONB;
+    v_eliminadas JSONB;
+BEGIN
+    WITH entrantes AS (
+        SELECT e.*
+        FROM jsonb_populate_recordset(NULL::riegos, p_filas) e
+        WHERE NOT EXISTS (SELECT 1 FROM riegos o WHERE o.uuid = e.uuid AND o.finca_id <> p_finca_id)
+          AND NOT EXISTS (SELECT 1 FROM riegos_borrados o WHERE o.uuid = e.uuid AND o.finca_id <> p_finca_id)
+    ),
+    ganadoras AS (
+        SELECT e.*
+        FROM entrantes e
+        LEFT JOIN riegos r ON r.uuid = e.uuid
+        LEFT JOIN riegos_borrados b ON b.uuid = e.uuid
+        WHERE e.actualizado_en > COALESCE(GREATEST(r.actualizado_en, b.actualizado_en), '-infinity')
+    ),
+    anteriores AS (
+        SELECT r.* FROM riegos r JOIN ganadoras g ON g.uuid = r.uuid
+    ),
+    actualizadas AS (
+        UPDATE riegos r SET
+            fecha = g.fecha,
+            modulo = g.modulo,
+            tipo_riego = g.tipo_riego,
+            sistema_riego = g.sistema_riego,
+            tiempo_minutos = g.tiempo_minutos,
+            "timestamp" = g."timestamp",
+            actualizado_en = g.actualizado_en
+        FROM ganadoras g
+        WHERE r.uuid = g.uuid
+        RETURNING r.*
+    ),
+    insertadas AS (
+        INSERT INTO riegos (finca_id, uuid, fecha, modulo, tipo_riego, sistema_riego, tiempo_minutos, "timestamp", actualizado_en)
+        SELECT p_finca_id, g.uuid, g.fecha, g.modulo, g.tipo_riego, g.sistema_riego, g.tiempo_minutos, g."timestamp", g.actualizado_en
+        FROM ganadoras g
+        WHERE NOT EXISTS (SELECT 1 FROM anteriores a WHERE a.uuid = g.uuid)
+        RETURNING *
+    ),
+    revividas AS (
+        DELETE FROM riegos_borrados b USING ganadoras g WHERE b.uuid = g.uuid
+    )
+    SELECT COALESCE((SELECT jsonb_agg(to_jsonb(a)) FROM anteriores a), '[]'::jsonb),
+           COALESCE((SELECT jsonb_agg(to_jsonb(n)) FROM (
+               SELECT * FROM actualizadas UNION ALL SELECT * FROM insertadas) n), '[]'::jsonb)
+    INTO v_anteriores, v_nuevas;
+
+    WITH borrables AS (
+        SELECT * FROM jsonb_populate_recordset(NULL::riegos_borrados, p_borrados)
+    ),
+    eliminadas AS (
+        DELETE FROM riegos r USING borrables b
+        WHERE r.uuid = b.uuid AND r.finca_id = p_finca_id AND r.actualizado_en <= b.actualizado_en
+        RETURNING r.*
+    )
+    SELECT COALESCE(jsonb_agg(to_jsonb(e)), '[]'::jsonb) INTO v_eliminadas FROM eliminadas e;
+
+    INSERT INTO riegos_borrados AS l (uuid, actualizado_en, finca_id)
+    SELECT b.uuid, b.actualizado_en, p_finca_id
+    FROM jsonb_populate_recordset(NULL::riegos_borrados, p_borrados) b
+    WHERE NOT EXISTS (SELECT 1 FROM riegos r WHERE r.uuid = b.uuid)
+    ON CONFLICT (uuid) DO UPDATE SET
+        actualizado_en = EXCLUDED.actualizado_en,
+        version = nextval('riegos_version_seq')
+    WHERE l.finca_id = p_finca_id
+      AND (l.actualizado_en < EXCLUDED.actualizado_en
+           OR l.uuid IN (SELECT (e->>'uuid')::UUID FROM jsonb_array_elements(v_eliminadas) e));
+
+    RETURN jsonb_build_object(
+        'eliminados', v_anteriores || v_eliminadas,
+        'insertados', v_nuevas
+    );
+END;
+$$;
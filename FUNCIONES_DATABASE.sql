@@ -0,0 +1,50 @@
+-- Funciones (RPC) que usa la app sobre la tabla de riegos
+-- Ejecutar en Supabase SQL Editor después de UPDATE_DATABASE.sql
+
+-- Reemplaza en una sola transacción todos los registros de un módulo en una
+-- fecha (lo usa el modal de edición a través de /reemplazar-modulo-dia).
+-- Los registros nuevos sin sistema_riego o tiempo_minutos heredan los de los
+-- registros reemplazados.
+CREATE OR REPLACE FUNCTION reemplazar_modulo_dia(p_fecha DATE, p_modulo TEXT, p_registros JSONB)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_eliminados JSONB;
+    v_insertados JSONB;
+    v_sistema TEXT;
+    v_tiempo INTEGER;
+BEGIN
+    WITH borrados AS (
+        DELETE FROM riegos
+        WHERE fecha = p_fecha AND modulo = p_modulo
+        RETURNING *
+    )
+    SELECT COALESCE(jsonb_agg(to_jsonb(borrados)), '[]'::jsonb)
+    INTO v_eliminados
+    FROM borrados;
+
+    SELECT e->>'sistema_riego', (e->>'tiempo_minutos')::INTEGER
+    INTO v_sistema, v_tiempo
+    FROM jsonb_array_elements(v_eliminados) AS e
+    WHERE e->>'sistema_riego' IS NOT NULL AND e->>'sistema_riego' <> 'N/A'
+    LIMIT 1;
+
+    WITH nuevos AS (
+        INSERT INTO riegos (fecha, modulo, tipo_riego, sistema_riego, tiempo_minutos, timestamp)
+        SELECT (r->>'fecha')::DATE,
+               r->>'modulo',
+               r->>'tipo_riego',
+               COALESCE(r->>'sistema_riego', v_sistema),
+               COALESCE((r->>'tiempo_minutos')::INTEGER, v_tiempo),
+               COALESCE((r->>'timestamp')::TIMESTAMPTZ, NOW())
+        FROM jsonb_array_elements(p_registros) AS r
+        RETURNING *
+    )
+    SELECT COALESCE(jsonb_agg(to_jsonb(nuevos)), '[]'::jsonb)
+    INTO v_insertados
+    FROM nuevos;
+
+    RETURN jsonb_build_object('eliminados', v_eliminados, 'insertados', v_insertados);
+END;
+$$;
@@ -0,0 +1,148 @@
+-- Tabla de resumen diario por (fecha, módulo), mantenida por triggers
+-- Ejecutar en Supabase SQL Editor después de UPDATE_DATABASE.sql
+--
+-- Cada escritura sobre riegos (inserción, edición, borrado, también las que
+-- hace reemplazar_modulo_dia) ajusta los contadores del día y módulo que toca,
+-- así el resumen semanal lee a lo sumo 7 × módulos filas sin importar cuántos
+-- registros tenga cada día.
+
+CREATE TABLE IF NOT EXISTS riegos_resumen_diario (
+    fecha DATE NOT NULL,
+    modulo TEXT NOT NULL,
+    n_agua INTEGER NOT NULL DEFAULT 0,
+    n_comida INTEGER NOT NULL DEFAULT 0,
+    n_ducha INTEGER NOT NULL DEFAULT 0,
+    n_goteo INTEGER NOT NULL DEFAULT 0,
+    minutos_ducha INTEGER NOT NULL DEFAULT 0,
+    minutos_goteo INTEGER NOT NULL DEFAULT 0,
+    minutos_total INTEGER NOT NULL DEFAULT 0,
+    n_registros INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (fecha, modulo)
+);
+
+ALTER TABLE riegos_resumen_diario ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Permitir lectura" ON riegos_resumen_diario;
+CREATE POLICY "Permitir lectura" ON riegos_resumen_diario
+    FOR SELECT
+    USING (true);
+
+-- Suma (signo = 1) o resta (signo = -1) los registros de una tabla de
+-- transición agrupados por día y módulo
+CREATE OR REPLACE FUNCTION riegos_resumen_aplicar(p_filas JSONB, p_signo INTEGER)
+RETURNS VOID
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+BEGIN
+    INSERT INTO riegos_resumen_diario AS r (
+        fecha, modulo, n_agua, n_comida, n_ducha, n_goteo,
+        minutos_ducha, minutos_goteo, minutos_total, n_registros
+    )
+    SELECT (f->>'fecha')::DATE,
+           f->>'modulo',
+           p_signo * COUNT(*) FILTER (WHERE f->>'tipo_riego' = 'agua'),
+           p_signo * COUNT(*) FILTER (WHERE f->>'tipo_riego' = 'comida'),
+           p_signo * COUNT(*) FILTER (WHERE f->>'sistema_riego' = 'ducha'),
+           p_signo * COUNT(*) FILTER (WHERE f->>'sistema_riego' = 'goteo'),
+           p_signo * COALESCE(SUM((f->>'tiempo_minutos')::INTEGER) FILTER (WHERE f->>'sistema_riego' = 'ducha'), 0),
+           p_signo * COALESCE(SUM((f->>'tiempo_minutos')::INTEGER) FILTER (WHERE f->>'sistema_riego' = 'goteo'), 0),
+           p_signo * COALESCE(SUM((f->>'tiempo_minutos')::INTEGER), 0),
+           p_signo * COUNT(*)
+    FROM jsonb_array_elements(p_filas) AS f
+    GROUP BY 1, 2
+    ON CONFLICT (fecha, modulo) DO UPDATE SET
+        n_agua = r.n_agua + EXCLUDED.n_agua,
+        n_comida = r.n_comida + EXCLUDED.n_comida,
+        n_ducha = r.n_ducha + EXCLUDED.n_ducha,
+        n_goteo = r.n_goteo + EXCLUDED.n_goteo,
+        minutos_ducha = r.minutos_ducha + EXCLUDED.minutos_ducha,
+        minutos_goteo = r.minutos_goteo + EXCLUDED.minutos_goteo,
+        minutos_total = r.minutos_total + EXCLUDED.minutos_total,
+        n_registros = r.n_registros + EXCLUDED.n_registros;
+
+    IF p_signo < 0 THEN
+        DELETE FROM riegos_resumen_diario AS r
+        USING (SELECT DISTINCT (f->>'fecha')::DATE AS fecha, f->>'modulo' AS modulo
+               FROM jsonb_array_elements(p_filas) AS f) AS tocadas
+        WHERE r.fecha = tocadas.fecha
+          AND r.modulo = tocadas.modulo
+          AND r.n_registros <= 0;
+    END IF;
+END;
+$$;
+
+-- Triggers por sentencia: un /registrar de 50 módulos o un borrado masivo
+-- ajusta el resumen con una sola pasada agrupada, no fila por fila
+CREATE OR REPLACE FUNCTION riegos_resumen_trigger()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM riegos_resumen_aplicar((SELECT COALESCE(jsonb_agg(to_jsonb(v)), '[]'::jsonb) FROM viejas v), -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM riegos_resumen_aplicar((SELECT COALESCE(jsonb_agg(to_jsonb(n)), '[]'::jsonb) FROM nuevas n), 1);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_riegos_resumen_insertar ON riegos;
+CREATE TRIGGER trg_riegos_resumen_insertar
+    AFTER INSERT ON riegos
+    REFERENCING NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION riegos_resumen_trigger();
+
+DROP TRIGGER IF EXISTS trg_riegos_resumen_actualizar ON riegos;
+CREATE TRIGGER trg_riegos_resumen_actualizar
+    AFTER UPDATE ON riegos
+    REFERENCING OLD TABLE AS viejas NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION riegos_resumen_trigger();
+
+DROP TRIGGER IF EXISTS trg_riegos_resumen_eliminar ON riegos;
+CREATE TRIGGER trg_riegos_resumen_eliminar
+    AFTER DELETE ON riegos
+    REFERENCING OLD TABLE AS viejas
+    FOR EACH STATEMENT EXECUTE FUNCTION riegos_resumen_trigger();
+
+-- Recalcula el resumen desde riegos (todo, o solo un rango de fechas).
+-- Es el relleno inicial del historial existente; también sirve para
+-- reparar el resumen si alguna vez se desincroniza. Lo llama
+-- `flask recalcular-resumen`.
+CREATE OR REPLACE FUNCTION recalcular_resumen_diario(p_desde DATE DEFAULT NULL, p_hasta DATE DEFAULT NULL)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    v_filas INTEGER;
+BEGIN
+    DELETE FROM riegos_resumen_diario
+    WHERE (p_desde IS NULL OR fecha >= p_desde)
+      AND (p_hasta IS NULL OR fecha <= p_hasta);
+
+    INSERT INTO riegos_resumen_diario (
+        fecha, modulo, n_agua, n_comida, n_ducha, n_goteo,
+        minutos_ducha, minutos_goteo, minutos_total, n_registros
+    )
+    SELECT fecha,
+           modulo,
+           COUNT(*) FILTER (WHERE tipo_riego = 'agua'),
+           COUNT(*) FILTER (WHERE tipo_riego = 'comida'),
+           COUNT(*) FILTER (WHERE sistema_riego = 'ducha'),
+           COUNT(*) FILTER (WHERE sistema_riego = 'goteo'),
+           COALESCE(SUM(tiempo_minutos) FILTER (WHERE sistema_riego = 'ducha'), 0),
+           COALESCE(SUM(tiempo_minutos) FILTER (WHERE sistema_riego = 'goteo'), 0),
+           COALESCE(SUM(tiempo_minutos), 0),
+           COUNT(*)
+    FROM riegos
+    WHERE (p_desde IS NULL OR fecha >= p_desde)
+      AND (p_hasta IS NULL OR fecha <= p_hasta)
+    GROUP BY fecha, modulo;
+
+    GET DIAGNOSTICS v_filas = ROW_COUNT;
+    RETURN v_filas;
+END;
+$$;
@@ -0,0 +1,189 @@
+-- Sincronización con los clientes de escritorio (riegos_app.py)
+-- Ejecutar en Supabase SQL Editor después de RESUMEN_DIARIO.sql (si se usa)
+--
+-- Cada fila lleva un uuid estable entre el servidor y los clientes, la marca de
+-- su última modificación (actualizado_en, decide los conflictos: gana la
+-- escritura más reciente) y una versión tomada de una secuencia en cada
+-- escritura. Los clientes piden "los cambios desde la versión N", así una
+-- sincronización después de semanas sin conexión cuesta unas pocas páginas.
+-- Los borrados dejan una lápida en riegos_borrados con su propia versión.
+
+CREATE SEQUENCE IF NOT EXISTS riegos_version_seq;
+
+ALTER TABLE riegos
+ADD COLUMN IF NOT EXISTS uuid UUID NOT NULL DEFAULT gen_random_uuid();
+
+ALTER TABLE riegos
+ADD COLUMN IF NOT EXISTS actualizado_en TIMESTAMPTZ NOT NULL DEFAULT NOW();
+
+ALTER TABLE riegos
+ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT nextval('riegos_version_seq');
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_riegos_uuid ON riegos(uuid);
+CREATE INDEX IF NOT EXISTS idx_riegos_version ON riegos(version);
+
+CREATE TABLE IF NOT EXISTS riegos_borrados (
+    uuid UUID PRIMARY KEY,
+    actualizado_en TIMESTAMPTZ NOT NULL,
+    version BIGINT NOT NULL DEFAULT nextval('riegos_version_seq')
+);
+
+CREATE INDEX IF NOT EXISTS idx_riegos_borrados_version ON riegos_borrados(version);
+
+ALTER TABLE riegos_borrados ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Permitir lectura" ON riegos_borrados;
+CREATE POLICY "Permitir lectura" ON riegos_borrados
+    FOR SELECT
+    USING (true);
+
+-- Toda edición toma una versión nueva; si no trae su propia marca de
+-- modificación (ediciones desde la web) se marca con la hora actual
+CREATE OR REPLACE FUNCTION riegos_sync_actualizar()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.version := nextval('riegos_version_seq');
+    IF NEW.actualizado_en IS NOT DISTINCT FROM OLD.actualizado_en THEN
+        NEW.actualizado_en := NOW();
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_riegos_sync_actualizar ON riegos;
+CREATE TRIGGER trg_riegos_sync_actualizar
+    BEFORE UPDATE ON riegos
+    FOR EACH ROW EXECUTE FUNCTION riegos_sync_actualizar();
+
+-- Lápidas por sentencia, como los triggers del resumen diario
+CREATE OR REPLACE FUNCTION riegos_sync_eliminar()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO riegos_borrados (uuid, actualizado_en)
+    SELECT uuid, NOW() FROM viejas
+    ON CONFLICT (uuid) DO UPDATE SET
+        actualizado_en = EXCLUDED.actualizado_en,
+        version = nextval('riegos_version_seq');
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_riegos_sync_eliminar ON riegos;
+CREATE TRIGGER trg_riegos_sync_eliminar
+    AFTER DELETE ON riegos
+    REFERENCING OLD TABLE AS viejas
+    FOR EACH STATEMENT EXECUTE FUNCTION riegos_sync_eliminar();
+
+-- Página de cambios (filas y lápidas) posteriores a p_version, en orden de versión
+CREATE OR REPLACE FUNCTION riegos_cambios_desde(p_version BIGINT, p_limite INTEGER DEFAULT 1000)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+AS $$
+    WITH cambios AS (
+        (SELECT r.version, to_jsonb(r) AS dato, FALSE AS borrado
+         FROM riegos r WHERE r.version > p_version ORDER BY r.version LIMIT p_limite)
+        UNION ALL
+        (SELECT b.version, to_jsonb(b), TRUE
+         FROM riegos_borrados b WHERE b.version > p_version ORDER BY b.version LIMIT p_limite)
+    ),
+    pagina AS (
+        SELECT * FROM cambios ORDER BY version LIMIT p_limite
+    )
+    SELECT jsonb_build_object(
+        'filas', COALESCE((SELECT jsonb_agg(dato ORDER BY version) FROM pagina WHERE NOT borrado), '[]'::jsonb),
+        'borrados', COALESCE((SELECT jsonb_agg(dato ORDER BY version) FROM pagina WHERE borrado), '[]'::jsonb),
+        'version', COALESCE((SELECT MAX(version) FROM pagina), p_version),
+        'mas', (SELECT COUNT(*) FROM pagina) = p_limite
+    );
+$$;
+
+-- Aplica en una transacción los cambios de un cliente. Un cambio se descarta
+-- si la fila vigente o su lápida tienen una marca igual o más reciente.
+-- Devuelve {eliminados, insertados}: una fila actualizada aparece en ambas
+-- listas, con sus valores anteriores y los nuevos.
+CREATE OR REPLACE FUNCTION riegos_aplicar_cambios(p_filas JSONB, p_borrados JSONB)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    v_anteriores JSONB;
+    v_nuevas JSONB;
+    v_eliminadas JSONB;
+BEGIN
+    WITH entrantes AS (
+        SELECT * FROM jsonb_populate_recordset(NULL::riegos, p_filas)
+    ),
+    ganadoras AS (
+        SELECT e.*
+        FROM entrantes e
+        LEFT JOIN riegos r ON r.uuid = e.uuid
+        LEFT JOIN riegos_borrados b ON b.uuid = e.uuid
+        WHERE e.actualizado_en > COALESCE(GREATEST(r.actualizado_en, b.actualizado_en), '-infinity')
+    ),
+    anteriores AS (
+        SELECT r.* FROM riegos r JOIN ganadoras g ON g.uuid = r.uuid
+    ),
+    actualizadas AS (
+        UPDATE riegos r SET
+            fecha = g.fecha,
+            modulo = g.modulo,
+            tipo_riego = g.tipo_riego,
+            sistema_riego = g.sistema_riego,
+            tiempo_minutos = g.tiempo_minutos,
+            "timestamp" = g."timestamp",
+            actualizado_en = g.actualizado_en
+        FROM ganadoras g
+        WHERE r.uuid = g.uuid
+        RETURNING r.*
+    ),
+    insertadas AS (
+        INSERT INTO riegos (uuid, fecha, modulo, tipo_riego, sistema_riego, tiempo_minutos, "timestamp", actualizado_en)
+        SELECT g.uuid, g.fecha, g.modulo, g.tipo_riego, g.sistema_riego, g.tiempo_minutos, g."timestamp", g.actualizado_en
+        FROM ganadoras g
+        WHERE NOT EXISTS (SELECT 1 FROM anteriores a WHERE a.uuid = g.uuid)
+        RETURNING *
+    ),
+    revividas AS (
+        DELETE FROM riegos_borrados b USING ganadoras g WHERE b.uuid = g.uuid
+    )
+    SELECT COALESCE((SELECT jsonb_agg(to_jsonb(a)) FROM anteriores a), '[]'::jsonb),
+           COALESCE((SELECT jsonb_agg(to_jsonb(n)) FROM (
+               SELECT * FROM actualizadas UNION ALL SELECT * FROM insertadas) n), '[]'::jsonb)
+    INTO v_anteriores, v_nuevas;
+
+    WITH borrables AS (
+        SELECT * FROM jsonb_populate_recordset(NULL::riegos_borrados, p_borrados)
+    ),
+    eliminadas AS (
+        DELETE FROM riegos r USING borrables b
+        WHERE r.uuid = b.uuid AND r.actualizado_en <= b.actualizado_en
+        RETURNING r.*
+    )
+    SELECT COALESCE(jsonb_agg(to_jsonb(e)), '[]'::jsonb) INTO v_eliminadas FROM eliminadas e;
+
+    -- El trigger dejó las lápidas con la hora del servidor; vale la del
+    -- cliente. Los borrados de filas que el servidor nunca vio también dejan
+    -- lápida, para que una copia vieja no las reviva después.
+    INSERT INTO riegos_borrados AS l (uuid, actualizado_en)
+    SELECT b.uuid, b.actualizado_en
+    FROM jsonb_populate_recordset(NULL::riegos_borrados, p_borrados) b
+    WHERE NOT EXISTS (SELECT 1 FROM riegos r WHERE r.uuid = b.uuid)
+    ON CONFLICT (uuid) DO UPDATE SET
+        actualizado_en = EXCLUDED.actualizado_en,
+        version = nextval('riegos_version_seq')
+    WHERE l.actualizado_en < EXCLUDED.actualizado_en
+       OR l.uuid IN (SELECT (e->>'uuid')::UUID FROM jsonb_array_elements(v_eliminadas) e);
+
+    RETURN jsonb_build_object(
+        'eliminados', v_anteriores || v_eliminadas,
+        'insertados', v_nuevas
+    );
+END;
+$$;
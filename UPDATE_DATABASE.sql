@@ -14,6 +14,9 @@ UPDATE riegos
 SET sistema_riego = 'N/A', tiempo_minutos = 0
 WHERE sistema_riego IS NULL OR tiempo_minutos IS NULL;
 
+-- Índice para la paginación por cursor del historial (timestamp, id)
+CREATE INDEX IF NOT EXISTS idx_riegos_timestamp_id ON riegos(timestamp DESC, id DESC);
+
 -- Ver estructura actualizada
 SELECT column_name, data_type, is_nullable
 FROM information_schema.columns
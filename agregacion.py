@@ -0,0 +1,144 @@
+"""Motor de resumen semanal compartido por /resumen-semanal y /exportar-excel.
+
+El resumen de una semana ISO se calcula una sola vez y queda en una caché LRU
+en memoria. Las escrituras invalidan únicamente la semana de las fechas que
+tocan, así que las recargas repetidas de resumen.html no van a la base.
+Cada semana guardada vence a los ttl segundos, para recoger lo que escriben
+otros workers o se cambia directo en Supabase.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, timedelta
+
+DIAS_ESPANOL = ('Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo')
+
+
+def rango_semana(year, week_num):
+    """Devuelve el lunes y el domingo de una semana ISO"""
+    inicio = date.fromisocalendar(year, week_num, 1)
+    return inicio, inicio + timedelta(days=6)
+
+
+def semana_de_fecha(fecha):
+    """Devuelve (año, semana) ISO de una fecha 'YYYY-MM-DD'"""
+    year, week_num, _ = date.fromisoformat(fecha[:10]).isocalendar()
+    return year, week_num
+
+
+class ResumenSemanal:
+    """Agrega los riegos por (fecha, módulo) con caché LRU por semana ISO"""
+
+    def __init__(self, repo, capacidad=52, diario=False, ttl=300):
+        self.repo = repo
+        self.capacidad = capacidad
+        self.ttl = ttl
+        # Con diario=True la semana se lee de riegos_resumen_diario (una fila
+        # por día y módulo) en lugar de recorrer cada registro
+        self.diario = diario
+        self._cache = OrderedDict()  # (año, semana) -> (filas, guardado_en)
+        self._generacion = {}
+        self._lock = threading.Lock()
+
+    def obtener(self, year, week_num, guardar=True):
+        """Devuelve las filas del resumen de la semana, ordenadas por fecha y módulo.
+
+        Con guardar=False se aprovecha la caché pero no se llena, para que un
+        recorrido largo (exportar una temporada) no desplace las semanas que
+        la gente consulta a diario.
+        """
+        clave = (year, week_num)
+        with self._lock:
+            entrada = self._cache.get(clave)
+            if entrada is not None:
+                if time.monotonic() - entrada[1] <= self.ttl:
+                    self._cache.move_to_end(clave)
+                    return entrada[0]
+                del self._cache[clave]
+            generacion = self._generacion.get(clave, 0)
+
+        datos = self._calcular(year, week_num)
+
+        with self._lock:
+            # Si una escritura invalidó la semana mientras consultábamos, el
+            # resultado puede estar desactualizado: lo servimos sin guardarlo
+            if guardar and self._generacion.get(clave, 0) == generacion:
+                self._cache[clave] = (datos, time.monotonic())
+                self._cache.move_to_end(clave)
+                while len(self._cache) > self.capacidad:
+                    self._cache.popitem(last=False)
+        return datos
+
+    def invalidar_fecha(self, fecha):
+        """Descarta la semana que contiene la fecha"""
+        clave = semana_de_fecha(fecha)
+        with self._lock:
+            self._cache.pop(clave, None)
+            self._generacion[clave] = self._generacion.get(clave, 0) + 1
+
+    def invalidar_filas(self, filas):
+        """Descarta las semanas afectadas por un lote de filas escritas"""
+        for fecha in {fila['fecha'] for fila in filas if fila.get('fecha')}:
+            self.invalidar_fecha(fecha)
+
+    @staticmethod
+    def _etiquetas(inicio):
+        # Las etiquetas de los 7 días se arman una vez por semana, no por fila
+        etiquetas = {}
+        for i in range(7):
+            dia = inicio + timedelta(days=i)
+            etiquetas[dia.isoformat()] = f"{DIAS_ESPANOL[i]} {dia.strftime('%d/%m')}"
+        return etiquetas
+
+    def _calcular(self, year, week_num):
+        if self.diario:
+            return self._calcular_diario(year, week_num)
+
+        inicio, fin = rango_semana(year, week_num)
+        registros = self.repo.seleccionar(
+            'fecha,modulo,tipo_riego',
+            filtros=[('gte', 'fecha', inicio.isoformat()), ('lte', 'fecha', fin.isoformat())]
+        )
+
+        etiquetas = self._etiquetas(inicio)
+        semana = f"{year}{week_num:02d}"
+
+        resumen = {}
+        for reg in registros:
+            fecha = reg['fecha'][:10]
+            key = (fecha, reg['modulo'])
+            item = resumen.get(key)
+            if item is None:
+                item = resumen[key] = {
+                    'fecha': fecha,
+                    'dia': etiquetas.get(fecha, fecha),
+                    'modulo': reg['modulo'],
+                    'agua': False,
+                    'comida': False,
+                    'semana': semana
+                }
+            tipo = reg['tipo_riego']
+            if tipo == 'agua':
+                item['agua'] = True
+            elif tipo == 'comida':
+                item['comida'] = True
+
+        return [resumen[key] for key in sorted(resumen)]
+
+    def _calcular_diario(self, year, week_num):
+        inicio, fin = rango_semana(year, week_num)
+        filas = self.repo.resumen_diario(
+            inicio.isoformat(), fin.isoformat(), 'fecha,modulo,n_agua,n_comida')
+
+        etiquetas = self._etiquetas(inicio)
+        semana = f"{year}{week_num:02d}"
+        resumen = [{
+            'fecha': fila['fecha'][:10],
+            'dia': etiquetas.get(fila['fecha'][:10], fila['fecha'][:10]),
+            'modulo': fila['modulo'],
+            'agua': fila['n_agua'] > 0,
+            'comida': fila['n_comida'] > 0,
+            'semana': semana
+        } for fila in filas if fila['n_agua'] > 0 or fila['n_comida'] > 0]
+        resumen.sort(key=lambda item: (item['fecha'], item['modulo']))
+        return resumen
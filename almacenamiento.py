@@ -0,0 +1,820 @@
+"""Capa de almacenamiento de riegos.
+
+Todas las rutas de app.py hablan con un repositorio que expone las mismas
+operaciones por lotes (insertar, seleccionar, actualizar, eliminar, contar)
+sin importar dónde vivan los datos: Supabase en producción, o SQLite local
+(archivo en modo WAL o en memoria) para pruebas de carga y perfilado.
+
+Los filtros se expresan como tuplas ``(operador, columna, valor)`` con los
+operadores de PostgREST: ``eq``, ``neq``, ``gt``, ``gte``, ``lt``, ``lte`` e
+``in``. El orden es una lista de ``(columna, descendente)``.
+
+Cada repositorio ve los datos de una sola finca: en SQLite cada finca tiene su
+propio archivo y en Supabase el repositorio filtra la columna finca_id
+(FINCAS.sql) en todas las operaciones.
+"""
+import os
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager, nullcontext
+
+from sincronizacion import normalizar_instante
+
+OPERADORES = {
+    'eq': '=',
+    'neq': '!=',
+    'gt': '>',
+    'gte': '>=',
+    'lt': '<',
+    'lte': '<=',
+}
+
+COLUMNAS_RIEGOS = ('id', 'fecha', 'modulo', 'tipo_riego', 'sistema_riego',
+                   'tiempo_minutos', 'timestamp', 'uuid', 'actualizado_en', 'version')
+
+# Columnas que se intercambian con los clientes de escritorio (ver sincronizacion.py)
+COLUMNAS_SINCRONIZADAS = ('uuid', 'fecha', 'modulo', 'tipo_riego', 'sistema_riego',
+                          'tiempo_minutos', 'timestamp', 'actualizado_en')
+
+# Instante UTC con milisegundos, el mismo formato que normalizar_instante()
+AHORA_SQLITE = "strftime('%Y-%m-%dT%H:%M:%fZ', 'now')"
+UUID_SQLITE = ("(SELECT lower(substr(h, 1, 8) || '-' || substr(h, 9, 4) || '-' || substr(h, 13, 4)"
+               " || '-' || substr(h, 17, 4) || '-' || substr(h, 21)) FROM (SELECT hex(randomblob(16)) AS h))")
+
+
+
+def _timestamp_utc(valor):
+    """timestamp en UTC con el formato de instante_utc ('...T15:00:00.000Z').
+
+    SQLite guarda timestamp como texto y lo ordena como texto, así que todas las
+    filas deben usar la misma zona; si el valor no se entiende se deja como está.
+    """
+    if not valor:
+        return valor
+    try:
+        return normalizar_instante(valor)
+    except ValueError:
+        return valor
+
+
+ESQUEMA_SQLITE = '''
+    CREATE TABLE IF NOT EXISTS riegos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        fecha TEXT NOT NULL,
+        modulo TEXT NOT NULL,
+        tipo_riego TEXT NOT NULL,
+        sistema_riego TEXT,
+        tiempo_minutos INTEGER,
+        timestamp TEXT,
+        uuid TEXT,
+        actualizado_en TEXT,
+        version INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS idx_riegos_fecha ON riegos(fecha);
+    CREATE INDEX IF NOT EXISTS idx_riegos_timestamp ON riegos(timestamp);
+    CREATE INDEX IF NOT EXISTS idx_riegos_timestamp_id ON riegos(timestamp DESC, id DESC);
+
+    CREATE TABLE IF NOT EXISTS riegos_resumen_diario (
+        fecha TEXT NOT NULL,
+        modulo TEXT NOT NULL,
+        n_agua INTEGER NOT NULL DEFAULT 0,
+        n_comida INTEGER NOT NULL DEFAULT 0,
+        n_ducha INTEGER NOT NULL DEFAULT 0,
+        n_goteo INTEGER NOT NULL DEFAULT 0,
+        minutos_ducha INTEGER NOT NULL DEFAULT 0,
+        minutos_goteo INTEGER NOT NULL DEFAULT 0,
+        minutos_total INTEGER NOT NULL DEFAULT 0,
+        n_registros INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (fecha, modulo)
+    );
+
+    CREATE TRIGGER IF NOT EXISTS trg_riegos_resumen_insertar AFTER INSERT ON riegos BEGIN
+        INSERT INTO riegos_resumen_diario VALUES (
+            substr(NEW.fecha, 1, 10), NEW.modulo,
+            NEW.tipo_riego IS 'agua', NEW.tipo_riego IS 'comida',
+            NEW.sistema_riego IS 'ducha', NEW.sistema_riego IS 'goteo',
+            IIF(NEW.sistema_riego IS 'ducha', COALESCE(NEW.tiempo_minutos, 0), 0),
+            IIF(NEW.sistema_riego IS 'goteo', COALESCE(NEW.tiempo_minutos, 0), 0),
+            COALESCE(NEW.tiempo_minutos, 0), 1)
+        ON CONFLICT (fecha, modulo) DO UPDATE SET
+            n_agua = n_agua + excluded.n_agua,
+            n_comida = n_comida + excluded.n_comida,
+            n_ducha = n_ducha + excluded.n_ducha,
+            n_goteo = n_goteo + excluded.n_goteo,
+            minutos_ducha = minutos_ducha + excluded.minutos_ducha,
+            minutos_goteo = minutos_goteo + excluded.minutos_goteo,
+            minutos_total = minutos_total + excluded.minutos_total,
+            n_registros = n_registros + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_riegos_resumen_eliminar AFTER DELETE ON riegos BEGIN
+        UPDATE riegos_resumen_diario SET
+            n_agua = n_agua - (OLD.tipo_riego IS 'agua'),
+            n_comida = n_comida - (OLD.tipo_riego IS 'comida'),
+            n_ducha = n_ducha - (OLD.sistema_riego IS 'ducha'),
+            n_goteo = n_goteo - (OLD.sistema_riego IS 'goteo'),
+            minutos_ducha = minutos_ducha - IIF(OLD.sistema_riego IS 'ducha', COALESCE(OLD.tiempo_minutos, 0), 0),
+            minutos_goteo = minutos_goteo - IIF(OLD.sistema_riego IS 'goteo', COALESCE(OLD.tiempo_minutos, 0), 0),
+            minutos_total = minutos_total - COALESCE(OLD.tiempo_minutos, 0),
+            n_registros = n_registros - 1
+        WHERE fecha = substr(OLD.fecha, 1, 10) AND modulo = OLD.modulo;
+        DELETE FROM riegos_resumen_diario
+        WHERE fecha = substr(OLD.fecha, 1, 10) AND modulo = OLD.modulo AND n_registros <= 0;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_riegos_resumen_actualizar
+    AFTER UPDATE OF fecha, modulo, tipo_riego, sistema_riego, tiempo_minutos ON riegos BEGIN
+        UPDATE riegos_resumen_diario SET
+            n_agua = n_agua - (OLD.tipo_riego IS 'agua'),
+            n_comida = n_comida - (OLD.tipo_riego IS 'comida'),
+            n_ducha = n_ducha - (OLD.sistema_riego IS 'ducha'),
+            n_goteo = n_goteo - (OLD.sistema_riego IS 'goteo'),
+            minutos_ducha = minutos_ducha - IIF(OLD.sistema_riego IS 'ducha', COALESCE(OLD.tiempo_minutos, 0), 0),
+            minutos_goteo = minutos_goteo - IIF(OLD.sistema_riego IS 'goteo', COALESCE(OLD.tiempo_minutos, 0), 0),
+            minutos_total = minutos_total - COALESCE(OLD.tiempo_minutos, 0),
+            n_registros = n_registros - 1
+        WHERE fecha = substr(OLD.fecha, 1, 10) AND modulo = OLD.modulo;
+        DELETE FROM riegos_resumen_diario
+        WHERE fecha = substr(OLD.fecha, 1, 10) AND modulo = OLD.modulo AND n_registros <= 0;
+        INSERT INTO riegos_resumen_diario VALUES (
+            substr(NEW.fecha, 1, 10), NEW.modulo,
+            NEW.tipo_riego IS 'agua', NEW.tipo_riego IS 'comida',
+            NEW.sistema_riego IS 'ducha', NEW.sistema_riego IS 'goteo',
+            IIF(NEW.sistema_riego IS 'ducha', COALESCE(NEW.tiempo_minutos, 0), 0),
+            IIF(NEW.sistema_riego IS 'goteo', COALESCE(NEW.tiempo_minutos, 0), 0),
+            COALESCE(NEW.tiempo_minutos, 0), 1)
+        ON CONFLICT (fecha, modulo) DO UPDATE SET
+            n_agua = n_agua + excluded.n_agua,
+            n_comida = n_comida + excluded.n_comida,
+            n_ducha = n_ducha + excluded.n_ducha,
+            n_goteo = n_goteo + excluded.n_goteo,
+            minutos_ducha = minutos_ducha + excluded.minutos_ducha,
+            minutos_goteo = minutos_goteo + excluded.minutos_goteo,
+            minutos_total = minutos_total + excluded.minutos_total,
+            n_registros = n_registros + 1;
+    END;
+
+    -- Sincronización: cada fila lleva un uuid estable, la marca de su última
+    -- modificación (actualizado_en, decide los conflictos) y una versión del
+    -- servidor que crece con cada escritura (los clientes piden "desde la versión N").
+    -- Los borrados dejan una lápida con su propia versión.
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_riegos_uuid ON riegos(uuid);
+    CREATE INDEX IF NOT EXISTS idx_riegos_version ON riegos(version);
+
+    CREATE TABLE IF NOT EXISTS riegos_borrados (
+        uuid TEXT PRIMARY KEY,
+        actualizado_en TEXT NOT NULL,
+        version INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_riegos_borrados_version ON riegos_borrados(version);
+
+    CREATE TABLE IF NOT EXISTS riegos_version (valor INTEGER NOT NULL);
+    INSERT INTO riegos_version SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM riegos_version);
+
+    CREATE TRIGGER IF NOT EXISTS trg_riegos_sync_insertar AFTER INSERT ON riegos BEGIN
+        UPDATE riegos_version SET valor = valor + 1;
+        UPDATE riegos SET
+            uuid = COALESCE(NEW.uuid, {uuid}),
+            actualizado_en = COALESCE(NEW.actualizado_en, {ahora}),
+            version = (SELECT valor FROM riegos_version)
+        WHERE id = NEW.id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_riegos_sync_actualizar
+    AFTER UPDATE OF fecha, modulo, tipo_riego, sistema_riego, tiempo_minutos, timestamp ON riegos BEGIN
+        UPDATE riegos_version SET valor = valor + 1;
+        UPDATE riegos SET
+            version = (SELECT valor FROM riegos_version),
+            actualizado_en = IIF(NEW.actualizado_en IS OLD.actualizado_en, {ahora}, NEW.actualizado_en)
+        WHERE id = NEW.id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_riegos_sync_eliminar AFTER DELETE ON riegos
+    WHEN OLD.uuid IS NOT NULL BEGIN
+        UPDATE riegos_version SET valor = valor + 1;
+        INSERT INTO riegos_borrados (uuid, actualizado_en, version)
+        VALUES (OLD.uuid, {ahora}, (SELECT valor FROM riegos_version))
+        ON CONFLICT (uuid) DO UPDATE SET
+            actualizado_en = excluded.actualizado_en,
+            version = excluded.version;
+    END;
+'''.replace('{uuid}', UUID_SQLITE).replace('{ahora}', AHORA_SQLITE)
+
+COLUMNAS_RESUMEN_DIARIO = ('fecha', 'modulo', 'n_agua', 'n_comida', 'n_ducha', 'n_goteo',
+                           'minutos_ducha', 'minutos_goteo', 'minutos_total', 'n_registros')
+
+RECALCULAR_RESUMEN_SQLITE = '''
+    INSERT INTO riegos_resumen_diario
+    SELECT substr(fecha, 1, 10), modulo,
+           SUM(tipo_riego IS 'agua'), SUM(tipo_riego IS 'comida'),
+           SUM(sistema_riego IS 'ducha'), SUM(sistema_riego IS 'goteo'),
+           SUM(IIF(sistema_riego IS 'ducha', COALESCE(tiempo_minutos, 0), 0)),
+           SUM(IIF(sistema_riego IS 'goteo', COALESCE(tiempo_minutos, 0), 0)),
+           SUM(COALESCE(tiempo_minutos, 0)), COUNT(*)
+    FROM riegos{where}
+    GROUP BY substr(fecha, 1, 10), modulo
+'''
+
+
+class RepositorioRiegos:
+    """Interfaz común de los backends de almacenamiento"""
+
+    nombre = 'base'
+
+    def insertar(self, registros, ignorar_duplicados=False):
+        """Inserta una lista de registros y devuelve las filas creadas.
+
+        Con ignorar_duplicados, los registros cuyo uuid ya existe se omiten en
+        vez de fallar y no aparecen en el resultado.
+        """
+        raise NotImplementedError
+
+    def seleccionar(self, columnas='*', filtros=(), orden=(), limite=None):
+        """Devuelve las filas que cumplen los filtros"""
+        raise NotImplementedError
+
+    def actualizar(self, valores, filtros):
+        """Actualiza las filas que cumplen los filtros y las devuelve"""
+        raise NotImplementedError
+
+    def eliminar(self, filtros):
+        """Elimina las filas que cumplen los filtros y las devuelve"""
+        raise NotImplementedError
+
+    def contar(self, filtros=()):
+        """Cuenta las filas que cumplen los filtros"""
+        raise NotImplementedError
+
+    def reemplazar_modulo_dia(self, fecha, modulo, registros):
+        """Reemplaza de forma atómica los registros de un módulo en una fecha.
+
+        Los registros nuevos sin sistema_riego o tiempo_minutos heredan los
+        de los registros reemplazados. Devuelve (eliminados, insertados).
+        """
+        raise NotImplementedError
+
+    def resumen_diario(self, desde, hasta, columnas='*', limite=None, modulos=None):
+        """Filas de riegos_resumen_diario entre dos fechas 'YYYY-MM-DD' (inclusive),
+        opcionalmente solo de una lista de módulos"""
+        raise NotImplementedError
+
+    def recalcular_resumen_diario(self, desde=None, hasta=None):
+        """Reconstruye el resumen diario desde riegos; devuelve cuántas filas quedaron"""
+        raise NotImplementedError
+
+    def cambios_desde(self, version, limite=1000):
+        """Filas y lápidas con versión mayor que version, en orden de versión.
+
+        Devuelve {'filas', 'borrados', 'version', 'mas'}: version es la última
+        entregada (el cursor de la próxima llamada) y mas indica si la página
+        se llenó.
+        """
+        raise NotImplementedError
+
+    def aplicar_cambios(self, filas, borrados):
+        """Aplica filas y borrados de un cliente con "gana la última escritura".
+
+        Cada cambio se compara por actualizado_en con la fila vigente o su
+        lápida y se descarta si es más viejo. Devuelve (eliminados, insertados)
+        como reemplazar_modulo_dia: una fila actualizada aparece en ambas listas,
+        con sus valores anteriores y los nuevos.
+        """
+        raise NotImplementedError
+
+    def paginar(self, columnas, cursor=None, limite=100, filtros=()):
+        """Devuelve una página ordenada por (timestamp, id) descendente.
+
+        cursor es el par (timestamp, id) de la última fila ya entregada; la
+        página empieza justo después, así el costo no depende de cuántas
+        páginas se hayan recorrido.
+        """
+        raise NotImplementedError
+
+
+def _validar_filtros(filtros, operacion):
+    # PostgREST rechaza UPDATE/DELETE sin filtro; replicamos esa protección
+    if not filtros:
+        raise ValueError(f'{operacion} requiere al menos un filtro')
+
+
+class RepositorioSupabase(RepositorioRiegos):
+    """Backend sobre la tabla riegos de Supabase (PostgREST).
+
+    Con finca_id todas las lecturas y escrituras quedan acotadas a esa finca;
+    sin él se usa la tabla entera, como antes de FINCAS.sql.
+    """
+
+    nombre = 'supabase'
+
+    def __init__(self, cliente, tabla='riegos', finca_id=None):
+        self.cliente = cliente
+        self.tabla = tabla
+        self.finca_id = finca_id
+
+    def _tabla(self):
+        return self.cliente.table(self.tabla)
+
+    def _aplicar_filtros(self, query, filtros):
+        if self.finca_id is not None:
+            query = query.eq('finca_id', self.finca_id)
+        for operador, columna, valor in filtros:
+            if operador == 'in':
+                query = query.in_(columna, list(valor))
+            else:
+                query = getattr(query, operador)(columna, valor)
+        return query
+
+    def _rpc(self, funcion, argumentos):
+        # Las funciones de FINCAS.sql reciben la finca; sin ella usan la finca por defecto
+        if self.finca_id is not None:
+            argumentos = dict(argumentos, p_finca_id=self.finca_id)
+        return self.cliente.rpc(funcion, argumentos).execute()
+
+    def insertar(self, registros, ignorar_duplicados=False):
+        if not registros:
+            return []
+        registros = list(registros)
+        if self.finca_id is not None:
+            registros = [dict(r, finca_id=self.finca_id) for r in registros]
+        if ignorar_duplicados:
+            # Con ignore-duplicates PostgREST devuelve solo las filas nuevas
+            response = self._tabla().upsert(registros, on_conflict='uuid', ignore_duplicates=True).execute()
+        else:
+            response = self._tabla().insert(registros).execute()
+        return response.data
+
+    def seleccionar(self, columnas='*', filtros=(), orden=(), limite=None):
+        query = self._aplicar_filtros(self._tabla().select(columnas), filtros)
+        for columna, descendente in orden:
+            query = query.order(columna, desc=descendente)
+        if limite is not None:
+            query = query.limit(limite)
+        return query.execute().data
+
+    def actualizar(self, valores, filtros):
+        _validar_filtros(filtros, 'actualizar')
+        query = self._aplicar_filtros(self._tabla().update(valores), filtros)
+        return query.execute().data
+
+    def eliminar(self, filtros):
+        _validar_filtros(filtros, 'eliminar')
+        query = self._aplicar_filtros(self._tabla().delete(), filtros)
+        return query.execute().data
+
+    def contar(self, filtros=()):
+        # Solo pedimos el conteo; limit(1) evita transferir la tabla entera
+        query = self._aplicar_filtros(
+            self._tabla().select('id', count='exact'), filtros)
+        response = query.limit(1).execute()
+        return response.count or 0
+
+    def reemplazar_modulo_dia(self, fecha, modulo, registros):
+        # Función definida en FUNCIONES_DATABASE.sql: corre en una transacción
+        response = self._rpc('reemplazar_modulo_dia', {
+            'p_fecha': fecha,
+            'p_modulo': modulo,
+            'p_registros': list(registros)
+        })
+        return response.data['eliminados'], response.data['insertados']
+
+    def resumen_diario(self, desde, hasta, columnas='*', limite=None, modulos=None):
+        # Tabla mantenida por los triggers de RESUMEN_DIARIO.sql
+        query = (self.cliente.table('riegos_resumen_diario').select(columnas)
+                 .gte('fecha', desde).lte('fecha', hasta))
+        if self.finca_id is not None:
+            query = query.eq('finca_id', self.finca_id)
+        if modulos is not None:
+            query = query.in_('modulo', list(modulos))
+        query = query.order('fecha').order('modulo')
+        if limite is not None:
+            query = query.limit(limite)
+        return query.execute().data
+
+    def recalcular_resumen_diario(self, desde=None, hasta=None):
+        response = self._rpc('recalcular_resumen_diario', {
+            'p_desde': desde,
+            'p_hasta': hasta
+        })
+        return response.data
+
+    def cambios_desde(self, version, limite=1000):
+        # Funciones definidas en SINCRONIZACION.sql
+        response = self._rpc('riegos_cambios_desde', {
+            'p_version': version,
+            'p_limite': limite
+        })
+        return response.data
+
+    def aplicar_cambios(self, filas, borrados):
+        response = self._rpc('riegos_aplicar_cambios', {
+            'p_filas': list(filas),
+            'p_borrados': list(borrados)
+        })
+        return response.data['eliminados'], response.data['insertados']
+
+    def paginar(self, columnas, cursor=None, limite=100, filtros=()):
+        query = self._aplicar_filtros(self._tabla().select(columnas), filtros)
+        if cursor:
+            timestamp, id_ = cursor
+            query = query.or_(
+                f'timestamp.lt."{timestamp}",'
+                f'and(timestamp.eq."{timestamp}",id.lt.{int(id_)})'
+            )
+        query = query.order('timestamp', desc=True).order('id', desc=True)
+        return query.limit(limite).execute().data
+
+
+class RepositorioSQLite(RepositorioRiegos):
+    """Backend local sobre SQLite (archivo en modo WAL o ':memory:')"""
+
+    nombre = 'sqlite'
+
+    def __init__(self, ruta=':memory:'):
+        self.ruta = ruta
+        self.en_memoria = ruta == ':memory:'
+        self._local = threading.local()
+        if self.en_memoria:
+            # Una base en memoria solo existe dentro de su conexión, así que
+            # todos los hilos comparten una y se serializan con un lock
+            self._compartida = self._conectar()
+            self._lock = threading.Lock()
+        with self._bloqueo():
+            conn = self._conexion()
+            resumen_nuevo = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'riegos_resumen_diario'").fetchone() is None
+            sin_uuid = self._migrar_sincronizacion(conn)
+            self._normalizar_timestamps(conn)
+            conn.executescript(ESQUEMA_SQLITE)
+            if sin_uuid:
+                self._rellenar_sincronizacion(conn)
+        # Una base creada antes de existir el resumen diario se rellena al abrirla
+        if resumen_nuevo and self.contar():
+            self.recalcular_resumen_diario()
+
+    @staticmethod
+    def _migrar_sincronizacion(conn):
+        """Prepara una base anterior a la sincronización; devuelve si hay que rellenarla"""
+        columnas = {fila[1] for fila in conn.execute('PRAGMA table_info(riegos)')}
+        if not columnas or 'uuid' in columnas:
+            return False
+        for columna in ('uuid TEXT', 'actualizado_en TEXT', 'version INTEGER'):
+            conn.execute(f'ALTER TABLE riegos ADD COLUMN {columna}')
+        # El trigger del resumen antes saltaba con cualquier UPDATE; ahora solo
+        # con las columnas que suma, para que marcar versiones no lo dispare
+        conn.execute('DROP TRIGGER IF EXISTS trg_riegos_resumen_actualizar')
+        return True
+
+    @staticmethod
+    def _normalizar_timestamps(conn):
+        """Lleva a UTC los timestamp guardados con zona -05:00 (antes de unificar el formato)"""
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'riegos'").fetchone() is None:
+            return
+        if conn.execute("""SELECT 1 FROM riegos WHERE "timestamp" NOT LIKE '%Z' LIMIT 1""").fetchone() is None:
+            return
+        # Es el mismo instante: sin el trigger de sincronización no cambian
+        # actualizado_en ni la versión (ESQUEMA_SQLITE lo vuelve a crear)
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute('DROP TRIGGER IF EXISTS trg_riegos_sync_actualizar')
+        conn.execute('''
+            UPDATE riegos SET "timestamp" = strftime('%Y-%m-%dT%H:%M:%fZ', "timestamp")
+            WHERE "timestamp" NOT LIKE '%Z'
+              AND strftime('%Y-%m-%dT%H:%M:%fZ', "timestamp") IS NOT NULL''')
+        conn.execute('COMMIT')
+
+    @staticmethod
+    def _rellenar_sincronizacion(conn):
+        conn.execute('BEGIN IMMEDIATE')
+        # Un uuid por fila: la subconsulta de UUID_SQLITE se evaluaría una sola vez
+        ids = [fila[0] for fila in conn.execute('SELECT id FROM riegos WHERE uuid IS NULL')]
+        conn.executemany('UPDATE riegos SET uuid = ? WHERE id = ?',
+                         [(str(uuid.uuid4()), id_) for id_ in ids])
+        conn.execute(f'''
+            UPDATE riegos SET
+                actualizado_en = COALESCE(
+                    strftime('%Y-%m-%dT%H:%M:%fZ', "timestamp"), {AHORA_SQLITE}),
+                version = id
+            WHERE actualizado_en IS NULL''')
+        conn.execute('UPDATE riegos_version SET valor = MAX(valor, (SELECT COALESCE(MAX(version), 0) FROM riegos))')
+        conn.execute('COMMIT')
+
+    def _conectar(self):
+        conn = sqlite3.connect(self.ruta, check_same_thread=False,
+                               isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        if not self.en_memoria:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=5000')
+        return conn
+
+    def _conexion(self):
+        if self.en_memoria:
+            return self._compartida
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._conectar()
+        return conn
+
+    def _bloqueo(self):
+        return self._lock if self.en_memoria else nullcontext()
+
+    @staticmethod
+    def _columnas(columnas):
+        if columnas == '*':
+            return '*'
+        nombres = [c.strip() for c in columnas.split(',') if c.strip()]
+        for nombre in nombres:
+            if nombre not in COLUMNAS_RIEGOS:
+                raise ValueError(f'Columna desconocida: {nombre}')
+        return ', '.join(f'"{c}"' for c in nombres)
+
+    @staticmethod
+    def _where(filtros):
+        condiciones = []
+        parametros = []
+        for operador, columna, valor in filtros:
+            if columna not in COLUMNAS_RIEGOS:
+                raise ValueError(f'Columna desconocida: {columna}')
+            if operador == 'in':
+                valores = list(valor)
+                if not valores:
+                    condiciones.append('0')
+                    continue
+                marcadores = ', '.join('?' * len(valores))
+                condiciones.append(f'"{columna}" IN ({marcadores})')
+                parametros.extend(valores)
+            elif operador in OPERADORES:
+                condiciones.append(f'"{columna}" {OPERADORES[operador]} ?')
+                parametros.append(valor)
+            else:
+                raise ValueError(f'Operador no soportado: {operador}')
+        where = f" WHERE {' AND '.join(condiciones)}" if condiciones else ''
+        return where, parametros
+
+    def _ejecutar(self, sql, parametros=()):
+        with self._bloqueo():
+            cursor = self._conexion().execute(sql, parametros)
+            return [dict(fila) for fila in cursor.fetchall()]
+
+    @contextmanager
+    def _transaccion(self):
+        with self._bloqueo():
+            conn = self._conexion()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+    @staticmethod
+    def _insertar_en(conn, registros):
+        columnas = [c for c in COLUMNAS_RIEGOS if c != 'id' and c in registros[0]]
+        lista = ', '.join(f'"{c}"' for c in columnas)
+        marcadores = ', '.join('?' * len(columnas))
+        filas = [tuple(_timestamp_utc(r.get(c)) if c == 'timestamp' else r.get(c) for c in columnas)
+                 for r in registros]
+        # executemany no admite RETURNING: recuperamos los ids por rango, que
+        # son consecutivos porque la transacción tiene el lock de escritura
+        conn.executemany(f'INSERT INTO riegos ({lista}) VALUES ({marcadores})', filas)
+        ultimo = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+        cursor = conn.execute(
+            'SELECT * FROM riegos WHERE id > ? AND id <= ? ORDER BY id',
+            (ultimo - len(filas), ultimo))
+        return [dict(fila) for fila in cursor.fetchall()]
+
+    def insertar(self, registros, ignorar_duplicados=False):
+        registros = list(registros)
+        if not registros:
+            return []
+        with self._transaccion() as conn:
+            if ignorar_duplicados:
+                # Se filtran antes de insertar (y no con ON CONFLICT DO NOTHING)
+                # porque _insertar_en recupera las filas por rango de ids
+                uuids = [r['uuid'] for r in registros if r.get('uuid')]
+                vistos = set()
+                for i in range(0, len(uuids), 500):
+                    parte = uuids[i:i + 500]
+                    vistos.update(fila[0] for fila in conn.execute(
+                        f'SELECT uuid FROM riegos WHERE uuid IN ({", ".join("?" * len(parte))})', parte))
+                nuevos = []
+                for registro in registros:
+                    if registro.get('uuid'):
+                        if registro['uuid'] in vistos:
+                            continue
+                        vistos.add(registro['uuid'])
+                    nuevos.append(registro)
+                registros = nuevos
+                if not registros:
+                    return []
+            return self._insertar_en(conn, registros)
+
+    def seleccionar(self, columnas='*', filtros=(), orden=(), limite=None):
+        where, parametros = self._where(filtros)
+        sql = f'SELECT {self._columnas(columnas)} FROM riegos{where}'
+        if orden:
+            for columna, _ in orden:
+                if columna not in COLUMNAS_RIEGOS:
+                    raise ValueError(f'Columna desconocida: {columna}')
+            sql += ' ORDER BY ' + ', '.join(
+                f'"{c}" {"DESC" if desc else "ASC"}' for c, desc in orden)
+        if limite is not None:
+            sql += ' LIMIT ?'
+            parametros.append(int(limite))
+        return self._ejecutar(sql, parametros)
+
+    def actualizar(self, valores, filtros):
+        _validar_filtros(filtros, 'actualizar')
+        for columna in valores:
+            if columna not in COLUMNAS_RIEGOS or columna == 'id':
+                raise ValueError(f'Columna no actualizable: {columna}')
+        if 'timestamp' in valores:
+            valores = dict(valores, timestamp=_timestamp_utc(valores['timestamp']))
+        where, parametros = self._where(filtros)
+        asignaciones = ', '.join(f'"{c}" = ?' for c in valores)
+        return self._ejecutar(
+            f'UPDATE riegos SET {asignaciones}{where} RETURNING *',
+            list(valores.values()) + parametros)
+
+    def eliminar(self, filtros):
+        _validar_filtros(filtros, 'eliminar')
+        where, parametros = self._where(filtros)
+        return self._ejecutar(f'DELETE FROM riegos{where} RETURNING *', parametros)
+
+    def contar(self, filtros=()):
+        where, parametros = self._where(filtros)
+        with self._bloqueo():
+            cursor = self._conexion().execute(
+                f'SELECT COUNT(*) FROM riegos{where}', parametros)
+            return cursor.fetchone()[0]
+
+    def paginar(self, columnas, cursor=None, limite=100, filtros=()):
+        where, parametros = self._where(filtros)
+        if cursor:
+            timestamp, id_ = cursor
+            where += ' AND ' if where else ' WHERE '
+            where += '("timestamp" < ? OR ("timestamp" = ? AND id < ?))'
+            parametros.extend([timestamp, timestamp, int(id_)])
+        sql = (f'SELECT {self._columnas(columnas)} FROM riegos{where} '
+               'ORDER BY "timestamp" DESC, id DESC LIMIT ?')
+        parametros.append(int(limite))
+        return self._ejecutar(sql, parametros)
+
+    def resumen_diario(self, desde, hasta, columnas='*', limite=None, modulos=None):
+        if columnas != '*':
+            nombres = [c.strip() for c in columnas.split(',') if c.strip()]
+            for nombre in nombres:
+                if nombre not in COLUMNAS_RESUMEN_DIARIO:
+                    raise ValueError(f'Columna desconocida: {nombre}')
+            columnas = ', '.join(f'"{c}"' for c in nombres)
+        sql = f'SELECT {columnas} FROM riegos_resumen_diario WHERE fecha >= ? AND fecha <= ?'
+        parametros = [desde, hasta]
+        if modulos is not None:
+            modulos = list(modulos)
+            sql += f' AND modulo IN ({", ".join("?" * len(modulos))})' if modulos else ' AND 0'
+            parametros.extend(modulos)
+        sql += ' ORDER BY fecha, modulo'
+        if limite is not None:
+            sql += ' LIMIT ?'
+            parametros.append(int(limite))
+        return self._ejecutar(sql, parametros)
+
+    def recalcular_resumen_diario(self, desde=None, hasta=None):
+        where, parametros = self._where(
+            ([('gte', 'fecha', desde)] if desde else []) + ([('lte', 'fecha', hasta)] if hasta else []))
+        with self._transaccion() as conn:
+            conn.execute(f'DELETE FROM riegos_resumen_diario{where}', parametros)
+            conn.execute(RECALCULAR_RESUMEN_SQLITE.format(where=where), parametros)
+            return conn.execute(
+                f'SELECT COUNT(*) FROM riegos_resumen_diario{where}', parametros).fetchone()[0]
+
+    def cambios_desde(self, version, limite=1000):
+        limite = int(limite)
+        with self._bloqueo():
+            conn = self._conexion()
+            filas = [dict(fila) for fila in conn.execute(
+                'SELECT * FROM riegos WHERE version > ? ORDER BY version LIMIT ?',
+                (version, limite))]
+            borrados = [dict(fila) for fila in conn.execute(
+                'SELECT * FROM riegos_borrados WHERE version > ? ORDER BY version LIMIT ?',
+                (version, limite))]
+        # Las dos listas juntas en orden de versión, cortadas en limite
+        pagina = sorted([(f['version'], False, f) for f in filas] +
+                        [(b['version'], True, b) for b in borrados],
+                        key=lambda cambio: cambio[0])[:limite]
+        return {
+            'filas': [f for _, borrado, f in pagina if not borrado],
+            'borrados': [b for _, borrado, b in pagina if borrado],
+            'version': pagina[-1][0] if pagina else version,
+            'mas': len(pagina) == limite,
+        }
+
+    def aplicar_cambios(self, filas, borrados):
+        filas = [dict(f) for f in filas]
+        borrados = [dict(b) for b in borrados]
+        uuids = [f['uuid'] for f in filas] + [b['uuid'] for b in borrados]
+        if not uuids:
+            return [], []
+        marcadores = ', '.join('?' * len(uuids))
+        eliminados, insertados = [], []
+        with self._transaccion() as conn:
+            actuales = {fila['uuid']: dict(fila) for fila in conn.execute(
+                f'SELECT * FROM riegos WHERE uuid IN ({marcadores})', uuids)}
+            lapidas = dict(conn.execute(
+                f'SELECT uuid, actualizado_en FROM riegos_borrados WHERE uuid IN ({marcadores})', uuids).fetchall())
+
+            nuevas = []
+            for fila in filas:
+                actual = actuales.get(fila['uuid'])
+                vigente = max((actual['actualizado_en'] if actual else '') or '',
+                              lapidas.get(fila['uuid']) or '')
+                if fila['actualizado_en'] <= vigente:
+                    continue
+                if actual is None:
+                    nuevas.append(fila)
+                    continue
+                valores = {c: fila.get(c) for c in COLUMNAS_SINCRONIZADAS if c != 'uuid'}
+                asignaciones = ', '.join(f'"{c}" = ?' for c in valores)
+                nueva = conn.execute(
+                    f'UPDATE riegos SET {asignaciones} WHERE uuid = ? RETURNING *',
+                    list(valores.values()) + [fila['uuid']]).fetchone()
+                eliminados.append(actual)
+                insertados.append(dict(nueva))
+            if nuevas:
+                nuevas = [{c: f.get(c) for c in COLUMNAS_SINCRONIZADAS} for f in nuevas]
+                conn.executemany('DELETE FROM riegos_borrados WHERE uuid = ?', [(f['uuid'],) for f in nuevas])
+                insertados.extend(self._insertar_en(conn, nuevas))
+
+            for borrado in borrados:
+                actual = actuales.get(borrado['uuid'])
+                if actual is not None:
+                    if borrado['actualizado_en'] < (actual['actualizado_en'] or ''):
+                        continue
+                    conn.execute('DELETE FROM riegos WHERE uuid = ?', (borrado['uuid'],))
+                    eliminados.append(actual)
+                    # La lápida del trigger lleva la hora del servidor; vale la del cliente
+                    conn.execute('UPDATE riegos_borrados SET actualizado_en = ? WHERE uuid = ?',
+                                 (borrado['actualizado_en'], borrado['uuid']))
+                elif borrado['actualizado_en'] > (lapidas.get(borrado['uuid']) or ''):
+                    # Borrado de una fila que el servidor nunca vio: la lápida
+                    # impide que una copia vieja la reviva después
+                    conn.execute('UPDATE riegos_version SET valor = valor + 1')
+                    conn.execute(
+                        'INSERT INTO riegos_borrados (uuid, actualizado_en, version) '
+                        'VALUES (?, ?, (SELECT valor FROM riegos_version)) '
+                        'ON CONFLICT (uuid) DO UPDATE SET '
+                        'actualizado_en = excluded.actualizado_en, version = excluded.version',
+                        (borrado['uuid'], borrado['actualizado_en']))
+        return eliminados, insertados
+
+    def reemplazar_modulo_dia(self, fecha, modulo, registros):
+        registros = [dict(r) for r in registros]
+        with self._transaccion() as conn:
+            cursor = conn.execute(
+                'DELETE FROM riegos WHERE fecha = ? AND modulo = ? RETURNING *',
+                (fecha, modulo))
+            eliminados = [dict(fila) for fila in cursor.fetchall()]
+            heredado = heredar_sistema(eliminados)
+            for registro in registros:
+                for columna, valor in heredado.items():
+                    if registro.get(columna) is None:
+                        registro[columna] = valor
+            insertados = self._insertar_en(conn, registros) if registros else []
+        return eliminados, insertados
+
+
+def heredar_sistema(filas):
+    """Sistema y tiempo de riego de la primera fila que los tenga"""
+    for fila in filas:
+        if fila.get('sistema_riego') and fila['sistema_riego'] != 'N/A':
+            return {'sistema_riego': fila['sistema_riego'],
+                    'tiempo_minutos': fila.get('tiempo_minutos')}
+    return {'sistema_riego': None, 'tiempo_minutos': None}
+
+
+def crear_repositorio(finca_id=None, ruta_sqlite=None):
+    """Crea el repositorio según las variables de entorno.
+
+    BACKEND_DATOS puede ser 'supabase', 'sqlite' o 'memoria'. Si no se indica,
+    se usa Supabase cuando hay credenciales y ningún backend en caso contrario.
+    finca_id acota el repositorio de Supabase a una finca; en SQLite cada
+    finca usa su propio archivo, ruta_sqlite (por defecto SQLITE_RUTA).
+    """
+    backend = os.environ.get('BACKEND_DATOS', '').strip().lower()
+
+    if backend == 'memoria':
+        return RepositorioSQLite(':memory:')
+    if backend == 'sqlite':
+        return RepositorioSQLite(ruta_sqlite or os.environ.get('SQLITE_RUTA', 'riegos_web.db'))
+
+    url = os.environ.get('SUPABASE_URL')
+    key = os.environ.get('SUPABASE_KEY')
+    if not (url and key):
+        if backend == 'supabase':
+            raise RuntimeError('Faltan SUPABASE_URL o SUPABASE_KEY')
+        return None
+
+    from supabase import create_client
+    return RepositorioSupabase(create_client(url, key), finca_id=finca_id)
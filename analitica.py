@@ -0,0 +1,203 @@
+"""Analítica de temporada sobre matrices módulo × día (NumPy).
+
+Un rango de 90 a 365 días se carga en arreglos compactos indexados por
+(módulo, día) con enteros pequeños, y las métricas se calculan con
+reducciones vectorizadas en lugar de recorrer diccionarios fila por fila:
+
+- minutos de riego por módulo y día, separados en ducha y goteo
+- días desde el último fertilizante (comida) en cada módulo y día
+- huecos de cobertura: días sin ningún riego, racha más larga y cobertura diaria
+
+Las matrices se devuelven pivotadas (una fila por módulo, una columna por
+día) para que un mapa de calor las dibuje sin transformarlas.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import numpy as np
+
+from catalogo import clave_natural
+
+# PostgREST corta cada respuesta en max-rows (1000 por defecto en Supabase)
+FILAS_POR_CONSULTA = 1000
+CONSULTAS_EN_PARALELO = 4
+SIN_DATO = -1
+
+
+def _ventanas(desde, hasta, dias_por_ventana):
+    inicio = desde
+    while inicio <= hasta:
+        fin = min(hasta, inicio + timedelta(days=dias_por_ventana - 1))
+        yield inicio, fin
+        inicio = fin + timedelta(days=1)
+
+
+def _cargar_ventana(leer, inicio, fin):
+    """Lee una ventana; si llega al tope de filas la parte en dos y reintenta"""
+    filas = leer(inicio, fin)
+    if len(filas) < FILAS_POR_CONSULTA or inicio == fin:
+        return filas
+    mitad = inicio + timedelta(days=(fin - inicio).days // 2)
+    return _cargar_ventana(leer, inicio, mitad) + _cargar_ventana(leer, mitad + timedelta(days=1), fin)
+
+
+def cargar_filas(repo, desde, hasta, filas_por_dia, diario, modulos=None):
+    """Filas del rango leídas por ventanas de días que caben en una respuesta.
+
+    Con modulos se leen solo esos módulos; si no, todos los de la base.
+    """
+    if diario:
+        def leer(inicio, fin):
+            return repo.resumen_diario(
+                inicio.isoformat(), fin.isoformat(),
+                'fecha,modulo,n_agua,n_comida,minutos_ducha,minutos_goteo',
+                limite=FILAS_POR_CONSULTA, modulos=modulos)
+    else:
+        filtro_modulos = [('in', 'modulo', list(modulos))] if modulos is not None else []
+
+        def leer(inicio, fin):
+            return repo.seleccionar(
+                'fecha,modulo,tipo_riego,sistema_riego,tiempo_minutos',
+                filtros=[('gte', 'fecha', inicio.isoformat()),
+                         ('lte', 'fecha', fin.isoformat())] + filtro_modulos,
+                limite=FILAS_POR_CONSULTA)
+
+    dias_por_ventana = max(1, FILAS_POR_CONSULTA // max(1, filas_por_dia))
+    ventanas = list(_ventanas(desde, hasta, dias_por_ventana))
+    if len(ventanas) == 1:
+        return _cargar_ventana(leer, *ventanas[0])
+    with ThreadPoolExecutor(max_workers=CONSULTAS_EN_PARALELO) as pool:
+        partes = pool.map(lambda ventana: _cargar_ventana(leer, *ventana), ventanas)
+        return [fila for parte in partes for fila in parte]
+
+
+class MatricesTemporada:
+    """Arreglos módulo × día de un rango de fechas"""
+
+    def __init__(self, desde, hasta, modulos):
+        self.desde = desde
+        self.hasta = hasta
+        self.modulos = list(modulos)
+        self.indice_modulo = {m: i for i, m in enumerate(self.modulos)}
+        forma = (len(self.modulos), (hasta - desde).days + 1)
+        self.agua = np.zeros(forma, dtype=np.uint8)
+        self.comida = np.zeros(forma, dtype=np.uint8)
+        self.minutos_ducha = np.zeros(forma, dtype=np.uint16)
+        self.minutos_goteo = np.zeros(forma, dtype=np.uint16)
+
+    @property
+    def dias(self):
+        return [(self.desde + timedelta(days=i)).isoformat() for i in range(self.agua.shape[1])]
+
+    def _indices(self, filas):
+        """Índices (módulo, día) de cada fila; descarta módulos fuera del catálogo pedido"""
+        base = self.desde.toordinal()
+        modulos = np.fromiter((self.indice_modulo.get(f['modulo'], -1) for f in filas),
+                              dtype=np.int32, count=len(filas))
+        dias = np.fromiter((date.fromisoformat(f['fecha'][:10]).toordinal() - base for f in filas),
+                           dtype=np.int32, count=len(filas))
+        validas = modulos >= 0
+        return modulos, dias, validas
+
+    def cargar_diario(self, filas):
+        """Llena las matrices desde riegos_resumen_diario (una fila por día y módulo)"""
+        if not filas:
+            return self
+        m, d, validas = self._indices(filas)
+        m, d = m[validas], d[validas]
+
+        def columna(nombre, dtype):
+            valores = np.fromiter((f[nombre] for f in filas), dtype=np.int64, count=len(filas))
+            return np.clip(valores[validas], 0, np.iinfo(dtype).max).astype(dtype)
+
+        self.agua[m, d] = columna('n_agua', np.uint8)
+        self.comida[m, d] = columna('n_comida', np.uint8)
+        self.minutos_ducha[m, d] = columna('minutos_ducha', np.uint16)
+        self.minutos_goteo[m, d] = columna('minutos_goteo', np.uint16)
+        return self
+
+    def cargar_registros(self, filas):
+        """Llena las matrices desde registros crudos (varias filas por día y módulo)"""
+        if not filas:
+            return self
+        m, d, validas = self._indices(filas)
+        tipos = np.array([f['tipo_riego'] for f in filas], dtype=object)
+        sistemas = np.array([f.get('sistema_riego') for f in filas], dtype=object)
+        minutos = np.fromiter((f.get('tiempo_minutos') or 0 for f in filas),
+                              dtype=np.int64, count=len(filas))
+
+        def acumular(matriz, mascara, valores):
+            mascara = mascara & validas
+            suma = np.zeros(matriz.shape, dtype=np.int64)
+            np.add.at(suma, (m[mascara], d[mascara]), valores[mascara] if valores is not None else 1)
+            matriz[...] = np.clip(suma, 0, np.iinfo(matriz.dtype).max)
+
+        acumular(self.agua, tipos == 'agua', None)
+        acumular(self.comida, tipos == 'comida', None)
+        acumular(self.minutos_ducha, sistemas == 'ducha', minutos)
+        acumular(self.minutos_goteo, sistemas == 'goteo', minutos)
+        return self
+
+    def dias_desde_comida(self):
+        """Días desde el último fertilizante (0 el mismo día); -1 si no lo hubo en el rango"""
+        posiciones = np.arange(self.comida.shape[1], dtype=np.int16)
+        ultimo = np.where(self.comida > 0, posiciones, np.int16(SIN_DATO))
+        ultimo = np.maximum.accumulate(ultimo, axis=1)
+        return np.where(ultimo >= 0, posiciones - ultimo, np.int16(SIN_DATO)).astype(np.int16)
+
+    def huecos(self):
+        """Matriz de días sin riego y la racha más larga por módulo"""
+        regado = (self.agua > 0) | (self.comida > 0)
+        posiciones = np.arange(regado.shape[1], dtype=np.int32)
+        # Último día regado hasta cada posición; la racha seca es la distancia a él
+        ultimo_regado = np.maximum.accumulate(np.where(regado, posiciones, -1), axis=1)
+        racha = np.where(regado, 0, posiciones - ultimo_regado)
+        racha_maxima = racha.max(axis=1) if racha.size else np.zeros(len(self.modulos), dtype=np.int32)
+        return regado, racha_maxima
+
+    def resultado(self):
+        """Diccionario listo para JSON con las matrices pivotadas y sus totales"""
+        regado, racha_maxima = self.huecos()
+        minutos_total = self.minutos_ducha.astype(np.int32) + self.minutos_goteo
+        n_modulos = max(1, len(self.modulos))
+        return {
+            'desde': self.desde.isoformat(),
+            'hasta': self.hasta.isoformat(),
+            'dias': self.dias,
+            'modulos': self.modulos,
+            'matrices': {
+                'minutos_ducha': self.minutos_ducha.tolist(),
+                'minutos_goteo': self.minutos_goteo.tolist(),
+                'dias_desde_comida': self.dias_desde_comida().tolist(),
+                'regado': regado.astype(np.uint8).tolist(),
+            },
+            'por_modulo': {
+                'minutos_ducha': self.minutos_ducha.sum(axis=1, dtype=np.int64).tolist(),
+                'minutos_goteo': self.minutos_goteo.sum(axis=1, dtype=np.int64).tolist(),
+                'dias_con_agua': (self.agua > 0).sum(axis=1).tolist(),
+                'dias_con_comida': (self.comida > 0).sum(axis=1).tolist(),
+                'dias_sin_riego': (~regado).sum(axis=1).tolist(),
+                'racha_sin_riego_maxima': racha_maxima.tolist(),
+            },
+            'por_dia': {
+                'minutos_total': minutos_total.sum(axis=0, dtype=np.int64).tolist(),
+                'cobertura': np.round(regado.sum(axis=0) / n_modulos, 4).tolist(),
+            },
+        }
+
+
+def analizar_temporada(repo, desde, hasta, modulos, diario=False, incluir_extra=True):
+    """Carga el rango [desde, hasta] y devuelve las matrices de la temporada.
+
+    Con incluir_extra, los módulos con registros que ya no están en el
+    catálogo se agregan al final en lugar de descartarse.
+    """
+    filas = cargar_filas(repo, desde, hasta, filas_por_dia=len(modulos) * (1 if diario else 2),
+                         diario=diario, modulos=None if incluir_extra else modulos)
+    extra = []
+    if incluir_extra:
+        extra = sorted({f['modulo'] for f in filas} - set(modulos), key=clave_natural)
+    matrices = MatricesTemporada(desde, hasta, list(modulos) + extra)
+    if diario:
+        return matrices.cargar_diario(filas).resultado()
+    return matrices.cargar_registros(filas).resultado()
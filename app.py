@@ -1,19 +1,42 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, send_file
-from datetime import datetime, timedelta
+from flask import Flask, render_template, request, jsonify, redirect, url_for, send_file, Response, stream_with_context, make_response, g, has_request_context
+from functools import partial, wraps
+import click
+from datetime import datetime, date, timedelta
 import os
-from supabase import create_client, Client
-import csv
 from dotenv import load_dotenv
 from openpyxl import Workbook
 from openpyxl.styles import Font, PatternFill, Alignment
 import io
+import json
+import base64
+import hashlib
+import time
+import shutil
+import tempfile
 import pytz
+from almacenamiento import crear_repositorio
+from exportacion import generar_excel_rango, generar_crudos, FORMATOS_CRUDOS
+from columnar import hora_ecuador, registros_columnar, historial_columnar
+from cola_escritura import ColaEscritura
+from idempotencia import RegistroIdempotencia, REPETIDA, EN_CURSO, CONFLICTO
+from metricas import configurar_logging, RegistroMetricas, RepositorioInstrumentado
+from catalogo import CatalogoModulos
+from fincas import Finca, validar_finca, leer_fincas, ruta_por_finca
+from compresion import ActivosEstaticos, comprimir_respuesta, comprimir_flujo, elegir_codificacion
+from analitica import analizar_temporada
+from importacion import importar, EXTENSIONES
+from sincronizacion import LOTE, LOTE_MAX, TIPOS_RIEGO, SISTEMAS_RIEGO, validar_fila, validar_borrado, decodificar
 
 # Cargar variables de entorno
 load_dotenv()
 
 app = Flask(__name__)
 
+# Logging estructurado por una cola (nivel en LOG_LEVEL) y métricas de latencia
+log = configurar_logging()
+metricas = RegistroMetricas()
+metricas.registrar('riegos_http_duracion_segundos', 'Latencia de las peticiones HTTP por ruta')
+
 # Configurar zona horaria de Ecuador
 TIMEZONE_ECUADOR = pytz.timezone('America/Guayaquil')
 
@@ -27,56 +50,208 @@ def get_timestamp_ecuador():
 
 def convertir_a_hora_ecuador(timestamp_str):
     """Convierte un timestamp UTC a hora de Ecuador"""
-    try:
-        # Si el timestamp ya tiene zona horaria
-        if '+' in timestamp_str or timestamp_str.endswith('Z'):
-            dt_utc = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-            if dt_utc.tzinfo is None:
-                dt_utc = pytz.utc.localize(dt_utc)
-            dt_ecuador = dt_utc.astimezone(TIMEZONE_ECUADOR)
-        else:
-            # Si no tiene zona horaria, asumimos UTC
-            dt_naive = datetime.fromisoformat(timestamp_str)
-            dt_utc = pytz.utc.localize(dt_naive)
-            dt_ecuador = dt_utc.astimezone(TIMEZONE_ECUADOR)
-        return dt_ecuador.strftime('%H:%M:%S')
-    except:
-        return timestamp_str
+    # Desfase fijo: mismo resultado que pytz (Ecuador no tiene horario de
+    # verano) sin su costo por fila
+    return hora_ecuador(timestamp_str)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
 
-# Configuración de Supabase
-SUPABASE_URL = os.environ.get('SUPABASE_URL')
-SUPABASE_KEY = os.environ.get('SUPABASE_KEY')
+def acumular_tiempo_db(operacion, duracion):
+    """Suma el tiempo de base de la petición en curso para Server-Timing"""
+    if has_request_context():
+        g.tiempo_db = g.get('tiempo_db', 0.0) + duracion
+        g.consultas_db = g.get('consultas_db', 0) + 1
 
-# Inicializar cliente de Supabase
-supabase: Client = None
-if SUPABASE_URL and SUPABASE_KEY:
-    try:
-        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-        print(f"✅ Conectado a Supabase: {SUPABASE_URL}")
-    except Exception as e:
-        print(f"⚠️  Error conectando a Supabase: {e}")
-        print("La app funcionará pero sin guardar datos")
-else:
-    print("⚠️  Supabase no configurado - modo sin base de datos")
-
-# Cargar módulos desde CSV
-def cargar_modulos():
-    modulos = []
+
+# Fincas atendidas: la por defecto (FINCA_DEFECTO) más las de FINCAS. Con una
+# sola finca todo funciona como siempre; con varias, cada una tiene su
+# catálogo, su almacenamiento y sus cachés (ver fincas.py)
+FINCA_DEFECTO = validar_finca(os.environ.get('FINCA_DEFECTO', 'principal'))
+IDS_FINCAS = leer_fincas(os.environ.get('FINCAS'), FINCA_DEFECTO)
+VARIAS_FINCAS = len(IDS_FINCAS) > 1
+
+
+def crear_finca(finca_id):
+    """Arma el repositorio, el catálogo, las cachés y la cola de una finca"""
+    repo = None
     try:
-        with open('modulos.csv', 'r') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                modulos.append(row['modulo'])
+        # En Supabase la columna finca_id (FINCAS.sql) solo se usa con varias fincas
+        repo = crear_repositorio(
+            finca_id if VARIAS_FINCAS else None,
+            ruta_sqlite=ruta_por_finca(os.environ.get('SQLITE_RUTA', 'riegos_web.db'), finca_id, FINCA_DEFECTO))
+        if repo:
+            log.info("Almacenamiento de riegos listo", extra={'datos': {'finca': finca_id, 'backend': repo.nombre}})
+        else:
+            log.warning("Supabase no configurado - modo sin base de datos")
     except Exception as e:
-        print(f"Error cargando módulos: {e}")
-        # Módulos por defecto si no se puede cargar el CSV
-        modulos = ['11', '12', '13', '14', '15', '16', '21', '22', '23', '24']
-    return sorted(modulos)
+        log.warning("Error conectando al almacenamiento, la app funcionará sin guardar datos",
+                    extra={'datos': {'finca': finca_id, 'error': repr(e)}})
+    
+    if repo:
+        repo = RepositorioInstrumentado(repo, metricas, al_medir=acumular_tiempo_db)
+    
+    # Resumen semanal con caché por semana ISO. Lee la tabla riegos_resumen_diario
+    # si RESUMEN_DIARIO está activo (en SQLite siempre existe; en Supabase
+    # requiere RESUMEN_DIARIO.sql)
+    diario = os.environ.get(
+        'RESUMEN_DIARIO', '1' if repo and repo.nombre == 'sqlite' else '0'
+    ).lower() in ('1', 'true', 'si')
+    
+    # Catálogo de módulos: orden natural y recarga cuando cambia su CSV
+    catalogo = CatalogoModulos(ruta_por_finca('modulos.csv', finca_id, FINCA_DEFECTO))
+    
+    finca = Finca(
+        finca_id, repo, catalogo, diario=diario,
+        # Contadores de /estadisticas mantenidos por las escrituras
+        ttl=int(os.environ.get('ESTADISTICAS_TTL', 60)),
+        # Versiones por conjunto de datos para responder If-None-Match con 304
+        ventana=int(os.environ.get('ETAG_VENTANA', 300)),
+        # Vencimiento de cada semana en la caché del resumen semanal
+        ttl_resumen=int(os.environ.get('RESUMEN_TTL', 300))
+    )
+    
+    # Cola de escritura durable: /registrar confirma al quedar en disco local y
+    # un hilo vuelca los envíos por lotes al repositorio
+    if repo and os.environ.get('COLA_ESCRITURA', '').lower() in ('1', 'true', 'si'):
+        finca.cola_escritura = ColaEscritura(
+            repo,
+            ruta=ruta_por_finca(os.environ.get('COLA_RUTA', 'cola_riegos.db'), finca_id, FINCA_DEFECTO),
+            lote_max=int(os.environ.get('COLA_LOTE_MAX', 500)),
+            al_volcar=lambda insertados: finca.propagar_cambios('insertar', insertados)
+        )
+        finca.cola_escritura.iniciar()
+        log.info("Cola de escritura activa", extra={'datos': {'finca': finca_id, 'ruta': finca.cola_escritura.ruta}})
+    return finca
+
+
+fincas = {finca_id: crear_finca(finca_id) for finca_id in IDS_FINCAS}
+
 
-MODULOS = cargar_modulos()
+@app.before_request
+def elegir_finca():
+    """Deja en g.finca la finca de la petición (?finca=, X-Finca, cookie o la por defecto)"""
+    pedida = request.args.get('finca') or request.headers.get('X-Finca')
+    if pedida:
+        finca = fincas.get(pedida.strip().lower())
+        if finca is None:
+            return jsonify({'error': f'Finca desconocida: {pedida}'}), 404
+    else:
+        # Una cookie de una finca que ya no existe no deja la app inutilizable
+        finca = fincas.get(request.cookies.get('finca', ''), fincas[FINCA_DEFECTO])
+    g.finca = finca
 
 
+@app.after_request
+def recordar_finca(response):
+    """Las páginas abiertas con ?finca= fijan la finca de las peticiones siguientes"""
+    finca = g.get('finca')
+    if finca and request.args.get('finca') and request.cookies.get('finca') != finca.id:
+        response.set_cookie('finca', finca.id, max_age=365 * 24 * 3600, samesite='Lax')
+    return response
+
+
+@app.context_processor
+def datos_finca():
+    return {'finca': g.get('finca'), 'fincas': IDS_FINCAS if VARIAS_FINCAS else []}
+
+
+# Índice de claves de idempotencia para que los clientes reintenten sin duplicar
+registro_idempotencia = RegistroIdempotencia(
+    ruta=os.environ.get('IDEMPOTENCIA_RUTA', 'idempotencia.db'),
+    ttl=int(os.environ.get('IDEMPOTENCIA_TTL', 86400))
+)
+
+
+def idempotente(vista):
+    """Repite la respuesta original si llega otra vez el mismo Idempotency-Key"""
+    @wraps(vista)
+    def envoltura(*args, **kwargs):
+        clave = request.headers.get('Idempotency-Key')
+        if not clave:
+            return vista(*args, **kwargs)
+        
+        # Cada finca tiene su propio espacio de claves
+        clave = f'{g.finca.id}:{clave}'
+        huella = hashlib.sha256(request.get_data()).hexdigest()
+        estado, previa = registro_idempotencia.reservar(clave, huella)
+        
+        if estado == REPETIDA:
+            status, cuerpo = previa
+            response = Response(cuerpo, status=status, mimetype='application/json')
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+        if estado == EN_CURSO:
+            return jsonify({'error': 'Este envío todavía se está procesando'}), 409
+        if estado == CONFLICTO:
+            return jsonify({'error': 'Idempotency-Key ya usada con otros datos'}), 422
+        
+        try:
+            response = make_response(vista(*args, **kwargs))
+        except Exception:
+            registro_idempotencia.liberar(clave)
+            raise
+        
+        # Los errores del servidor no se recuerdan: el cliente debe poder reintentar
+        if response.status_code >= 500:
+            registro_idempotencia.liberar(clave)
+        else:
+            registro_idempotencia.guardar(clave, huella, response.status_code, response.get_data())
+        return response
+    return envoltura
+
+
+def respuesta_no_modificada(etag):
+    """Devuelve un 304 si el cliente ya tiene la versión del ETag, o None"""
+    # Comparación débil: las respuestas comprimidas llevan el ETag como W/"..."
+    if request.if_none_match.contains_weak(etag):
+        return con_etag(Response(status=304), etag)
+    return None
+
+
+def con_etag(response, etag):
+    """Agrega el ETag a una respuesta y obliga al cliente a revalidarla"""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.before_request
+def iniciar_medicion():
+    g.inicio_peticion = time.perf_counter()
+
+
+@app.after_request
+def registrar_latencia(response):
+    """Observa la latencia por ruta y la detalla en Server-Timing (db vs. app)"""
+    inicio = g.get('inicio_peticion')
+    if inicio is None:
+        return response
+    total = time.perf_counter() - inicio
+    tiempo_db = g.get('tiempo_db', 0.0)
+    ruta = request.url_rule.rule if request.url_rule else 'sin_ruta'
+    finca = g.finca.id if g.get('finca') else ''
+    metricas.observar('riegos_http_duracion_segundos', total,
+                      ruta=ruta, metodo=request.method, estado=response.status_code, finca=finca)
+    response.headers['Server-Timing'] = (
+        f'db;dur={tiempo_db * 1000:.1f};desc="{g.get("consultas_db", 0)} consultas", '
+        f'app;dur={(total - tiempo_db) * 1000:.1f}, '
+        f'total;dur={total * 1000:.1f}'
+    )
+    return response
+
+
+# Se registra después de registrar_latencia para que Flask la ejecute antes
+# y el tiempo de compresión quede dentro de la medición
+app.after_request(comprimir_respuesta)
+
+# Estáticos con huella de contenido, precomprimidos y cacheables para siempre
+activos = ActivosEstaticos(app.static_folder)
+app.jinja_env.globals['activo'] = activos.url
+
+
+@app.route('/activos/<path:ruta>')
+def servir_activo(ruta):
+    """CSS y JS de static/ con huella: /activos/css/styles.<huella>.css"""
+    return activos.servir(ruta)
+
 @app.route('/')
 def index():
     """Página principal"""
@@ -94,26 +269,46 @@ def index():
     dia = dias_espanol.get(fecha_ecuador.strftime('%A'), fecha_ecuador.strftime('%A'))
     mes = meses_espanol.get(fecha_ecuador.strftime('%B'), fecha_ecuador.strftime('%B'))
     fecha_formateada = f"{dia}, {fecha_ecuador.day} de {mes} de {fecha_ecuador.year}"
-    return render_template('index.html', fecha=fecha_formateada, modulos=MODULOS)
+    return render_template('index.html', fecha=fecha_formateada, fecha_iso=fecha_ecuador.strftime('%Y-%m-%d'))
+
+
+@app.route('/modulos')
+def modulos():
+    """Módulos que empiezan con ?q= (todos si no se indica), agrupados por bloque"""
+    finca = g.finca
+    try:
+        limite = int(request.args['limite']) if request.args.get('limite') else None
+    except ValueError:
+        return jsonify({'error': 'limite debe ser un número'}), 400
+    q = request.args.get('q', '')
+    
+    etag = f'modulos-{finca.id}-{finca.catalogo.version}-{hashlib.sha1(f"{q}|{limite}".encode()).hexdigest()[:12]}'
+    no_modificada = respuesta_no_modificada(etag)
+    if no_modificada:
+        return no_modificada
+    
+    encontrados = finca.catalogo.buscar(q, limite)
+    return con_etag(jsonify({
+        'modulos': encontrados,
+        'grupos': finca.catalogo.agrupar(encontrados),
+        'total': len(finca.catalogo)
+    }), etag)
 
 
 @app.route('/registrar', methods=['POST'])
+@idempotente
 def registrar_riego():
     """Registra un nuevo riego en Supabase"""
+    finca = g.finca
     try:
         data = request.get_json()
-        print(f"📥 Datos recibidos: {data}")
+        log.debug("Registro recibido", extra={'datos': {'payload': data}})
         
         modulos = data.get('modulos', [])
         tipos_riego = data.get('tipos_riego', [])
         sistema_riego = data.get('sistema_riego')
         tiempo_minutos = data.get('tiempo_minutos')
         
-        print(f"📋 Módulos: {modulos}")
-        print(f"💧 Tipos de riego: {tipos_riego}")
-        print(f"🚿 Sistema: {sistema_riego}")
-        print(f"⏱️  Tiempo: {tiempo_minutos} min")
-        
         if not modulos:
             return jsonify({'error': 'Debe seleccionar al menos un módulo'}), 400
         
@@ -143,72 +338,93 @@ def registrar_riego():
                     'timestamp': timestamp
                 })
         
-        print(f"✍️  Preparando {len(registros)} registros para insertar")
-        
-        # Insertar en Supabase
-        if supabase:
-            response = supabase.table('riegos').insert(registros).execute()
-            print(f"✅ Respuesta de Supabase: {response}")
-            
+        # Insertar en Supabase (o dejar en la cola local si está activa)
+        if finca.repo:
             tipos_texto = ' y '.join(['Agua' if t == 'agua' else 'Comida' for t in tipos_riego])
             
+            if finca.cola_escritura:
+                envio = finca.cola_escritura.encolar(registros)
+                log.info("Envío en cola", extra={'datos': {'envio': envio, 'registros': len(registros)}})
+                
+                return jsonify({
+                    'success': True,
+                    'message': f'Riego registrado: {len(modulos)} módulo(s) con {tipos_texto}',
+                    'registros': len(registros),
+                    'encolado': True
+                }), 202
+            
+            insertados = finca.repo.insertar(registros)
+            finca.propagar_cambios('insertar', insertados)
+            log.info("Registros guardados", extra={'datos': {'registros': len(insertados)}})
+            
             return jsonify({
                 'success': True,
                 'message': f'Riego registrado: {len(modulos)} módulo(s) con {tipos_texto}',
                 'registros': len(registros)
             })
         else:
-            print("⚠️  Supabase no está configurado")
             return jsonify({'error': 'Supabase no está configurado'}), 500
             
     except Exception as e:
-        print(f"❌ Error: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Error al registrar riego")
         return jsonify({'error': str(e)}), 500
 
 
+def formatear_registro(reg):
+    """Formatea un registro para el frontend con hora de Ecuador"""
+    hora = convertir_a_hora_ecuador(reg['timestamp'])
+    
+    # Sistema y tiempo con valores por defecto para registros antiguos
+    sistema = reg.get('sistema_riego', 'N/A')
+    tiempo = reg.get('tiempo_minutos', 0)
+    
+    return {
+        'id': reg['id'],
+        'hora': hora,
+        'modulo': reg['modulo'],
+        'tipo_riego': 'Agua' if reg['tipo_riego'] == 'agua' else 'Comida (Fertilizante)',
+        'sistema_riego': 'Ducha' if sistema == 'ducha' else 'Goteo' if sistema == 'goteo' else sistema,
+        'tiempo_minutos': tiempo,
+        'fecha': reg['fecha']  # Agregar fecha al resultado
+    }
+
+
 @app.route('/registros-hoy')
 def registros_hoy():
     """Obtiene los registros del día actual o de una fecha específica"""
+    finca = g.finca
     try:
         # Permitir pasar una fecha específica como parámetro, sino usar fecha de Ecuador
         fecha = request.args.get('fecha', get_fecha_ecuador())
         
-        if supabase:
-            response = supabase.table('riegos')\
-                .select('*')\
-                .eq('fecha', fecha)\
-                .order('timestamp', desc=True)\
-                .execute()
+        if finca.repo:
+            # El ETag se toma antes de consultar: si una escritura llega en
+            # medio, el cliente queda con un ETag viejo y vuelve a pedir
+            formato = request.args.get('format', 'filas')
+            etag = finca.versiones.etag(f'fecha:{fecha}', variante=formato)
+            no_modificada = respuesta_no_modificada(etag)
+            if no_modificada:
+                return no_modificada
+            
+            registros = finca.repo.seleccionar(
+                filtros=[('eq', 'fecha', fecha)],
+                orden=[('timestamp', True)]
+            )
             
-            registros = response.data
+            if formato == 'columnar':
+                return con_etag(jsonify(registros_columnar(registros)), etag)
             
             # Formatear datos para el frontend con hora de Ecuador
-            registros_formateados = []
-            for reg in registros:
-                hora = convertir_a_hora_ecuador(reg['timestamp'])
-                
-                # Sistema y tiempo con valores por defecto para registros antiguos
-                sistema = reg.get('sistema_riego', 'N/A')
-                tiempo = reg.get('tiempo_minutos', 0)
-                
-                registros_formateados.append({
-                    'id': reg['id'],
-                    'hora': hora,
-                    'modulo': reg['modulo'],
-                    'tipo_riego': 'Agua' if reg['tipo_riego'] == 'agua' else 'Comida (Fertilizante)',
-                    'sistema_riego': 'Ducha' if sistema == 'ducha' else 'Goteo' if sistema == 'goteo' else sistema,
-                    'tiempo_minutos': tiempo,
-                    'fecha': reg['fecha']  # Agregar fecha al resultado
-                })
+            registros_formateados = [formatear_registro(reg) for reg in registros]
             
-            return jsonify(registros_formateados)
+            return con_etag(jsonify(registros_formateados), etag)
+        elif request.args.get('format') == 'columnar':
+            return jsonify(registros_columnar([]))
         else:
             return jsonify([])
             
     except Exception as e:
-        print(f"Error: {e}")
+        log.exception("Error en %s", request.path)
         return jsonify({'error': str(e)}), 500
 
 
@@ -221,56 +437,95 @@ def historial():
 @app.route('/resumen')
 def resumen():
     """Página de resumen semanal"""
-    return render_template('resumen.html', modulos=MODULOS)
+    return render_template('resumen.html')
+
+
+HISTORIAL_PAGINA = 100
+HISTORIAL_PAGINA_MAX = 500
+COLUMNAS_HISTORIAL = 'id,fecha,timestamp,modulo,tipo_riego'
+
+
+def codificar_cursor(reg):
+    """Cursor opaco con el (timestamp, id) de la última fila entregada"""
+    return base64.urlsafe_b64encode(f"{reg['timestamp']}|{reg['id']}".encode()).decode()
+
+
+def decodificar_cursor(cursor):
+    timestamp, id_ = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit('|', 1)
+    return timestamp, int(id_)
+
+
+def formatear_historial(reg):
+    """Formatea una fila del historial con hora de Ecuador"""
+    fecha = reg['fecha']
+    if len(fecha) == 10 and fecha[4] == '-' and fecha[7] == '-':
+        fecha = f"{fecha[8:10]}/{fecha[5:7]}/{fecha[0:4]}"
+    hora = hora_ecuador(reg['timestamp'])
+    
+    return {
+        'id': reg['id'],
+        'fecha': fecha,
+        'hora': hora,
+        'modulo': reg['modulo'],
+        'tipo_riego': 'Agua' if reg['tipo_riego'] == 'agua' else 'Comida (Fertilizante)'
+    }
 
 
 @app.route('/historial-completo')
 def historial_completo():
-    """Obtiene todos los registros históricos"""
+    """Obtiene el historial paginado por cursor (timestamp, id), del más reciente al más antiguo"""
+    finca = g.finca
     try:
-        if supabase:
-            response = supabase.table('riegos')\
-                .select('*')\
-                .order('timestamp', desc=True)\
-                .limit(500)\
-                .execute()
-            
-            registros = response.data
-            
-            # Formatear datos
-            registros_formateados = []
-            for reg in registros:
-                try:
-                    fecha_obj = datetime.strptime(reg['fecha'], '%Y-%m-%d')
-                    fecha = fecha_obj.strftime('%d/%m/%Y')
-                    hora = datetime.fromisoformat(reg['timestamp']).strftime('%H:%M:%S')
-                except:
-                    fecha = reg['fecha']
-                    hora = reg['timestamp']
-                
-                registros_formateados.append({
-                    'fecha': fecha,
-                    'hora': hora,
-                    'modulo': reg['modulo'],
-                    'tipo_riego': 'Agua' if reg['tipo_riego'] == 'agua' else 'Comida (Fertilizante)'
-                })
+        try:
+            limite = min(max(int(request.args.get('limite', HISTORIAL_PAGINA)), 1), HISTORIAL_PAGINA_MAX)
+            cursor = request.args.get('cursor')
+            cursor = decodificar_cursor(cursor) if cursor else None
+        except ValueError:
+            return jsonify({'error': 'Parámetros de paginación inválidos'}), 400
+        
+        if finca.repo:
+            etag = finca.versiones.etag('historial', variante=request.query_string.decode())
+            no_modificada = respuesta_no_modificada(etag)
+            if no_modificada:
+                return no_modificada
+            
+            # Pedimos una fila extra para saber si hay otra página
+            registros = finca.repo.paginar(COLUMNAS_HISTORIAL, cursor=cursor, limite=limite + 1)
+            hay_mas = len(registros) > limite
+            registros = registros[:limite]
             
-            return jsonify(registros_formateados)
+            filas = [formatear_historial(reg) for reg in registros]
+            siguiente = codificar_cursor(registros[-1]) if hay_mas else None
+            
+            if request.args.get('format') == 'columnar':
+                return con_etag(jsonify({
+                    'registros': historial_columnar(filas),
+                    'siguiente': siguiente
+                }), etag)
+            
+            return con_etag(jsonify({
+                'registros': filas,
+                'siguiente': siguiente
+            }), etag)
+        elif request.args.get('format') == 'columnar':
+            return jsonify({'registros': historial_columnar([]), 'siguiente': None})
         else:
-            return jsonify([])
+            return jsonify({'registros': [], 'siguiente': None})
             
     except Exception as e:
-        print(f"Error: {e}")
+        log.exception("Error en %s", request.path)
         return jsonify({'error': str(e)}), 500
 
 
 @app.route('/eliminar/<int:id>', methods=['DELETE'])
 def eliminar_riego(id):
     """Elimina un registro de riego"""
+    finca = g.finca
     try:
-        if supabase:
-            response = supabase.table('riegos').delete().eq('id', id).execute()
-            print(f"🗑️  Registro {id} eliminado")
+        if finca.repo:
+            eliminados = finca.repo.eliminar([('eq', 'id', id)])
+            finca.propagar_cambios('eliminar', eliminados)
+            log.info("Registro eliminado", extra={'datos': {'id': id}})
             
             return jsonify({
                 'success': True,
@@ -280,13 +535,14 @@ def eliminar_riego(id):
             return jsonify({'error': 'Supabase no está configurado'}), 500
             
     except Exception as e:
-        print(f"❌ Error al eliminar: {e}")
+        log.exception("Error al eliminar")
         return jsonify({'error': str(e)}), 500
 
 
 @app.route('/editar/<int:id>', methods=['PUT'])
 def editar_riego(id):
     """Edita un registro de riego"""
+    finca = g.finca
     try:
         data = request.get_json()
         modulo = data.get('modulo')
@@ -295,13 +551,14 @@ def editar_riego(id):
         if not modulo or not tipo_riego:
             return jsonify({'error': 'Datos incompletos'}), 400
         
-        if supabase:
-            response = supabase.table('riegos')\
-                .update({'modulo': modulo, 'tipo_riego': tipo_riego})\
-                .eq('id', id)\
-                .execute()
+        if finca.repo:
+            actualizados = finca.repo.actualizar(
+                {'modulo': modulo, 'tipo_riego': tipo_riego},
+                [('eq', 'id', id)]
+            )
+            finca.propagar_cambios('actualizar', actualizados)
             
-            print(f"✏️  Registro {id} actualizado: {modulo} - {tipo_riego}")
+            log.info("Registro actualizado", extra={'datos': {'id': id, 'modulo': modulo, 'tipo_riego': tipo_riego}})
             
             return jsonify({
                 'success': True,
@@ -311,169 +568,435 @@ def editar_riego(id):
             return jsonify({'error': 'Supabase no está configurado'}), 500
             
     except Exception as e:
-        print(f"❌ Error al editar: {e}")
+        log.exception("Error al editar")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/reemplazar-modulo-dia', methods=['PUT'])
+def reemplazar_modulo_dia():
+    """Reemplaza en una sola operación los registros de un módulo en una fecha"""
+    finca = g.finca
+    try:
+        data = request.get_json()
+        fecha = data.get('fecha')
+        modulo = data.get('modulo')
+        modulo_nuevo = data.get('modulo_nuevo') or modulo
+        tipos_riego = data.get('tipos_riego', [])
+        
+        if not fecha or not modulo:
+            return jsonify({'error': 'Datos incompletos'}), 400
+        
+        if not tipos_riego or any(t not in ('agua', 'comida') for t in tipos_riego):
+            return jsonify({'error': 'Debe seleccionar al menos un tipo de riego'}), 400
+        
+        if finca.repo:
+            timestamp = get_timestamp_ecuador()
+            registros = [{
+                'fecha': fecha,
+                'modulo': modulo_nuevo,
+                'tipo_riego': tipo_riego,
+                # Si no vienen, se heredan de los registros reemplazados
+                'sistema_riego': data.get('sistema_riego'),
+                'tiempo_minutos': data.get('tiempo_minutos'),
+                'timestamp': timestamp
+            } for tipo_riego in tipos_riego]
+            
+            eliminados, insertados = finca.repo.reemplazar_modulo_dia(fecha, modulo, registros)
+            finca.propagar_cambios('eliminar', eliminados)
+            finca.propagar_cambios('insertar', insertados)
+            
+            log.info("Módulo reemplazado", extra={'datos': {
+                'modulo': modulo, 'fecha': fecha, 'eliminados': len(eliminados), 'insertados': len(insertados)}})
+            
+            return jsonify({
+                'success': True,
+                'message': 'Registro actualizado correctamente',
+                'registros': [formatear_registro(reg) for reg in insertados]
+            })
+        else:
+            return jsonify({'error': 'Supabase no está configurado'}), 500
+            
+    except Exception as e:
+        log.exception("Error al reemplazar")
         return jsonify({'error': str(e)}), 500
 
 
+MAX_IDS_MASIVOS = 1000
+CAMBIOS_PERMITIDOS = {
+    'modulo': lambda v: isinstance(v, str) and v.strip() != '',
+    'tipo_riego': lambda v: v in ('agua', 'comida'),
+    'sistema_riego': lambda v: v in ('ducha', 'goteo'),
+    'tiempo_minutos': lambda v: isinstance(v, int) and not isinstance(v, bool) and v > 0,
+}
+
+
+def filtros_masivos(data):
+    """Arma los filtros de una operación masiva a partir de ids o de un filtro.
+
+    Acepta {'ids': [...]} o {'filtro': {fecha | desde/hasta, modulos, tipo_riego,
+    sistema_riego}}. Lanza ValueError si no queda ningún filtro o si algún
+    valor no es válido, para que un cuerpo mal armado nunca borre o cambie
+    filas que no debía.
+    """
+    ids = data.get('ids')
+    if ids is not None:
+        if not isinstance(ids, list) or not ids or len(ids) > MAX_IDS_MASIVOS:
+            raise ValueError(f'ids debe ser una lista de 1 a {MAX_IDS_MASIVOS} elementos')
+        if any(isinstance(id_, bool) or not isinstance(id_, int) for id_ in ids):
+            raise ValueError('ids debe contener solo números enteros')
+        return [('in', 'id', ids)]
+    
+    filtro = data.get('filtro') or {}
+    if not isinstance(filtro, dict):
+        raise ValueError('filtro debe ser un objeto')
+    filtros = []
+    for clave, operador in (('fecha', 'eq'), ('desde', 'gte'), ('hasta', 'lte')):
+        if filtro.get(clave):
+            try:
+                fecha = date.fromisoformat(str(filtro[clave])).isoformat()
+            except ValueError:
+                raise ValueError(f'{clave} inválida: {filtro[clave]!r}')
+            filtros.append((operador, 'fecha', fecha))
+    if filtro.get('modulos'):
+        modulos = filtro['modulos']
+        # Una cadena como "11" no debe convertirse en ['1', '1']
+        if not isinstance(modulos, list) or not all(isinstance(m, str) and m.strip() for m in modulos):
+            raise ValueError('modulos debe ser una lista de módulos')
+        filtros.append(('in', 'modulo', [m.strip() for m in modulos]))
+    if filtro.get('tipo_riego'):
+        if not isinstance(filtro['tipo_riego'], str) or filtro['tipo_riego'] not in TIPOS_RIEGO:
+            raise ValueError(f"tipo_riego inválido: {filtro['tipo_riego']!r}")
+        filtros.append(('eq', 'tipo_riego', filtro['tipo_riego']))
+    if filtro.get('sistema_riego'):
+        if not isinstance(filtro['sistema_riego'], str) or filtro['sistema_riego'] not in SISTEMAS_RIEGO:
+            raise ValueError(f"sistema_riego inválido: {filtro['sistema_riego']!r}")
+        filtros.append(('eq', 'sistema_riego', filtro['sistema_riego']))
+    
+    if not any(columna == 'fecha' for _, columna, _ in filtros):
+        raise ValueError('El filtro debe incluir fecha o un rango desde/hasta')
+    return filtros
+
+
+@app.route('/riegos', methods=['DELETE'])
+def eliminar_riegos():
+    """Elimina en una sola consulta los registros de una lista de ids o de un filtro"""
+    finca = g.finca
+    try:
+        data = request.get_json() or {}
+        try:
+            filtros = filtros_masivos(data)
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+        
+        if finca.repo:
+            eliminados = finca.repo.eliminar(filtros)
+            finca.propagar_cambios('eliminar', eliminados)
+            log.info("Registros eliminados", extra={'datos': {'registros': len(eliminados)}})
+            
+            return jsonify({
+                'success': True,
+                'message': f'{len(eliminados)} registro(s) eliminado(s)',
+                'afectados': len(eliminados)
+            })
+        else:
+            return jsonify({'error': 'Supabase no está configurado'}), 500
+            
+    except Exception as e:
+        log.exception("Error al eliminar")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/riegos', methods=['PATCH'])
+def editar_riegos():
+    """Actualiza en una sola consulta los registros de una lista de ids o de un filtro"""
+    finca = g.finca
+    try:
+        data = request.get_json() or {}
+        cambios = data.get('cambios') or {}
+        
+        if not cambios:
+            return jsonify({'error': 'Datos incompletos'}), 400
+        
+        for columna, valor in cambios.items():
+            validar = CAMBIOS_PERMITIDOS.get(columna)
+            if not validar or not validar(valor):
+                return jsonify({'error': f'Cambio inválido: {columna}'}), 400
+        
+        try:
+            filtros = filtros_masivos(data)
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+        
+        if finca.repo:
+            actualizados = finca.repo.actualizar(cambios, filtros)
+            finca.propagar_cambios('actualizar', actualizados)
+            log.info("Registros actualizados", extra={'datos': {'registros': len(actualizados), 'cambios': cambios}})
+            
+            return jsonify({
+                'success': True,
+                'message': f'{len(actualizados)} registro(s) actualizado(s)',
+                'afectados': len(actualizados)
+            })
+        else:
+            return jsonify({'error': 'Supabase no está configurado'}), 500
+            
+    except Exception as e:
+        log.exception("Error al editar")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/sync', methods=['POST'])
+def sincronizar():
+    """Intercambia cambios con la app de escritorio (ver sincronizacion.py).
+
+    Aplica las filas y borrados que sube el cliente (gana la última escritura)
+    y devuelve la página siguiente de cambios del servidor desde su versión.
+    """
+    finca = g.finca
+    try:
+        if not finca.repo:
+            return jsonify({'error': 'Supabase no está configurado'}), 500
+        
+        try:
+            data = decodificar(request.get_data(), request.headers.get('Content-Encoding'))
+            desde = int(data.get('desde') or 0)
+            limite = max(1, min(int(data.get('limite') or LOTE), LOTE_MAX))
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+        
+        filas, borrados, rechazados = [], [], []
+        # Las filas deben usar módulos del catálogo de la finca
+        for validar, entrantes, destino in ((partial(validar_fila, modulos=finca.catalogo), data.get('filas') or [], filas),
+                                            (validar_borrado, data.get('borrados') or [], borrados)):
+            if len(entrantes) > LOTE_MAX:
+                return jsonify({'error': f'Máximo {LOTE_MAX} cambios por viaje'}), 400
+            for entrante in entrantes:
+                try:
+                    destino.append(validar(entrante))
+                except (TypeError, ValueError) as e:
+                    rechazados.append({'uuid': entrante.get('uuid') if isinstance(entrante, dict) else None,
+                                       'error': str(e)})
+        
+        eliminados, insertados = [], []
+        if filas or borrados:
+            eliminados, insertados = finca.repo.aplicar_cambios(filas, borrados)
+            finca.propagar_cambios('eliminar', eliminados)
+            finca.propagar_cambios('insertar', insertados)
+        
+        cambios = finca.repo.cambios_desde(desde, limite)
+        log.info("Sincronización", extra={'datos': {
+            'subidos': len(filas) + len(borrados), 'rechazados': len(rechazados),
+            'bajados': len(cambios['filas']) + len(cambios['borrados']), 'version': cambios['version']}})
+        
+        # comprimir_respuesta devuelve la página con gzip o brotli
+        return jsonify({
+            'aplicados': len({fila['uuid'] for fila in eliminados + insertados}),
+            'rechazados': rechazados,
+            **cambios
+        })
+        
+    except Exception as e:
+        log.exception("Error al sincronizar")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/importar', methods=['POST'])
+def importar_archivo():
+    """Importa registros históricos de un CSV o XLSX (campo archivo del formulario).
+
+    Responde en NDJSON a medida que avanza: una línea por fila rechazada, una
+    de progreso por lote insertado y una final con los totales.
+    """
+    finca = g.finca
+    archivo = request.files.get('archivo')
+    if not archivo or not archivo.filename:
+        return jsonify({'error': 'Debe adjuntar un archivo'}), 400
+    if not archivo.filename.lower().endswith(EXTENSIONES):
+        return jsonify({'error': f"Formato no soportado, use {' o '.join(EXTENSIONES)}"}), 400
+    if not finca.repo:
+        return jsonify({'error': 'Supabase no está configurado'}), 500
+    
+    nombre = archivo.filename
+    # Flask cierra los archivos subidos al terminar la vista, antes de que el
+    # generador empiece a leer: se pasa a un temporal propio
+    copia = tempfile.TemporaryFile()
+    shutil.copyfileobj(archivo.stream, copia)
+    log.info("Importación iniciada", extra={'datos': {'finca': finca.id, 'archivo': nombre, 'bytes': copia.tell()}})
+    
+    def eventos():
+        try:
+            for evento in importar(finca.repo, copia, nombre, finca.catalogo.todos(),
+                                   al_insertar=lambda filas: finca.propagar_cambios('insertar', filas)):
+                if evento['tipo'] == 'fin':
+                    log.info("Importación terminada", extra={'datos': dict(evento, finca=finca.id, archivo=nombre)})
+                yield json.dumps(evento, ensure_ascii=False) + '\n'
+        except Exception as e:
+            # La respuesta ya empezó con 200: el fallo va como último evento
+            log.exception("Error al importar")
+            yield json.dumps({'tipo': 'fallo', 'error': str(e)}, ensure_ascii=False) + '\n'
+        finally:
+            copia.close()
+    
+    return Response(
+        stream_with_context(eventos()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 @app.route('/estadisticas')
 def estadisticas():
     """Obtiene estadísticas de riegos"""
+    finca = g.finca
     try:
-        if supabase:
+        if finca.repo:
             # Registros de hoy (fecha de Ecuador)
             fecha_hoy = get_fecha_ecuador()
-            hoy = supabase.table('riegos')\
-                .select('*', count='exact')\
-                .eq('fecha', fecha_hoy)\
-                .execute()
+            hoy = finca.contadores.de_fecha(fecha_hoy)
             
             # Total de registros
-            total = supabase.table('riegos')\
-                .select('*', count='exact')\
-                .execute()
+            total = finca.contadores.total()
             
-            return jsonify({
-                'registros_hoy': hoy.count if hoy.count else 0,
-                'total_registros': total.count if total.count else 0
+            # Los contadores ya están en memoria: el ETag sale del propio contenido
+            response = jsonify({
+                'registros_hoy': hoy,
+                'total_registros': total
             })
+            response.add_etag()
+            response.headers['Cache-Control'] = 'no-cache'
+            return response.make_conditional(request)
         else:
             return jsonify({'registros_hoy': 0, 'total_registros': 0})
             
     except Exception as e:
-        print(f"Error: {e}")
+        log.exception("Error en %s", request.path)
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/cola')
+def estado_cola():
+    """Estado de la cola de escritura: profundidad, retraso y último error"""
+    finca = g.finca
+    if not finca.cola_escritura:
+        return jsonify({'activa': False})
+    
+    return jsonify({'activa': True, **finca.cola_escritura.estado()})
+
+
+@app.route('/metrics')
+def metrics():
+    """Histogramas de latencia en formato de texto de Prometheus"""
+    return Response(metricas.exportar(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/eventos')
+def eventos():
+    """Canal SSE con los cambios de riegos (de una fecha o de todas)"""
+    finca = g.finca
+    fecha = request.args.get('fecha') or None
+    
+    return Response(
+        stream_with_context(finca.canal_eventos.flujo(fecha)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+def obtener_semana_solicitada():
+    """Lee el parámetro semana (formato 2025-50) o usa la semana actual de Ecuador.
+
+    Lanza ValueError si la semana no existe (2026-60, 2025-53) o no se entiende.
+    """
+    semana = request.args.get('semana')
+    
+    if not semana:
+        hoy = datetime.now(TIMEZONE_ECUADOR)
+        year, week_num, _ = hoy.isocalendar()
+        semana = f"{year}-{week_num:02d}"
+    
+    year, week_num = map(int, semana.split('-'))
+    # fromisocalendar rechaza semanas fuera del año ISO
+    date.fromisocalendar(year, week_num, 1)
+    return semana, year, week_num
+
+
 @app.route('/resumen-semanal')
 def resumen_semanal():
     """Obtiene resumen semanal de riegos"""
+    finca = g.finca
     try:
-        # Diccionario para traducir días
-        dias_espanol = {
-            'Monday': 'Lunes',
-            'Tuesday': 'Martes',
-            'Wednesday': 'Miércoles',
-            'Thursday': 'Jueves',
-            'Friday': 'Viernes',
-            'Saturday': 'Sábado',
-            'Sunday': 'Domingo'
-        }
-        
-        semana = request.args.get('semana')  # formato: 2025-50
-        
-        if not semana:
-            # Si no se especifica, usar la semana actual de Ecuador
-            hoy = datetime.now(TIMEZONE_ECUADOR)
-            year, week_num, _ = hoy.isocalendar()
-            semana = f"{year}-{week_num:02d}"
-        
-        # Parsear año y semana
-        year, week_num = map(int, semana.split('-'))
-        
-        # Calcular fecha de inicio y fin de la semana
-        first_day_of_year = datetime(year, 1, 1)
-        days_to_monday = (first_day_of_year.weekday()) % 7
-        first_monday = first_day_of_year - timedelta(days=days_to_monday)
-        week_start = first_monday + timedelta(weeks=week_num - 1)
-        week_end = week_start + timedelta(days=6)
-        
-        fecha_inicio = week_start.strftime('%Y-%m-%d')
-        fecha_fin = week_end.strftime('%Y-%m-%d')
-        
-        if supabase:
-            response = supabase.table('riegos')\
-                .select('*')\
-                .gte('fecha', fecha_inicio)\
-                .lte('fecha', fecha_fin)\
-                .execute()
-            
-            registros = response.data
-            
-            # Procesar datos para el resumen
-            resumen = {}
-            for reg in registros:
-                fecha_obj = datetime.strptime(reg['fecha'], '%Y-%m-%d')
-                dia_ingles = fecha_obj.strftime('%A')
-                dia_espanol = dias_espanol.get(dia_ingles, dia_ingles)
-                dia = f"{dia_espanol} {fecha_obj.strftime('%d/%m')}"
-                modulo = reg['modulo']
-                tipo = reg['tipo_riego']
-                
-                key = f"{fecha_obj.strftime('%Y-%m-%d')}|{modulo}"
-                
-                if key not in resumen:
-                    resumen[key] = {
-                        'fecha': reg['fecha'],
-                        'dia': dia,
-                        'modulo': modulo,
-                        'agua': False,
-                        'comida': False,
-                        'semana': f"{year}{week_num:02d}"
-                    }
-                
-                if tipo == 'agua':
-                    resumen[key]['agua'] = True
-                elif tipo == 'comida':
-                    resumen[key]['comida'] = True
-            
-            # Convertir a lista y ordenar
-            resultado = sorted(resumen.values(), key=lambda x: (x['fecha'], x['modulo']))
-            
+        try:
+            semana, year, week_num = obtener_semana_solicitada()
+        except ValueError:
+            return jsonify({'error': 'Semana inválida, use semana=YYYY-WW'}), 400
+        
+        if finca.repo:
             return jsonify({
                 'semana': semana,
-                'datos': resultado
+                'datos': finca.motor_resumen.obtener(year, week_num)
             })
         else:
             return jsonify({'semana': semana, 'datos': []})
             
     except Exception as e:
-        print(f"Error: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Error en %s", request.path)
+        return jsonify({'error': str(e)}), 500
+
+
+ANALITICA_DIAS_DEFECTO = 90
+ANALITICA_MAX_DIAS = 366
+
+
+@app.route('/analitica-temporada')
+def analitica_temporada():
+    """Matrices módulo × día de un rango (por defecto los últimos 90 días) para mapas de calor"""
+    finca = g.finca
+    try:
+        hasta = date.fromisoformat(request.args['hasta']) if request.args.get('hasta') \
+            else date.fromisoformat(get_fecha_ecuador())
+        desde = date.fromisoformat(request.args['desde']) if request.args.get('desde') \
+            else hasta - timedelta(days=ANALITICA_DIAS_DEFECTO - 1)
+    except ValueError:
+        return jsonify({'error': 'Fechas inválidas, use desde=YYYY-MM-DD&hasta=YYYY-MM-DD'}), 400
+    
+    if hasta < desde:
+        return jsonify({'error': 'La fecha hasta debe ser posterior a desde'}), 400
+    if (hasta - desde).days + 1 > ANALITICA_MAX_DIAS:
+        return jsonify({'error': f'El rango no puede superar {ANALITICA_MAX_DIAS} días'}), 400
+    
+    if not finca.repo:
+        return jsonify({'error': 'Supabase no está configurado'}), 500
+    
+    etag = finca.versiones.etag('historial', variante=f'analitica-{finca.catalogo.version}-{request.query_string.decode()}')
+    no_modificada = respuesta_no_modificada(etag)
+    if no_modificada:
+        return no_modificada
+    
+    try:
+        q = request.args.get('q', '')
+        datos = analizar_temporada(finca.repo, desde, hasta, finca.catalogo.buscar(q),
+                                   diario=finca.resumen_diario, incluir_extra=not q)
+        return con_etag(jsonify(datos), etag)
+    except Exception as e:
+        log.exception("Error en %s", request.path)
         return jsonify({'error': str(e)}), 500
 
 
 @app.route('/exportar-excel')
 def exportar_excel():
-    """Exporta el resumen semanal a Excel"""
+    """Exporta el resumen semanal a Excel (o un rango con desde/hasta)"""
+    finca = g.finca
     try:
-        # Diccionario para traducir días
-        dias_espanol = {
-            'Monday': 'Lunes',
-            'Tuesday': 'Martes',
-            'Wednesday': 'Miércoles',
-            'Thursday': 'Jueves',
-            'Friday': 'Viernes',
-            'Saturday': 'Sábado',
-            'Sunday': 'Domingo'
-        }
-        
-        semana = request.args.get('semana')
-        
-        if not semana:
-            hoy = datetime.now(TIMEZONE_ECUADOR)
-            year, week_num, _ = hoy.isocalendar()
-            semana = f"{year}-{week_num:02d}"
-        
-        # Obtener datos del resumen
-        year, week_num = map(int, semana.split('-'))
-        first_day_of_year = datetime(year, 1, 1)
-        days_to_monday = (first_day_of_year.weekday()) % 7
-        first_monday = first_day_of_year - timedelta(days=days_to_monday)
-        week_start = first_monday + timedelta(weeks=week_num - 1)
-        week_end = week_start + timedelta(days=6)
-        
-        fecha_inicio = week_start.strftime('%Y-%m-%d')
-        fecha_fin = week_end.strftime('%Y-%m-%d')
-        
-        if supabase:
-            response = supabase.table('riegos')\
-                .select('*')\
-                .gte('fecha', fecha_inicio)\
-                .lte('fecha', fecha_fin)\
-                .execute()
-            
-            registros = response.data
+        if request.args.get('desde') or request.args.get('hasta'):
+            return exportar_excel_rango()
+        
+        try:
+            semana, year, week_num = obtener_semana_solicitada()
+        except ValueError:
+            return jsonify({'error': 'Semana inválida, use semana=YYYY-WW'}), 400
+        
+        if finca.repo:
+            datos = finca.motor_resumen.obtener(year, week_num)
             
             # Crear Excel
             wb = Workbook()
@@ -492,36 +1015,7 @@ def exportar_excel():
                 cell.font = header_font
                 cell.alignment = Alignment(horizontal='center', vertical='center')
             
-            # Procesar datos
-            resumen = {}
-            for reg in registros:
-                fecha_obj = datetime.strptime(reg['fecha'], '%Y-%m-%d')
-                dia_ingles = fecha_obj.strftime('%A')
-                dia_espanol_nom = dias_espanol.get(dia_ingles, dia_ingles)
-                dia = f"{dia_espanol_nom} {fecha_obj.strftime('%d/%m')}"
-                modulo = reg['modulo']
-                tipo = reg['tipo_riego']
-                
-                key = f"{fecha_obj.strftime('%Y-%m-%d')}|{modulo}"
-                
-                if key not in resumen:
-                    resumen[key] = {
-                        'fecha': reg['fecha'],
-                        'dia': dia,
-                        'modulo': modulo,
-                        'agua': False,
-                        'comida': False,
-                        'semana': f"{year}{week_num:02d}"
-                    }
-                
-                if tipo == 'agua':
-                    resumen[key]['agua'] = True
-                elif tipo == 'comida':
-                    resumen[key]['comida'] = True
-            
             # Escribir datos
-            datos = sorted(resumen.values(), key=lambda x: (x['fecha'], x['modulo']))
-            
             for idx, item in enumerate(datos, 2):
                 ws.cell(row=idx, column=1, value=item['semana'])
                 ws.cell(row=idx, column=2, value=item['dia'])
@@ -551,12 +1045,94 @@ def exportar_excel():
             return jsonify({'error': 'Supabase no está configurado'}), 500
             
     except Exception as e:
-        print(f"Error: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Error en %s", request.path)
         return jsonify({'error': str(e)}), 500
 
 
+def exportar_excel_rango():
+    """Exporta en streaming el resumen de un rango de fechas, una hoja por semana"""
+    finca = g.finca
+    try:
+        desde = date.fromisoformat(request.args.get('desde', ''))
+        hasta = date.fromisoformat(request.args.get('hasta', ''))
+    except ValueError:
+        return jsonify({'error': 'Fechas inválidas, use desde=YYYY-MM-DD&hasta=YYYY-MM-DD'}), 400
+    
+    if hasta < desde:
+        return jsonify({'error': 'La fecha hasta debe ser posterior a desde'}), 400
+    
+    if not finca.repo:
+        return jsonify({'error': 'Supabase no está configurado'}), 500
+    
+    nombre = f'resumen_riegos_{desde.isoformat()}_{hasta.isoformat()}.xlsx'
+    return Response(
+        stream_with_context(generar_excel_rango(finca.motor_resumen, desde, hasta)),
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        headers={'Content-Disposition': f'attachment; filename={nombre}'}
+    )
+
+
+@app.route('/exportar')
+def exportar():
+    """Descarga en streaming los registros crudos de un rango (CSV o NDJSON).
+
+    desde y hasta son opcionales: sin ellos se exporta todo el historial.
+    """
+    finca = g.finca
+    formato = request.args.get('formato', 'csv')
+    if formato not in FORMATOS_CRUDOS:
+        return jsonify({'error': f"Formato inválido, use {' o '.join(FORMATOS_CRUDOS)}"}), 400
+    
+    try:
+        desde = date.fromisoformat(request.args['desde']) if request.args.get('desde') else None
+        hasta = date.fromisoformat(request.args['hasta']) if request.args.get('hasta') else None
+    except ValueError:
+        return jsonify({'error': 'Fechas inválidas, use desde=YYYY-MM-DD&hasta=YYYY-MM-DD'}), 400
+    
+    if desde and hasta and hasta < desde:
+        return jsonify({'error': 'La fecha hasta debe ser posterior a desde'}), 400
+    
+    if not finca.repo:
+        return jsonify({'error': 'Supabase no está configurado'}), 500
+    
+    nombre = f"riegos_{desde or 'inicio'}_{hasta or 'hoy'}.{formato}"
+    headers = {
+        'Content-Disposition': f'attachment; filename={nombre}',
+        'X-Accel-Buffering': 'no',
+        'Vary': 'Accept-Encoding',
+    }
+    partes = generar_crudos(finca.repo, desde, hasta, formato)
+    # comprimir_respuesta no toca las respuestas en streaming: se comprime aquí por trozos
+    codificacion = elegir_codificacion()
+    if codificacion:
+        partes = comprimir_flujo(partes, codificacion)
+        headers['Content-Encoding'] = codificacion
+    
+    return Response(
+        stream_with_context(partes),
+        mimetype=FORMATOS_CRUDOS[formato],
+        headers=headers
+    )
+
+
+@app.cli.command('recalcular-resumen')
+@click.option('--desde', default=None, help='Primera fecha a recalcular (YYYY-MM-DD)')
+@click.option('--hasta', default=None, help='Última fecha a recalcular (YYYY-MM-DD)')
+@click.option('--finca', 'finca_id', default=None, help='Solo esta finca (por defecto todas)')
+def recalcular_resumen(desde, hasta, finca_id):
+    """Rellena riegos_resumen_diario con el historial existente de riegos"""
+    if finca_id and finca_id not in fincas:
+        raise click.ClickException(f'Finca desconocida: {finca_id}')
+    for valor in (desde, hasta):
+        if valor:
+            date.fromisoformat(valor)
+    for finca in ([fincas[finca_id]] if finca_id else fincas.values()):
+        if not finca.repo:
+            raise click.ClickException('No hay almacenamiento configurado')
+        filas = finca.repo.recalcular_resumen_diario(desde, hasta)
+        click.echo(f'Resumen diario recalculado ({finca.id}): {filas} filas (fecha, módulo)')
+
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=True)
@@ -0,0 +1,286 @@
+"""Prueba de carga de app.py contra el PostgREST falso.
+
+Arranca el PostgREST falso sobre la base sembrada, levanta la app con gunicorn
+apuntando a él como si fuera Supabase y lanza clientes concurrentes contra
+cada escenario. Informa peticiones por segundo, p50/p95/p99 y el tiempo medio
+de base que la app declara en Server-Timing.
+
+Con --salida se guardan los resultados en JSON; con --base se comparan contra
+una corrida anterior y el proceso termina con código 1 si algún p95 empeoró
+más que la tolerancia, para usarlo antes de cada despliegue.
+
+Uso:
+    python bench/sembrar.py --anios 3
+    python bench/carga.py --clientes 32 --duracion 20 --latencia 30 --salida base.json
+    python bench/carga.py --clientes 32 --duracion 20 --latencia 30 --base base.json
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import re
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from urllib.parse import urlsplit
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from postgrest_falso import crear_servidor  # noqa: E402
+from sembrar import leer_modulos  # noqa: E402
+
+DB_DUR = re.compile(r'db;dur=([\d.]+)')
+
+
+class Contexto:
+    """Datos sembrados que usan los escenarios para armar peticiones"""
+
+    def __init__(self, ruta_db):
+        conn = sqlite3.connect(ruta_db)
+        self.desde, self.hasta = (date.fromisoformat(f) for f in conn.execute(
+            'SELECT MIN(fecha), MAX(fecha) FROM riegos').fetchone())
+        conn.close()
+        self.modulos = leer_modulos()
+        self.dias = (self.hasta - self.desde).days
+
+    def fecha(self, azar):
+        return date.fromordinal(self.desde.toordinal() + azar.randrange(self.dias + 1))
+
+    def semana(self, azar):
+        year, week, _ = self.fecha(azar).isocalendar()
+        return f'{year}-{week:02d}'
+
+
+def registrar(ctx, azar, estado):
+    cuerpo = {
+        'modulos': azar.sample(ctx.modulos, azar.randint(1, 5)),
+        'tipos_riego': azar.choice((['agua'], ['comida'], ['agua', 'comida'])),
+        'sistema_riego': azar.choice(('ducha', 'goteo')),
+        'tiempo_minutos': azar.choice((10, 15, 30)),
+        'fecha': ctx.hasta.isoformat(),
+    }
+    return 'POST', '/registrar', cuerpo
+
+
+def registros_hoy(ctx, azar, estado):
+    return 'GET', f'/registros-hoy?fecha={ctx.fecha(azar).isoformat()}', None
+
+
+def historial_completo(ctx, azar, estado):
+    # Cada cliente recorre unas páginas hacia atrás y vuelve a empezar
+    cursor = estado.get('siguiente')
+    if cursor and estado.get('paginas', 0) < 20:
+        estado['paginas'] = estado.get('paginas', 0) + 1
+        return 'GET', f'/historial-completo?limite=100&cursor={cursor}', None
+    estado['paginas'] = 0
+    return 'GET', '/historial-completo?limite=100', None
+
+
+def resumen_semanal(ctx, azar, estado):
+    return 'GET', f'/resumen-semanal?semana={ctx.semana(azar)}', None
+
+
+def exportar_excel(ctx, azar, estado):
+    return 'GET', f'/exportar-excel?semana={ctx.semana(azar)}', None
+
+
+ESCENARIOS = {
+    'registrar': registrar,
+    'registros-hoy': registros_hoy,
+    'historial-completo': historial_completo,
+    'resumen-semanal': resumen_semanal,
+    'exportar-excel': exportar_excel,
+}
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, max(0, round(p / 100 * len(ordenados)) - 1))
+    return ordenados[indice]
+
+
+def cliente(url, generador, ctx, fin, semilla):
+    """Un cliente con conexión persistente que repite peticiones hasta fin"""
+    partes = urlsplit(url)
+    conn = http.client.HTTPConnection(partes.hostname, partes.port, timeout=60)
+    azar = random.Random(semilla)
+    estado = {}
+    latencias, db, errores = [], [], 0
+    while time.perf_counter() < fin:
+        metodo, ruta, cuerpo = generador(ctx, azar, estado)
+        datos = json.dumps(cuerpo).encode() if cuerpo is not None else None
+        encabezados = {'Content-Type': 'application/json'} if datos else {}
+        inicio = time.perf_counter()
+        try:
+            conn.request(metodo, ruta, body=datos, headers=encabezados)
+            respuesta = conn.getresponse()
+            contenido = respuesta.read()
+        except (OSError, http.client.HTTPException):
+            errores += 1
+            conn.close()
+            continue
+        latencias.append(time.perf_counter() - inicio)
+        if respuesta.status >= 400:
+            errores += 1
+            continue
+        medida = DB_DUR.search(respuesta.getheader('Server-Timing') or '')
+        if medida:
+            db.append(float(medida.group(1)))
+        if generador is historial_completo:
+            estado['siguiente'] = json.loads(contenido).get('siguiente')
+    conn.close()
+    return latencias, db, errores
+
+
+def correr_escenario(url, nombre, ctx, clientes, duracion):
+    fin = time.perf_counter() + duracion
+    with ThreadPoolExecutor(max_workers=clientes) as pool:
+        futuros = [pool.submit(cliente, url, ESCENARIOS[nombre], ctx, fin, i)
+                   for i in range(clientes)]
+        resultados = [f.result() for f in futuros]
+    latencias = [x for r in resultados for x in r[0]]
+    db = [x for r in resultados for x in r[1]]
+    return {
+        'peticiones': len(latencias),
+        'errores': sum(r[2] for r in resultados),
+        'rps': round(len(latencias) / duracion, 1),
+        'p50_ms': round(percentil(latencias, 50) * 1000, 1),
+        'p95_ms': round(percentil(latencias, 95) * 1000, 1),
+        'p99_ms': round(percentil(latencias, 99) * 1000, 1),
+        'db_media_ms': round(statistics.fmean(db), 1) if db else None,
+    }
+
+
+def esperar_app(url, proceso, ctx, plazo=30):
+    """Espera a que la app responda y comprueba que ve los datos sembrados"""
+    partes = urlsplit(url)
+    limite = time.time() + plazo
+    while time.time() < limite:
+        if proceso and proceso.poll() is not None:
+            raise RuntimeError('La app terminó al arrancar')
+        try:
+            conn = http.client.HTTPConnection(partes.hostname, partes.port, timeout=10)
+            conn.request('GET', f'/registros-hoy?fecha={ctx.hasta.isoformat()}')
+            respuesta = conn.getresponse()
+            contenido = respuesta.read()
+            break
+        except OSError:
+            time.sleep(0.2)
+    else:
+        raise RuntimeError('La app no respondió a tiempo')
+    # Sin repositorio la app responde listas vacías y la medición no sirve
+    if respuesta.status != 200 or not json.loads(contenido):
+        raise RuntimeError(f'La app no ve los datos sembrados (status {respuesta.status}); '
+                           'revise su log de arranque')
+
+
+def levantar_app(url_postgrest, puerto, modo, directorio):
+    entorno = {
+        **os.environ,
+        'BACKEND_DATOS': 'supabase',
+        'SUPABASE_URL': url_postgrest,
+        'SUPABASE_KEY': 'bench.bench.bench',
+        'GUNICORN_MODO': modo,
+        'IDEMPOTENCIA_RUTA': os.path.join(directorio, 'idempotencia.db'),
+        'COLA_RUTA': os.path.join(directorio, 'cola.db'),
+        'LOG_LEVEL': os.environ.get('LOG_LEVEL', 'WARNING'),
+    }
+    return subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+         '-b', f'127.0.0.1:{puerto}', 'app:app'],
+        cwd=RAIZ, env=entorno)
+
+
+def imprimir(resultados):
+    columnas = ('peticiones', 'errores', 'rps', 'p50_ms', 'p95_ms', 'p99_ms', 'db_media_ms')
+    print(f"{'escenario':<20}" + ''.join(f'{c:>12}' for c in columnas))
+    for nombre, fila in resultados.items():
+        print(f'{nombre:<20}' + ''.join(f"{'-' if fila[c] is None else fila[c]:>12}" for c in columnas))
+
+
+def comparar(resultados, base, tolerancia):
+    """Devuelve los escenarios cuyo p95 empeoró más que la tolerancia"""
+    regresiones = []
+    for nombre, fila in resultados.items():
+        previa = base.get(nombre)
+        if previa and previa['p95_ms'] and fila['p95_ms'] > previa['p95_ms'] * (1 + tolerancia):
+            regresiones.append(f"{nombre}: p95 {previa['p95_ms']} → {fila['p95_ms']} ms")
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default=os.path.join(RAIZ, 'bench', 'riegos_bench.db'))
+    parser.add_argument('--escenarios', default=','.join(ESCENARIOS))
+    parser.add_argument('--clientes', type=int, default=16)
+    parser.add_argument('--duracion', type=float, default=10, help='segundos por escenario')
+    parser.add_argument('--latencia', type=float, default=20, help='ms por llamada al PostgREST falso')
+    parser.add_argument('--jitter', type=float, default=10)
+    parser.add_argument('--modo', default='gthread', help='GUNICORN_MODO de la app')
+    parser.add_argument('--puerto', type=int, default=8765)
+    parser.add_argument('--app-url', help='probar una app ya levantada en lugar de arrancarla')
+    parser.add_argument('--salida', help='guardar los resultados en este JSON')
+    parser.add_argument('--base', help='JSON de una corrida anterior para comparar')
+    parser.add_argument('--tolerancia', type=float, default=0.2)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        parser.error(f'No existe {args.db}; siémbrela con bench/sembrar.py')
+    nombres = [n.strip() for n in args.escenarios.split(',') if n.strip()]
+    for nombre in nombres:
+        if nombre not in ESCENARIOS:
+            parser.error(f'Escenario desconocido: {nombre}')
+
+    ctx = Contexto(args.db)
+    servidor = proceso = None
+    directorio = tempfile.mkdtemp(prefix='riegos_bench_')
+    try:
+        url = args.app_url
+        if not url:
+            servidor = crear_servidor(args.db, 0, args.latencia, args.jitter)
+            threading.Thread(target=servidor.serve_forever, daemon=True).start()
+            url_postgrest = f'http://127.0.0.1:{servidor.server_address[1]}'
+            proceso = levantar_app(url_postgrest, args.puerto, args.modo, directorio)
+            url = f'http://127.0.0.1:{args.puerto}'
+        esperar_app(url, proceso, ctx)
+
+        print(f'{len(ctx.modulos)} módulos, datos del {ctx.desde} al {ctx.hasta}; '
+              f'{args.clientes} clientes, {args.duracion:g} s por escenario, '
+              f'latencia {args.latencia:g}±{args.jitter:g} ms')
+        resultados = {n: correr_escenario(url, n, ctx, args.clientes, args.duracion) for n in nombres}
+        imprimir(resultados)
+    finally:
+        if proceso:
+            proceso.terminate()
+            try:
+                proceso.wait(10)
+            except subprocess.TimeoutExpired:
+                proceso.kill()
+        if servidor:
+            servidor.shutdown()
+
+    if args.salida:
+        with open(args.salida, 'w') as archivo:
+            json.dump(resultados, archivo, indent=2)
+    if args.base:
+        with open(args.base) as archivo:
+            regresiones = comparar(resultados, json.load(archivo), args.tolerancia)
+        for linea in regresiones:
+            print(f'REGRESIÓN {linea}')
+        if regresiones:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
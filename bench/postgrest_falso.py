@@ -0,0 +1,370 @@
+"""Imitación local de la API de tablas de Supabase (PostgREST) sobre SQLite.
+
+Entiende lo que usa RepositorioSupabase: select, filtros eq/neq/gt/gte/lt/lte/in,
+or=(...) con and(...) anidado, order, limit, offset, Prefer: count=exact,
+inserciones, actualizaciones y borrados con return=representation, y las
+funciones rpc/reemplazar_modulo_dia, rpc/recalcular_resumen_diario,
+rpc/riegos_cambios_desde y rpc/riegos_aplicar_cambios. Cada
+respuesta puede demorarse una latencia fija más un jitter para simular el
+viaje a Supabase. La tabla riegos_resumen_diario se mantiene con los mismos
+triggers que en SQLite. Como el backend SQLite de la app, guarda cada finca
+(filtro finca_id, o p_finca_id en las rpc) en su propio archivo.
+
+Uso:
+    python bench/postgrest_falso.py --db bench/riegos_bench.db --latencia 30
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from almacenamiento import RepositorioSQLite, OPERADORES  # noqa: E402
+from fincas import ruta_por_finca  # noqa: E402
+
+PREFIJO_REST = '/rest/v1/'
+PARAMETROS_RESERVADOS = {'select', 'order', 'limit', 'offset', 'or', 'and', 'columns', 'on_conflict'}
+
+
+class ConsultaInvalida(Exception):
+    """La consulta no se puede traducir a SQL (PostgREST responde 400)"""
+
+
+def _valor(texto):
+    """Valor literal de un filtro: quita las comillas dobles de PostgREST"""
+    if len(texto) >= 2 and texto[0] == '"' and texto[-1] == '"':
+        return texto[1:-1].replace('\\"', '"')
+    return texto
+
+
+def _partir(texto):
+    """Separa por comas de primer nivel, respetando paréntesis y comillas"""
+    partes, actual, nivel, en_comillas = [], [], 0, False
+    for caracter in texto:
+        if caracter == '"':
+            en_comillas = not en_comillas
+        elif not en_comillas and caracter == '(':
+            nivel += 1
+        elif not en_comillas and caracter == ')':
+            nivel -= 1
+        elif not en_comillas and nivel == 0 and caracter == ',':
+            partes.append(''.join(actual))
+            actual = []
+            continue
+        actual.append(caracter)
+    if actual:
+        partes.append(''.join(actual))
+    return partes
+
+
+class TraductorSQL:
+    """Traduce parámetros de PostgREST a fragmentos SQL sobre una tabla"""
+
+    def __init__(self, columnas):
+        self.columnas = columnas
+
+    def columna(self, nombre):
+        if nombre not in self.columnas:
+            raise ConsultaInvalida(f'Columna desconocida: {nombre}')
+        return f'"{nombre}"'
+
+    def condicion(self, columna, expresion):
+        """Condición SQL de 'op.valor' aplicado a columna"""
+        negada = expresion.startswith('not.')
+        if negada:
+            expresion = expresion[4:]
+        operador, _, valor = expresion.partition('.')
+        sql_columna = self.columna(columna)
+        if operador == 'in':
+            if not (valor.startswith('(') and valor.endswith(')')):
+                raise ConsultaInvalida(f'Lista inválida: {valor}')
+            valores = [_valor(v) for v in _partir(valor[1:-1])]
+            if not valores:
+                sql, parametros = '0', []
+            else:
+                sql = f'{sql_columna} IN ({", ".join("?" * len(valores))})'
+                parametros = valores
+        elif operador == 'is':
+            sql, parametros = f'{sql_columna} IS {"NULL" if valor == "null" else "NOT NULL"}', []
+        elif operador in OPERADORES:
+            sql, parametros = f'{sql_columna} {OPERADORES[operador]} ?', [_valor(valor)]
+        else:
+            raise ConsultaInvalida(f'Operador no soportado: {operador}')
+        return (f'NOT ({sql})' if negada else sql), parametros
+
+    def logica(self, union, texto):
+        """Condición de or=(...)/and=(...), con grupos anidados"""
+        if not (texto.startswith('(') and texto.endswith(')')):
+            raise ConsultaInvalida(f'Grupo lógico inválido: {texto}')
+        condiciones, parametros = [], []
+        for parte in _partir(texto[1:-1]):
+            for anidada in ('and', 'or'):
+                if parte.startswith(anidada + '('):
+                    sql, params = self.logica(anidada, parte[len(anidada):])
+                    break
+            else:
+                columna, _, expresion = parte.partition('.')
+                sql, params = self.condicion(columna, expresion)
+            condiciones.append(f'({sql})')
+            parametros.extend(params)
+        return f' {union.upper()} '.join(condiciones), parametros
+
+    def where(self, parametros_url):
+        condiciones, parametros = [], []
+        for clave, valor in parametros_url:
+            if clave in ('or', 'and'):
+                sql, params = self.logica(clave, valor)
+            elif clave in PARAMETROS_RESERVADOS:
+                continue
+            else:
+                sql, params = self.condicion(clave, valor)
+            condiciones.append(f'({sql})')
+            parametros.extend(params)
+        return (f" WHERE {' AND '.join(condiciones)}" if condiciones else ''), parametros
+
+    def select(self, texto):
+        if not texto or texto.strip() == '*':
+            return '*'
+        return ', '.join(self.columna(c.strip()) for c in texto.split(',') if c.strip())
+
+    def order(self, valores):
+        terminos = []
+        for valor in valores:
+            for termino in valor.split(','):
+                columna, *modificadores = termino.split('.')
+                direccion = 'DESC' if 'desc' in modificadores else 'ASC'
+                terminos.append(f'{self.columna(columna)} {direccion}')
+        return f" ORDER BY {', '.join(terminos)}" if terminos else ''
+
+
+class PostgRESTFalso:
+    """Estado del servidor: base SQLite, latencia y contadores de llamadas"""
+
+    def __init__(self, ruta, latencia_ms=0.0, jitter_ms=0.0, finca_defecto='principal'):
+        self.ruta = ruta
+        self.finca_defecto = finca_defecto
+        self.repo = RepositorioSQLite(ruta)
+        self._repos = {finca_defecto: self.repo}
+        self.latencia = latencia_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.llamadas = 0
+        self._lock = threading.Lock()
+        self._columnas = {}
+
+    def repo_de(self, finca_id=None):
+        """Repositorio de una finca (la por defecto si no se indica)"""
+        finca_id = finca_id or self.finca_defecto
+        with self._lock:
+            repo = self._repos.get(finca_id)
+            if repo is None:
+                repo = self._repos[finca_id] = RepositorioSQLite(
+                    ruta_por_finca(self.ruta, finca_id, self.finca_defecto))
+        return repo
+
+    def esperar(self):
+        with self._lock:
+            self.llamadas += 1
+        if self.latencia or self.jitter:
+            time.sleep(self.latencia + random.uniform(0, self.jitter))
+
+    def traductor(self, tabla):
+        if not re.fullmatch(r'[a-z_][a-z0-9_]*', tabla):
+            raise ConsultaInvalida(f'Tabla inválida: {tabla}')
+        columnas = self._columnas.get(tabla)
+        if columnas is None:
+            filas = self.repo._ejecutar(f'PRAGMA table_info("{tabla}")')
+            if not filas:
+                raise ConsultaInvalida(f'Tabla desconocida: {tabla}')
+            columnas = self._columnas[tabla] = {fila['name'] for fila in filas}
+        return TraductorSQL(columnas)
+
+    def seleccionar(self, tabla, parametros_url, contar, finca_id=None):
+        repo = self.repo_de(finca_id)
+        traductor = self.traductor(tabla)
+        todos = dict(parametros_url)
+        where, parametros = traductor.where(parametros_url)
+        sql = f'SELECT {traductor.select(todos.get("select"))} FROM "{tabla}"{where}'
+        sql += traductor.order([v for k, v in parametros_url if k == 'order'])
+        if 'limit' in todos:
+            sql += f' LIMIT {int(todos["limit"])}'
+            if 'offset' in todos:
+                sql += f' OFFSET {int(todos["offset"])}'
+        filas = repo._ejecutar(sql, parametros)
+        total = None
+        if contar:
+            total = repo._ejecutar(
+                f'SELECT COUNT(*) AS n FROM "{tabla}"{where}', parametros)[0]['n']
+        return filas, total
+
+    def insertar(self, tabla, cuerpo, finca_id=None):
+        registros = cuerpo if isinstance(cuerpo, list) else [cuerpo]
+        if not registros:
+            return []
+        traductor = self.traductor(tabla)
+        columnas = sorted({c for r in registros for c in r})
+        lista = ', '.join(traductor.columna(c) for c in columnas)
+        marcadores = ', '.join('?' * len(columnas))
+        insertados = []
+        with self.repo_de(finca_id)._transaccion() as conn:
+            for registro in registros:
+                cursor = conn.execute(
+                    f'INSERT INTO "{tabla}" ({lista}) VALUES ({marcadores}) RETURNING *',
+                    [registro.get(c) for c in columnas])
+                insertados.append(dict(cursor.fetchone()))
+        return insertados
+
+    def actualizar(self, tabla, parametros_url, valores, finca_id=None):
+        traductor = self.traductor(tabla)
+        where, parametros = traductor.where(parametros_url)
+        if not where:
+            raise ConsultaInvalida('UPDATE requiere un filtro')
+        asignaciones = ', '.join(f'{traductor.columna(c)} = ?' for c in valores)
+        return self.repo_de(finca_id)._ejecutar(
+            f'UPDATE "{tabla}" SET {asignaciones}{where} RETURNING *',
+            list(valores.values()) + parametros)
+
+    def eliminar(self, tabla, parametros_url, finca_id=None):
+        traductor = self.traductor(tabla)
+        where, parametros = traductor.where(parametros_url)
+        if not where:
+            raise ConsultaInvalida('DELETE requiere un filtro')
+        return self.repo_de(finca_id)._ejecutar(f'DELETE FROM "{tabla}"{where} RETURNING *', parametros)
+
+    def rpc(self, funcion, argumentos):
+        repo = self.repo_de(argumentos.get('p_finca_id'))
+        if funcion == 'reemplazar_modulo_dia':
+            eliminados, insertados = repo.reemplazar_modulo_dia(
+                argumentos['p_fecha'], argumentos['p_modulo'], argumentos['p_registros'])
+            return {'eliminados': eliminados, 'insertados': insertados}
+        if funcion == 'recalcular_resumen_diario':
+            return repo.recalcular_resumen_diario(
+                argumentos.get('p_desde'), argumentos.get('p_hasta'))
+        if funcion == 'riegos_cambios_desde':
+            return repo.cambios_desde(argumentos['p_version'], argumentos.get('p_limite', 1000))
+        if funcion == 'riegos_aplicar_cambios':
+            eliminados, insertados = repo.aplicar_cambios(
+                argumentos['p_filas'], argumentos['p_borrados'])
+            return {'eliminados': eliminados, 'insertados': insertados}
+        raise ConsultaInvalida(f'Función desconocida: {funcion}')
+
+
+class ManejadorPostgREST(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    estado = None  # PostgRESTFalso, asignado por crear_servidor
+
+    def log_message(self, formato, *args):
+        pass
+
+    def _responder(self, status, cuerpo=None, encabezados=()):
+        datos = b'' if cuerpo is None else json.dumps(cuerpo).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(datos)))
+        for clave, valor in encabezados:
+            self.send_header(clave, valor)
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def _cuerpo(self):
+        largo = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(largo) or b'null')
+
+    def _prefer(self):
+        return {p.strip() for p in self.headers.get('Prefer', '').split(',') if p.strip()}
+
+    def _atender(self, metodo):
+        partes = urlsplit(self.path)
+        if not partes.path.startswith(PREFIJO_REST):
+            return self._responder(404, {'message': 'Ruta desconocida'})
+        recurso = partes.path[len(PREFIJO_REST):]
+        parametros_url = parse_qsl(partes.query, keep_blank_values=True)
+        # El filtro de finca elige el archivo en lugar de ir al WHERE
+        fincas = {valor[3:] for clave, valor in parametros_url if clave == 'finca_id' and valor.startswith('eq.')}
+        parametros_url = [(clave, valor) for clave, valor in parametros_url if clave != 'finca_id']
+        finca_id = fincas.pop() if fincas else None
+        prefer = self._prefer()
+        self.estado.esperar()
+
+        try:
+            if recurso.startswith('rpc/'):
+                return self._responder(200, self.estado.rpc(recurso[4:], self._cuerpo()))
+            if metodo in ('GET', 'HEAD'):
+                filas, total = self.estado.seleccionar(
+                    recurso, parametros_url, 'count=exact' in prefer, finca_id)
+                encabezados = []
+                if total is not None:
+                    rango = f'0-{len(filas) - 1}' if filas else '*'
+                    encabezados.append(('Content-Range', f'{rango}/{total}'))
+                return self._responder(200, filas, encabezados)
+            if metodo == 'POST':
+                cuerpo = self._cuerpo()
+                registros = cuerpo if isinstance(cuerpo, list) else [cuerpo]
+                for registro in registros:
+                    finca_id = registro.pop('finca_id', None) or finca_id
+                filas = self.estado.insertar(recurso, registros, finca_id)
+                status = 201
+            elif metodo == 'PATCH':
+                filas = self.estado.actualizar(recurso, parametros_url, self._cuerpo(), finca_id)
+                status = 200
+            else:
+                filas = self.estado.eliminar(recurso, parametros_url, finca_id)
+                status = 200
+            if 'return=minimal' in prefer:
+                return self._responder(204)
+            return self._responder(status, filas)
+        except (ConsultaInvalida, ValueError, KeyError) as e:
+            return self._responder(400, {'message': str(e), 'code': 'PGRST100'})
+        except Exception as e:
+            return self._responder(500, {'message': f'{type(e).__name__}: {e}'})
+
+    def do_GET(self):
+        self._atender('GET')
+
+    def do_HEAD(self):
+        self._atender('HEAD')
+
+    def do_POST(self):
+        self._atender('POST')
+
+    def do_PATCH(self):
+        self._atender('PATCH')
+
+    def do_DELETE(self):
+        self._atender('DELETE')
+
+
+def crear_servidor(ruta, puerto=0, latencia_ms=0.0, jitter_ms=0.0):
+    """Crea (sin arrancar) el servidor; puerto 0 elige uno libre"""
+    estado = PostgRESTFalso(ruta, latencia_ms, jitter_ms)
+    manejador = type('Manejador', (ManejadorPostgREST,), {'estado': estado})
+    servidor = ThreadingHTTPServer(('127.0.0.1', puerto), manejador)
+    servidor.daemon_threads = True
+    servidor.estado = estado
+    return servidor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default='bench/riegos_bench.db')
+    parser.add_argument('--puerto', type=int, default=54321)
+    parser.add_argument('--latencia', type=float, default=0.0, help='ms fijos por llamada')
+    parser.add_argument('--jitter', type=float, default=0.0, help='ms aleatorios extra por llamada')
+    args = parser.parse_args()
+
+    servidor = crear_servidor(args.db, args.puerto, args.latencia, args.jitter)
+    print(f'PostgREST falso en http://127.0.0.1:{servidor.server_address[1]} ({args.db})')
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Siembra una base SQLite de prueba con datos realistas de riegos.
+
+Usa los módulos de modulos.csv y genera, para cada día del rango, riegos de
+agua casi a diario y de comida (fertilizante) dos o tres veces por semana,
+con el sistema y el tiempo que suele tener cada módulo.
+
+Uso:
+    python bench/sembrar.py --db bench/riegos_bench.db --anios 3
+"""
+import argparse
+import csv
+import os
+import random
+import sqlite3
+import sys
+from datetime import date, datetime, time, timedelta, timezone
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from almacenamiento import ESQUEMA_SQLITE  # noqa: E402
+
+ZONA_ECUADOR = timezone(timedelta(hours=-5))
+TIEMPOS = (5, 10, 15, 20, 30, 45, 60)
+
+
+def leer_modulos(ruta=os.path.join(RAIZ, 'modulos.csv')):
+    with open(ruta, newline='') as archivo:
+        return [fila['modulo'] for fila in csv.DictReader(archivo)]
+
+
+def generar_filas(modulos, desde, hasta, semilla=42):
+    """Genera tuplas (fecha, modulo, tipo_riego, sistema_riego, tiempo_minutos, timestamp)"""
+    azar = random.Random(semilla)
+    # Cada módulo tiene su sistema y tiempo habituales, con alguna excepción
+    habitos = {m: (azar.choice(('ducha', 'goteo')), azar.choice(TIEMPOS)) for m in modulos}
+    dia = desde
+    while dia <= hasta:
+        fecha = dia.isoformat()
+        for modulo in modulos:
+            sistema, tiempo = habitos[modulo]
+            if azar.random() < 0.1:
+                sistema, tiempo = azar.choice(('ducha', 'goteo')), azar.choice(TIEMPOS)
+            momento = datetime.combine(dia, time(6), ZONA_ECUADOR) + timedelta(
+                seconds=azar.randrange(10 * 3600))
+            timestamp = momento.isoformat()
+            if azar.random() < 0.85:
+                yield fecha, modulo, 'agua', sistema, tiempo, timestamp
+            if azar.random() < 0.35:
+                yield fecha, modulo, 'comida', sistema, tiempo, timestamp
+        dia += timedelta(days=1)
+
+
+def sembrar(ruta, anios=3, hasta=None, semilla=42):
+    """Crea la base en ruta (reemplazándola) y devuelve cuántas filas insertó"""
+    for sufijo in ('', '-wal', '-shm'):
+        if os.path.exists(ruta + sufijo):
+            os.remove(ruta + sufijo)
+    hasta = hasta or date.today()
+    desde = hasta - timedelta(days=365 * anios)
+    conn = sqlite3.connect(ruta)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(ESQUEMA_SQLITE)
+    with conn:
+        cursor = conn.executemany(
+            'INSERT INTO riegos (fecha, modulo, tipo_riego, sistema_riego, tiempo_minutos, timestamp) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            generar_filas(leer_modulos(), desde, hasta, semilla))
+    total = cursor.rowcount
+    conn.execute('ANALYZE')
+    conn.close()
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default='bench/riegos_bench.db')
+    parser.add_argument('--anios', type=float, default=3)
+    parser.add_argument('--hasta', type=date.fromisoformat, default=None,
+                        help='último día sembrado (YYYY-MM-DD, por defecto hoy)')
+    parser.add_argument('--semilla', type=int, default=42)
+    args = parser.parse_args()
+
+    total = sembrar(args.db, args.anios, args.hasta, args.semilla)
+    print(f'{total} registros sembrados en {args.db}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Catálogo de módulos de la finca leído de modulos.csv.
+
+Los módulos se ordenan en orden natural ('11', '11A', '12', ..., '100') y el
+archivo se vuelve a leer solo cuando cambia su fecha de modificación, así que
+editar el CSV no requiere reiniciar la app. Las búsquedas por prefijo usan
+bisect sobre una lista ordenada de claves en minúsculas y agrupan los
+resultados por bloque (la parte numérica inicial: 31, 31A, ..., 31G).
+"""
+import csv
+import logging
+import os
+import re
+import threading
+from bisect import bisect_left
+
+log = logging.getLogger('riegos.catalogo')
+
+MODULOS_POR_DEFECTO = ['11', '12', '13', '14', '15', '16', '21', '22', '23', '24']
+
+_PARTES = re.compile(r'(\d+)')
+_BLOQUE = re.compile(r'\d+')
+
+
+def clave_natural(modulo):
+    """Clave de orden natural: los tramos numéricos se comparan como números"""
+    return [int(parte) if i % 2 else parte.lower()
+            for i, parte in enumerate(_PARTES.split(modulo))]
+
+
+def bloque_de(modulo):
+    """Bloque de un módulo: su número inicial ('31G' -> '31'), o el módulo entero"""
+    coincidencia = _BLOQUE.match(modulo)
+    return coincidencia.group() if coincidencia else modulo
+
+
+class CatalogoModulos:
+    """Lista de módulos con recarga por mtime y búsqueda por prefijo"""
+
+    def __init__(self, ruta='modulos.csv'):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._mtime = None
+        self.version = 0
+        self._modulos = []
+        self._conjunto = frozenset()
+        self._claves = []  # (clave en minúsculas, módulo) en orden lexicográfico
+        self._vigente()
+
+    def _vigente(self):
+        try:
+            mtime = os.stat(self.ruta).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime == self._mtime and self._modulos:
+            return
+        with self._lock:
+            if mtime == self._mtime and self._modulos:
+                return
+            self._cargar(mtime)
+
+    def _cargar(self, mtime):
+        try:
+            with open(self.ruta, 'r', newline='') as archivo:
+                modulos = [fila['modulo'].strip() for fila in csv.DictReader(archivo)
+                           if fila.get('modulo') and fila['modulo'].strip()]
+        except Exception as e:
+            log.warning("Error cargando módulos", extra={'datos': {'ruta': self.ruta, 'error': repr(e)}})
+            modulos = [] if self._modulos else MODULOS_POR_DEFECTO
+        if not modulos:
+            # Un CSV vacío o ilegible no borra el catálogo que ya estaba cargado
+            modulos = self._modulos or MODULOS_POR_DEFECTO
+        unicos = sorted(set(modulos), key=clave_natural)
+        self._claves = sorted((m.lower(), m) for m in unicos)
+        self._conjunto = frozenset(unicos)
+        self._modulos = unicos
+        self._mtime = mtime
+        self.version += 1
+
+    def todos(self):
+        """Todos los módulos en orden natural"""
+        self._vigente()
+        return self._modulos
+
+    def __contains__(self, modulo):
+        self._vigente()
+        return modulo in self._conjunto
+
+    def __iter__(self):
+        return iter(self.todos())
+
+    def __len__(self):
+        return len(self.todos())
+
+    def buscar(self, prefijo='', limite=None):
+        """Módulos que empiezan con prefijo (sin distinguir mayúsculas), en orden natural"""
+        self._vigente()
+        prefijo = prefijo.strip().lower()
+        if not prefijo:
+            encontrados = self._modulos
+        else:
+            claves = self._claves
+            # Las claves con el prefijo forman un tramo contiguo de la lista ordenada
+            inicio = fin = bisect_left(claves, (prefijo,))
+            while fin < len(claves) and claves[fin][0].startswith(prefijo):
+                fin += 1
+            encontrados = [modulo for _, modulo in claves[inicio:fin]]
+            encontrados.sort(key=clave_natural)
+        return encontrados[:limite] if limite else list(encontrados)
+
+    @staticmethod
+    def agrupar(modulos):
+        """Agrupa módulos consecutivos del mismo bloque: [{'bloque', 'etiqueta', 'modulos'}]"""
+        grupos = []
+        for modulo in modulos:
+            bloque = bloque_de(modulo)
+            if grupos and grupos[-1]['bloque'] == bloque:
+                grupos[-1]['modulos'].append(modulo)
+            else:
+                grupos.append({'bloque': bloque, 'modulos': [modulo]})
+        for grupo in grupos:
+            miembros = grupo['modulos']
+            grupo['etiqueta'] = miembros[0] if len(miembros) == 1 else f'{miembros[0]}–{miembros[-1]}'
+        return grupos
@@ -0,0 +1,201 @@
+"""Cola de escritura durable para /registrar (write-behind).
+
+Cada envío se guarda primero en un diario SQLite local y se confirma al
+cliente en cuanto queda en disco. Un hilo de fondo vuelca los envíos
+pendientes al repositorio destino (Supabase) en lotes, juntando varios
+envíos por inserción, y reintenta con espera exponencial si el enlace cae.
+
+Los envíos se reclaman con un plazo (lease) antes de volcarlos, así que
+varios workers pueden compartir el mismo archivo sin volcar dos veces lo
+mismo. La entrega es al-menos-una-vez: si la base confirma la inserción pero
+la respuesta se pierde, el lote se reintenta. Por eso cada registro recibe su
+uuid al encolarse y el volcado ignora los uuid que ya existen: reintentar un
+lote ya insertado no duplica filas.
+"""
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+
+log = logging.getLogger('riegos.cola')
+
+ESQUEMA_COLA = '''
+    CREATE TABLE IF NOT EXISTS pendientes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        creado REAL NOT NULL,
+        cantidad INTEGER NOT NULL,
+        registros TEXT NOT NULL,
+        intentos INTEGER NOT NULL DEFAULT 0,
+        reclamado_por TEXT,
+        reclamado_hasta REAL NOT NULL DEFAULT 0
+    );
+'''
+
+
+class ColaEscritura:
+    """Diario local de envíos pendientes con volcado por lotes en segundo plano"""
+
+    def __init__(self, destino, ruta='cola_riegos.db', lote_max=500,
+                 espera_agrupar=0.2, espera_base=1.0, espera_max=60.0,
+                 plazo_reclamo=120.0, al_volcar=None):
+        self.destino = destino
+        self.ruta = ruta
+        self.lote_max = lote_max
+        self.espera_agrupar = espera_agrupar
+        self.espera_base = espera_base
+        self.espera_max = espera_max
+        self.plazo_reclamo = plazo_reclamo
+        self.al_volcar = al_volcar
+        self._token = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self._local = threading.local()
+        self._despertar = threading.Event()
+        self._detener = threading.Event()
+        self._hilo = None
+        self._fallos_seguidos = 0
+        self.ultimo_error = None
+        self.ultimo_volcado = None
+        self.volcados = 0
+        self._conexion().executescript(ESQUEMA_COLA)
+
+    def _conexion(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.ruta, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            # FULL: un envío confirmado al cliente tiene que sobrevivir a un corte de luz
+            conn.execute('PRAGMA synchronous=FULL')
+            conn.execute('PRAGMA busy_timeout=5000')
+            self._local.conn = conn
+        return conn
+
+    def encolar(self, registros):
+        """Guarda un envío en el diario y devuelve su id"""
+        registros = [dict(r, uuid=r.get('uuid') or str(uuid.uuid4())) for r in registros]
+        cursor = self._conexion().execute(
+            'INSERT INTO pendientes (creado, cantidad, registros) VALUES (?, ?, ?)',
+            (time.time(), len(registros), json.dumps(registros)))
+        self._despertar.set()
+        return cursor.lastrowid
+
+    def estado(self):
+        """Profundidad y retraso de la cola para /cola"""
+        envios, registros, mas_antiguo = self._conexion().execute(
+            'SELECT COUNT(*), COALESCE(SUM(cantidad), 0), MIN(creado) FROM pendientes'
+        ).fetchone()
+        return {
+            'envios_pendientes': envios,
+            'registros_pendientes': registros,
+            'retraso_segundos': round(time.time() - mas_antiguo, 3) if mas_antiguo else 0,
+            'fallos_seguidos': self._fallos_seguidos,
+            'ultimo_error': self.ultimo_error,
+            'ultimo_volcado': self.ultimo_volcado,
+            'registros_volcados': self.volcados,
+            'volcador_activo': bool(self._hilo and self._hilo.is_alive())
+        }
+
+    def iniciar(self):
+        """Arranca el hilo volcador (una vez por proceso)"""
+        if self._hilo and self._hilo.is_alive():
+            return
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._bucle, name='cola-escritura', daemon=True)
+        self._hilo.start()
+
+    def detener(self, espera=5):
+        self._detener.set()
+        self._despertar.set()
+        if self._hilo:
+            self._hilo.join(espera)
+
+    def _bucle(self):
+        while not self._detener.is_set():
+            self._despertar.wait(timeout=5)
+            self._despertar.clear()
+            if self._detener.is_set():
+                return
+            # Pequeña espera para juntar los envíos que llegan casi a la vez
+            time.sleep(self.espera_agrupar)
+            while not self._detener.is_set():
+                try:
+                    volcados = self.volcar_lote()
+                except Exception as e:
+                    self._fallos_seguidos += 1
+                    self.ultimo_error = f'{type(e).__name__}: {e}'
+                    log.warning("Fallo al volcar la cola de escritura",
+                                extra={'datos': {'error': self.ultimo_error, 'fallos': self._fallos_seguidos}})
+                    espera = min(self.espera_max, self.espera_base * 2 ** (self._fallos_seguidos - 1))
+                    self._detener.wait(espera * random.uniform(0.5, 1.0))
+                    continue
+                self._fallos_seguidos = 0
+                if not volcados:
+                    break
+
+    def _reclamar(self):
+        conn = self._conexion()
+        ahora = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            filas = conn.execute(
+                'SELECT id, cantidad, registros FROM pendientes '
+                'WHERE reclamado_hasta < ? ORDER BY id', (ahora,)).fetchall()
+            lote, total = [], 0
+            for id_, cantidad, registros in filas:
+                if lote and total + cantidad > self.lote_max:
+                    break
+                lote.append((id_, registros))
+                total += cantidad
+            if lote:
+                marcadores = ', '.join('?' * len(lote))
+                conn.execute(
+                    f'UPDATE pendientes SET reclamado_por = ?, reclamado_hasta = ?, '
+                    f'intentos = intentos + 1 WHERE id IN ({marcadores})',
+                    [self._token, ahora + self.plazo_reclamo] + [id_ for id_, _ in lote])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return lote
+
+    def volcar_lote(self):
+        """Vuelca un lote de envíos pendientes; devuelve cuántos registros insertó"""
+        lote = self._reclamar()
+        if not lote:
+            return 0
+
+        ids = [id_ for id_, _ in lote]
+        marcadores = ', '.join('?' * len(ids))
+        # Renovamos el reclamo justo antes de insertar: si entre tanto venció y
+        # otro worker tomó parte del lote, esa parte queda en sus manos
+        propios = {fila[0] for fila in self._conexion().execute(
+            f'UPDATE pendientes SET reclamado_hasta = ? '
+            f'WHERE id IN ({marcadores}) AND reclamado_por = ? RETURNING id',
+            [time.time() + self.plazo_reclamo] + ids + [self._token])}
+        lote = [(id_, datos) for id_, datos in lote if id_ in propios]
+        if not lote:
+            return 0
+        ids = [id_ for id_, _ in lote]
+        marcadores = ', '.join('?' * len(ids))
+        # Los envíos encolados antes de asignar uuid al encolar reciben uno aquí
+        registros = [dict(r, uuid=r.get('uuid') or str(uuid.uuid4()))
+                     for _, datos in lote for r in json.loads(datos)]
+        try:
+            insertados = self.destino.insertar(registros, ignorar_duplicados=True)
+        except Exception:
+            # Liberamos el reclamo para reintentar tras la espera
+            self._conexion().execute(
+                f'UPDATE pendientes SET reclamado_hasta = 0 WHERE id IN ({marcadores})', ids)
+            raise
+
+        self._conexion().execute(
+            f'DELETE FROM pendientes WHERE id IN ({marcadores}) AND reclamado_por = ?',
+            ids + [self._token])
+        self.volcados += len(registros)
+        self.ultimo_volcado = time.strftime('%Y-%m-%dT%H:%M:%S')
+        self.ultimo_error = None
+        if self.al_volcar:
+            self.al_volcar(insertados)
+        return len(registros)
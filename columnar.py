@@ -0,0 +1,89 @@
+"""Formato columnar compacto para las listas de riegos (?format=columnar).
+
+En vez de una lista de objetos que repiten claves y textos largos en cada
+fila, la respuesta trae un arreglo por columna. Las columnas de pocos valores
+distintos (módulo, tipo, sistema, fecha) van codificadas como índices sobre un
+diccionario que se envía una sola vez con las etiquetas ya formateadas.
+"""
+from datetime import datetime, timedelta, timezone
+
+# Ecuador continental no tiene horario de verano: un desfase fijo alcanza
+ZONA_ECUADOR = timezone(timedelta(hours=-5))
+
+ETIQUETAS_TIPO = {'agua': 'Agua', 'comida': 'Comida (Fertilizante)'}
+ETIQUETAS_SISTEMA = {'ducha': 'Ducha', 'goteo': 'Goteo'}
+
+
+def hora_ecuador(timestamp):
+    """Hora HH:MM:SS en Ecuador de un timestamp ISO (UTC si no trae zona)"""
+    try:
+        dt = datetime.fromisoformat(timestamp)
+    except (TypeError, ValueError):
+        return timestamp
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    dt = dt.astimezone(ZONA_ECUADOR)
+    return f'{dt.hour:02d}:{dt.minute:02d}:{dt.second:02d}'
+
+
+class Diccionario:
+    """Codifica valores repetidos como índices sobre una lista de valores únicos"""
+
+    def __init__(self):
+        self.valores = []
+        self._indices = {}
+
+    def codificar(self, valores):
+        indices = []
+        for valor in valores:
+            indice = self._indices.get(valor)
+            if indice is None:
+                indice = self._indices[valor] = len(self.valores)
+                self.valores.append(valor)
+            indices.append(indice)
+        return indices
+
+    def etiquetas(self, mapa):
+        return [mapa.get(valor, valor) for valor in self.valores]
+
+
+def registros_columnar(registros):
+    """Columnas de /registros-hoy a partir de las filas crudas de la base"""
+    fechas, modulos, tipos, sistemas = Diccionario(), Diccionario(), Diccionario(), Diccionario()
+    columnas = {
+        'n': len(registros),
+        'id': [reg['id'] for reg in registros],
+        'hora': [hora_ecuador(reg['timestamp']) for reg in registros],
+        'fecha': fechas.codificar(reg['fecha'] for reg in registros),
+        'modulo': modulos.codificar(reg['modulo'] for reg in registros),
+        'tipo_riego': tipos.codificar(reg['tipo_riego'] for reg in registros),
+        'sistema_riego': sistemas.codificar(reg.get('sistema_riego', 'N/A') for reg in registros),
+        'tiempo_minutos': [reg.get('tiempo_minutos', 0) for reg in registros],
+    }
+    columnas['diccionarios'] = {
+        'fecha': fechas.valores,
+        'modulo': modulos.valores,
+        # Todo lo que no es agua se muestra como comida, igual que el formato por filas
+        'tipo_riego': [ETIQUETAS_TIPO['agua'] if v == 'agua' else ETIQUETAS_TIPO['comida']
+                       for v in tipos.valores],
+        'sistema_riego': sistemas.etiquetas(ETIQUETAS_SISTEMA),
+    }
+    return columnas
+
+
+def historial_columnar(filas):
+    """Columnas de /historial-completo a partir de las filas ya formateadas"""
+    fechas, modulos, tipos = Diccionario(), Diccionario(), Diccionario()
+    return {
+        'n': len(filas),
+        'id': [fila['id'] for fila in filas],
+        'hora': [fila['hora'] for fila in filas],
+        'fecha': fechas.codificar(fila['fecha'] for fila in filas),
+        'modulo': modulos.codificar(fila['modulo'] for fila in filas),
+        'tipo_riego': tipos.codificar(fila['tipo_riego'] for fila in filas),
+        'diccionarios': {
+            'fecha': fechas.valores,
+            'modulo': modulos.valores,
+            'tipo_riego': tipos.valores,
+        },
+    }
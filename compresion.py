@@ -0,0 +1,187 @@
+"""Compresión de respuestas y archivos estáticos con huella de contenido.
+
+- comprimir_respuesta(): after_request que comprime HTML, JSON, CSS, JS y
+  texto con brotli (si el paquete está instalado) o gzip, según el
+  Accept-Encoding del cliente. Las respuestas en streaming (SSE, Excel) y las
+  ya codificadas se dejan como están.
+- comprimir_flujo(): comprime una respuesta en streaming trozo a trozo, para
+  las descargas que no caben en memoria.
+- ActivosEstaticos: sirve static/ bajo /activos/<ruta>.<huella>.<ext>, donde la
+  huella es un hash del contenido. Las versiones comprimidas se calculan una vez
+  y quedan en memoria, y como la URL cambia cuando cambia el archivo se pueden
+  cachear con Cache-Control: immutable.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+import zlib
+
+from flask import Response, request, abort
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él solo se negocia gzip
+    brotli = None
+
+TIPOS_COMPRIMIBLES = {
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript',
+    'application/javascript', 'application/json', 'application/x-ndjson',
+    'image/svg+xml',
+}
+TAMANO_MINIMO = 512
+UN_ANIO = 365 * 24 * 3600
+
+
+def _comprimir(datos, codificacion, estatico=False):
+    # Los estáticos se comprimen una sola vez: vale la pena el nivel máximo
+    if codificacion == 'br':
+        return brotli.compress(datos, quality=11 if estatico else 5)
+    return gzip.compress(datos, compresslevel=9 if estatico else 6, mtime=0)
+
+
+def elegir_codificacion(disponibles=None):
+    """Mejor codificación aceptada por el cliente: 'br', 'gzip' o None"""
+    aceptadas = request.accept_encodings
+    for codificacion in ('br', 'gzip'):
+        if codificacion == 'br' and brotli is None:
+            continue
+        if disponibles is not None and codificacion not in disponibles:
+            continue
+        if aceptadas[codificacion] > 0:
+            return codificacion
+    return None
+
+
+def _agregar_vary(response):
+    response.vary.add('Accept-Encoding')
+
+
+def comprimir_respuesta(response):
+    """Comprime el cuerpo de una respuesta si el cliente lo acepta y vale la pena"""
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 206, 304)
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in TIPOS_COMPRIMIBLES):
+        return response
+    _agregar_vary(response)
+
+    datos = response.get_data()
+    if len(datos) < TAMANO_MINIMO:
+        return response
+    codificacion = elegir_codificacion()
+    if codificacion is None:
+        return response
+
+    response.set_data(_comprimir(datos, codificacion))
+    response.headers['Content-Encoding'] = codificacion
+    # El cuerpo cambió de bytes: el ETag pasa a débil, como hace nginx
+    etag, debil = response.get_etag()
+    if etag and not debil:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def comprimir_flujo(partes, codificacion):
+    """Comprime un generador de texto o bytes sin juntarlo en memoria.
+
+    Cada trozo se vacía al salir (sync flush) para que el cliente reciba los
+    datos a medida que se generan y no al final.
+    """
+    if codificacion == 'br':
+        compresor = brotli.Compressor(quality=5)
+        comprimir, vaciar, terminar = compresor.process, compresor.flush, compresor.finish
+    else:
+        compresor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: formato gzip
+        comprimir = compresor.compress
+        vaciar = lambda: compresor.flush(zlib.Z_SYNC_FLUSH)  # noqa: E731
+        terminar = compresor.flush
+    for parte in partes:
+        if isinstance(parte, str):
+            parte = parte.encode('utf-8')
+        datos = comprimir(parte) + vaciar()
+        if datos:
+            yield datos
+    yield terminar()
+
+
+class _Activo:
+    __slots__ = ('mtime', 'huella', 'tipo', 'variantes')
+
+    def __init__(self, mtime, huella, tipo, variantes):
+        self.mtime = mtime
+        self.huella = huella
+        self.tipo = tipo
+        self.variantes = variantes  # codificación (None = identidad) -> bytes
+
+
+class ActivosEstaticos:
+    """Archivos de static/ con huella de contenido y variantes precomprimidas"""
+
+    def __init__(self, carpeta, prefijo='/activos'):
+        self.carpeta = os.path.abspath(carpeta)
+        self.prefijo = prefijo
+        self._activos = {}
+        self._lock = threading.Lock()
+
+    def _ruta_segura(self, nombre):
+        ruta = os.path.abspath(os.path.join(self.carpeta, nombre))
+        if not ruta.startswith(self.carpeta + os.sep):
+            return None
+        return ruta
+
+    def _activo(self, nombre):
+        """Activo vigente de un archivo; se recalcula si cambió su mtime"""
+        ruta = self._ruta_segura(nombre)
+        if ruta is None or not os.path.isfile(ruta):
+            return None
+        mtime = os.stat(ruta).st_mtime_ns
+        activo = self._activos.get(nombre)
+        if activo is not None and activo.mtime == mtime:
+            return activo
+
+        with open(ruta, 'rb') as archivo:
+            datos = archivo.read()
+        tipo = mimetypes.guess_type(nombre)[0] or 'application/octet-stream'
+        variantes = {None: datos}
+        if tipo in TIPOS_COMPRIMIBLES:
+            variantes['gzip'] = _comprimir(datos, 'gzip', estatico=True)
+            if brotli is not None:
+                variantes['br'] = _comprimir(datos, 'br', estatico=True)
+        activo = _Activo(mtime, hashlib.sha256(datos).hexdigest()[:12], tipo, variantes)
+        with self._lock:
+            self._activos[nombre] = activo
+        return activo
+
+    def url(self, nombre):
+        """URL con huella de un archivo de static/ (para las plantillas)"""
+        activo = self._activo(nombre)
+        if activo is None:
+            raise FileNotFoundError(nombre)
+        base, extension = os.path.splitext(nombre)
+        return f'{self.prefijo}/{base}.{activo.huella}{extension}'
+
+    def servir(self, ruta):
+        """Respuesta para /activos/<ruta>.<huella>.<ext>"""
+        base, extension = os.path.splitext(ruta)
+        nombre_base, _, huella = base.rpartition('.')
+        if not nombre_base:
+            abort(404)
+        activo = self._activo(nombre_base + extension)
+        if activo is None:
+            abort(404)
+
+        codificacion = elegir_codificacion(activo.variantes)
+        response = Response(activo.variantes[codificacion], mimetype=activo.tipo)
+        if codificacion:
+            response.headers['Content-Encoding'] = codificacion
+        if len(activo.variantes) > 1:
+            _agregar_vary(response)
+        response.set_etag(f'{activo.huella}-{codificacion}' if codificacion else activo.huella)
+        if huella == activo.huella:
+            response.headers['Cache-Control'] = f'public, max-age={UN_ANIO}, immutable'
+        else:
+            # Una página vieja pidió una huella anterior: se sirve la actual sin fijarla
+            response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
@@ -0,0 +1,93 @@
+"""Contadores en memoria para /estadisticas.
+
+En vez de contar la tabla en cada petición, se mantiene el total y el conteo
+por fecha: las escrituras de la app los ajustan al instante y, cuando un valor
+supera su TTL, se reconcilia con la base en un hilo aparte. Las lecturas solo
+esperan a la base la primera vez que piden un valor.
+"""
+import threading
+import time
+from collections import Counter, OrderedDict
+
+TOTAL = None  # clave del contador global
+
+
+class ContadoresRiegos:
+    """Conteo total y por fecha, ajustado por las escrituras y reconciliado por TTL"""
+
+    def __init__(self, repo, ttl=60, max_fechas=32):
+        self.repo = repo
+        self.ttl = ttl
+        self.max_fechas = max_fechas
+        self._valores = OrderedDict()  # clave -> [valor, reconciliado_en]
+        self._escrituras = Counter()  # clave -> escrituras vistas (para detectar carreras)
+        self._en_curso = set()
+        self._lock = threading.Lock()
+
+    def total(self):
+        """Total de registros de la tabla"""
+        return self._leer(TOTAL)
+
+    def de_fecha(self, fecha):
+        """Registros de una fecha"""
+        return self._leer(fecha)
+
+    def aplicar(self, filas, signo):
+        """Suma (signo=1) o resta (signo=-1) un lote de filas escritas"""
+        por_fecha = Counter(fila['fecha'][:10] for fila in filas if fila.get('fecha'))
+        with self._lock:
+            for clave, cantidad in list(por_fecha.items()) + [(TOTAL, len(filas))]:
+                if clave in self._valores or clave in self._en_curso:
+                    self._escrituras[clave] += 1
+                if clave in self._valores:
+                    self._valores[clave][0] += signo * cantidad
+
+    def _leer(self, clave):
+        with self._lock:
+            entrada = self._valores.get(clave)
+            if entrada is not None:
+                if clave is not TOTAL:
+                    self._valores.move_to_end(clave)
+                if time.monotonic() - entrada[1] > self.ttl and clave not in self._en_curso:
+                    # Valor vencido: se sirve igual y se reconcilia en segundo plano
+                    self._en_curso.add(clave)
+                    threading.Thread(target=self._reconciliar, args=(clave,),
+                                     name='reconciliar-contador', daemon=True).start()
+                return max(entrada[0], 0)
+            self._en_curso.add(clave)
+
+        return self._reconciliar(clave)
+
+    def _reconciliar(self, clave):
+        with self._lock:
+            escrituras = self._escrituras[clave]
+        try:
+            filtros = [] if clave is TOTAL else [('eq', 'fecha', clave)]
+            valor = self.repo.contar(filtros)
+        except Exception:
+            with self._lock:
+                self._en_curso.discard(clave)
+            raise
+
+        with self._lock:
+            self._en_curso.discard(clave)
+            entrada = self._valores.get(clave)
+            if self._escrituras[clave] != escrituras:
+                # Hubo escrituras durante el conteo y no sabemos si las incluye:
+                # conservamos el valor incremental (o este conteo, marcado como
+                # vencido) para que la próxima lectura vuelva a reconciliar
+                if entrada is not None:
+                    return max(entrada[0], 0)
+                self._valores[clave] = [valor, float('-inf')]
+            else:
+                self._valores[clave] = [valor, time.monotonic()]
+            self._recortar()
+        return valor
+
+    def _recortar(self):
+        fechas = [clave for clave in self._valores if clave is not TOTAL]
+        for clave in fechas[:max(len(fechas) - self.max_fechas, 0)]:
+            del self._valores[clave]
+        for clave in list(self._escrituras):
+            if clave not in self._valores and clave not in self._en_curso:
+                del self._escrituras[clave]
@@ -0,0 +1,100 @@
+"""Canal de eventos en vivo (Server-Sent Events).
+
+/registrar, /editar y /eliminar publican aquí lo que acaban de escribir y
+cada pestaña abierta lo recibe por una única conexión /eventos, en lugar de
+consultar la base cada 30 segundos.
+
+El canal vive en el proceso: con varios workers de gunicorn, cada uno solo
+notifica a los clientes conectados a él.
+"""
+import json
+import queue
+import threading
+import time
+
+RECARGAR = 'recargar'
+
+
+class Suscripcion:
+    """Cola acotada de eventos de un cliente, opcionalmente filtrada por fecha"""
+
+    def __init__(self, fecha=None, max_pendientes=100):
+        self.fecha = fecha
+        self.cola = queue.Queue(maxsize=max_pendientes)
+        self.desbordada = False
+
+    def entregar(self, evento):
+        try:
+            self.cola.put_nowait(evento)
+        except queue.Full:
+            # Cliente lento: en vez de acumular, le pedimos que recargue todo
+            self.desbordada = True
+
+
+class CanalEventos:
+    """Publica los cambios de riegos a los clientes suscritos"""
+
+    def __init__(self):
+        self._suscripciones = set()
+        self._lock = threading.Lock()
+
+    def suscribir(self, fecha=None):
+        suscripcion = Suscripcion(fecha)
+        with self._lock:
+            self._suscripciones.add(suscripcion)
+        return suscripcion
+
+    def desuscribir(self, suscripcion):
+        with self._lock:
+            self._suscripciones.discard(suscripcion)
+
+    def clientes(self):
+        with self._lock:
+            return len(self._suscripciones)
+
+    def publicar(self, tipo, filas):
+        """Envía un evento con los ids y fechas de las filas escritas"""
+        por_fecha = {}
+        for fila in filas:
+            fecha = (fila.get('fecha') or '')[:10]
+            por_fecha.setdefault(fecha, []).append(fila.get('id'))
+
+        with self._lock:
+            suscripciones = list(self._suscripciones)
+        for suscripcion in suscripciones:
+            if suscripcion.fecha is None:
+                ids = [id_ for ids in por_fecha.values() for id_ in ids]
+                fechas = sorted(por_fecha)
+            elif suscripcion.fecha in por_fecha:
+                ids = por_fecha[suscripcion.fecha]
+                fechas = [suscripcion.fecha]
+            else:
+                continue
+            suscripcion.entregar((tipo, {'fechas': fechas, 'ids': ids}))
+
+    def flujo(self, fecha=None, latido=20, duracion_max=900):
+        """Suscribe un cliente y genera su texto SSE hasta que se va.
+
+        La suscripción se crea dentro del generador: si el cliente se
+        desconecta antes de que empiece la respuesta, el generador nunca
+        arranca y no queda una cola huérfana recibiendo eventos. El latido
+        mantiene viva la conexión a través de proxies y permite detectar
+        clientes caídos; tras duracion_max se cierra para liberar el hilo y
+        el navegador se reconecta solo.
+        """
+        suscripcion = self.suscribir(fecha)
+        fin = time.monotonic() + duracion_max
+        try:
+            yield 'retry: 5000\n\n'
+            while time.monotonic() < fin:
+                if suscripcion.desbordada:
+                    suscripcion.desbordada = False
+                    yield f'event: {RECARGAR}\ndata: {{}}\n\n'
+                try:
+                    tipo, datos = suscripcion.cola.get(timeout=latido)
+                except queue.Empty:
+                    yield ': latido\n\n'
+                    continue
+                yield f'event: {tipo}\ndata: {json.dumps(datos)}\n\n'
+        finally:
+            self.desuscribir(suscripcion)
@@ -0,0 +1,210 @@
+"""Exportaciones en streaming para rangos de fechas arbitrarios.
+
+- generar_crudos(): registros crudos en CSV o NDJSON, leídos del repositorio
+  por páginas de tamaño fijo (keyset por id) y entregados página a página.
+- generar_excel_rango(): resumen semanal en .xlsx, ver abajo.
+
+El libro se arma con openpyxl en modo write-only (una hoja por semana ISO,
+las filas van a archivos temporales a medida que se agregan) y se guarda en
+un hilo productor que escribe el .xlsx sobre una cola acotada. La respuesta
+HTTP consume esa cola, así que los bytes salen hacia el cliente mientras se
+comprimen y la memoria no crece con el tamaño del rango.
+"""
+import csv
+import io
+import json
+import queue
+import threading
+import time
+from datetime import timedelta
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Alignment
+
+from agregacion import semana_de_fecha, rango_semana
+
+TAMANO_BLOQUE = 64 * 1024
+BLOQUES_EN_VUELO = 8
+ENCABEZADOS = ['Semana Año', 'Día', 'Módulo', 'Agua', 'Comida']
+ANCHOS = {'A': 12, 'B': 18, 'C': 10, 'D': 10, 'E': 10}
+
+# PostgREST corta cada respuesta en max-rows (1000 por defecto en Supabase)
+FILAS_POR_PAGINA = 1000
+COLUMNAS_CRUDAS = ('id', 'fecha', 'modulo', 'tipo_riego', 'sistema_riego',
+                   'tiempo_minutos', 'timestamp')
+FORMATOS_CRUDOS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+_FIN = object()
+
+
+class ExportacionCancelada(Exception):
+    """El cliente cerró la conexión antes de terminar la descarga"""
+
+
+class _SalidaEnCola(io.RawIOBase):
+    """Archivo de solo escritura que entrega bloques a una cola acotada"""
+
+    def __init__(self, cola, cancelada):
+        self.cola = cola
+        self.cancelada = cancelada
+        self._buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, datos):
+        self._buffer += datos
+        if len(self._buffer) >= TAMANO_BLOQUE:
+            self._entregar()
+        return len(datos)
+
+    def flush(self):
+        # ZipFile llama flush varias veces; solo vaciamos al cerrar
+        pass
+
+    def close(self):
+        if not self.closed and self._buffer:
+            self._entregar()
+        super().close()
+
+    def _entregar(self):
+        bloque = bytes(self._buffer)
+        self._buffer.clear()
+        while True:
+            if self.cancelada.is_set():
+                raise ExportacionCancelada()
+            try:
+                self.cola.put(bloque, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+
+def paginas_crudas(repo, desde=None, hasta=None, filas_por_pagina=FILAS_POR_PAGINA):
+    """Páginas de registros del rango en orden de id.
+
+    Cada página pide las filas con id mayor que el último entregado, así la
+    consulta N cuesta lo mismo que la primera y la memoria se limita a una página.
+    """
+    filtros = []
+    if desde:
+        filtros.append(('gte', 'fecha', desde.isoformat()))
+    if hasta:
+        filtros.append(('lte', 'fecha', hasta.isoformat()))
+    ultimo = 0
+    while True:
+        filas = repo.seleccionar(','.join(COLUMNAS_CRUDAS),
+                                 filtros=filtros + [('gt', 'id', ultimo)],
+                                 orden=[('id', False)], limite=filas_por_pagina)
+        if filas:
+            yield filas
+        if len(filas) < filas_por_pagina:
+            return
+        ultimo = filas[-1]['id']
+        # Punto de cesión: con workers de gevent deja avanzar otras peticiones
+        time.sleep(0)
+
+
+def generar_crudos(repo, desde=None, hasta=None, formato='csv'):
+    """Genera el texto de la exportación cruda, una página de registros por vez"""
+    if formato == 'ndjson':
+        for pagina in paginas_crudas(repo, desde, hasta):
+            yield ''.join(json.dumps(fila, ensure_ascii=False, separators=(',', ':')) + '\n'
+                          for fila in pagina)
+        return
+
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, lineterminator='\n')
+    # El encabezado sale antes de la primera consulta
+    escritor.writerow(COLUMNAS_CRUDAS)
+    yield buffer.getvalue()
+    for pagina in paginas_crudas(repo, desde, hasta):
+        buffer.seek(0)
+        buffer.truncate()
+        escritor.writerows([fila.get(c) for c in COLUMNAS_CRUDAS] for fila in pagina)
+        yield buffer.getvalue()
+
+
+def semanas_del_rango(desde, hasta):
+    """Genera (año, semana) ISO de cada semana que toca el rango"""
+    lunes, _ = rango_semana(*semana_de_fecha(desde.isoformat()))
+    while lunes <= hasta:
+        year, week_num, _ = lunes.isocalendar()
+        yield year, week_num
+        lunes += timedelta(weeks=1)
+
+
+def _escribir_libro(motor, desde, hasta, salida):
+    wb = Workbook(write_only=True)
+    header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
+    header_font = Font(bold=True, color="FFFFFF")
+    header_alignment = Alignment(horizontal='center', vertical='center')
+    inicio, fin = desde.isoformat(), hasta.isoformat()
+
+    for year, week_num in semanas_del_rango(desde, hasta):
+        # Punto de cesión: con workers de gevent deja avanzar otras peticiones
+        time.sleep(0)
+        ws = wb.create_sheet(title=f"Semana {week_num} {year}")
+        for columna, ancho in ANCHOS.items():
+            ws.column_dimensions[columna].width = ancho
+
+        encabezados = []
+        for header in ENCABEZADOS:
+            cell = WriteOnlyCell(ws, value=header)
+            cell.fill = header_fill
+            cell.font = header_font
+            cell.alignment = header_alignment
+            encabezados.append(cell)
+        ws.append(encabezados)
+
+        for item in motor.obtener(year, week_num, guardar=False):
+            if inicio <= item['fecha'] <= fin:
+                ws.append([
+                    item['semana'],
+                    item['dia'],
+                    item['modulo'],
+                    '✓' if item['agua'] else '✗',
+                    '✓' if item['comida'] else '✗'
+                ])
+
+    wb.save(salida)
+
+
+def generar_excel_rango(motor, desde, hasta):
+    """Genera los bytes del .xlsx del rango [desde, hasta] a medida que se producen"""
+    cola = queue.Queue(maxsize=BLOQUES_EN_VUELO)
+    cancelada = threading.Event()
+    error = []
+
+    def producir():
+        salida = _SalidaEnCola(cola, cancelada)
+        try:
+            _escribir_libro(motor, desde, hasta, salida)
+            salida.close()
+        except ExportacionCancelada:
+            return
+        except Exception as e:
+            error.append(e)
+        while not cancelada.is_set():
+            try:
+                cola.put(_FIN, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    productor = threading.Thread(target=producir, name='exportar-excel', daemon=True)
+    productor.start()
+    try:
+        while True:
+            bloque = cola.get()
+            if bloque is _FIN:
+                break
+            yield bloque
+        if error:
+            raise error[0]
+    finally:
+        cancelada.set()
@@ -0,0 +1,84 @@
+"""Varias fincas en un mismo despliegue.
+
+Cada finca tiene su propio catálogo de módulos (modulos.csv, o
+modulos.<finca>.csv), su almacenamiento (un archivo SQLite por finca, o la
+columna finca_id en Supabase) y sus propias cachés: resumen semanal,
+contadores de /estadisticas, versiones para los ETags y canal de eventos. Así
+las escrituras de una finca no invalidan las cachés de otra y el historial de
+una finca grande no desplaza de la caché las semanas de una chica.
+
+La finca de cada petición sale del parámetro ?finca=, del encabezado X-Finca
+o de la cookie finca, en ese orden; sin ninguno se usa la finca por defecto.
+"""
+import os
+import re
+
+from agregacion import ResumenSemanal
+from contadores import ContadoresRiegos
+from eventos import CanalEventos
+from versiones import VersionesDatos
+
+_FINCA_ID = re.compile(r'[a-z0-9][a-z0-9_-]{0,39}')
+
+
+def validar_finca(finca_id):
+    """Identificador de finca normalizado; lanza ValueError si no sirve.
+
+    Termina en nombres de archivo, así que solo admite minúsculas, dígitos,
+    guiones y guiones bajos.
+    """
+    finca_id = str(finca_id or '').strip().lower()
+    if not _FINCA_ID.fullmatch(finca_id):
+        raise ValueError(f'Finca inválida: {finca_id!r}')
+    return finca_id
+
+
+def leer_fincas(texto, defecto):
+    """Lista de fincas de FINCAS ('norte,sur'), con la finca por defecto primero"""
+    fincas = [defecto]
+    for parte in (texto or '').split(','):
+        if parte.strip():
+            finca_id = validar_finca(parte)
+            if finca_id not in fincas:
+                fincas.append(finca_id)
+    return fincas
+
+
+def ruta_por_finca(ruta, finca_id, defecto):
+    """Archivo propio de una finca: 'riegos_web.db' -> 'riegos_web.norte.db'.
+
+    La finca por defecto conserva la ruta original, así una instalación de una
+    sola finca sigue usando sus archivos de siempre.
+    """
+    if finca_id == defecto or ruta == ':memory:':
+        return ruta
+    base, extension = os.path.splitext(ruta)
+    return f'{base}.{finca_id}{extension}'
+
+
+class Finca:
+    """Almacenamiento, catálogo y cachés de una finca"""
+
+    def __init__(self, finca_id, repo, catalogo, diario=False, ttl=60, ventana=300, ttl_resumen=300):
+        self.id = finca_id
+        self.repo = repo
+        self.catalogo = catalogo
+        self.resumen_diario = diario
+        self.motor_resumen = ResumenSemanal(repo, diario=diario, ttl=ttl_resumen) if repo else None
+        self.contadores = ContadoresRiegos(repo, ttl=ttl) if repo else None
+        self.canal_eventos = CanalEventos()
+        self.versiones = VersionesDatos(ventana=ventana)
+        self.cola_escritura = None
+
+    def propagar_cambios(self, accion, filas):
+        """Actualiza las cachés y contadores derivados de las filas recién escritas"""
+        if not filas:
+            return
+        fechas = {fila['fecha'][:10] for fila in filas if fila.get('fecha')}
+        self.versiones.incrementar('historial', *[f'fecha:{fecha}' for fecha in fechas])
+        self.motor_resumen.invalidar_filas(filas)
+        self.canal_eventos.publicar(accion, filas)
+        if accion == 'insertar':
+            self.contadores.aplicar(filas, 1)
+        elif accion == 'eliminar':
+            self.contadores.aplicar(filas, -1)
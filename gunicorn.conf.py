@@ -0,0 +1,34 @@
+"""Configuración de gunicorn.
+
+Por defecto los workers son gthread: cada petición tiene su hilo, así que
+una llamada lenta a Supabase o una conexión /eventos abierta no frena a las
+demás. No se usa gevent por defecto porque la app hace E/S SQLite síncrona en
+la petición (cola de escritura con synchronous=FULL, índice de idempotencia,
+backend SQLite), que bloquearía todo el bucle de eventos, y porque el parcheo
+de gevent quita select.epoll y rompe supabase.create_client cuando trio está
+instalado.
+
+GUNICORN_MODO elige el tipo de worker:
+    gthread  un hilo del sistema por petición (GUNICORN_HILOS, por defecto)
+    gevent   E/S no bloqueante (solo con Supabase y sin trio instalado)
+    sync     un worker por petición, como gunicorn sin configurar
+"""
+import os
+
+modo = os.environ.get('GUNICORN_MODO', 'gthread')
+
+# Render define WEB_CONCURRENCY; con hilos uno o dos workers alcanzan
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+
+if modo == 'gevent':
+    worker_class = 'gevent'
+    worker_connections = int(os.environ.get('GUNICORN_CONEXIONES', 1000))
+elif modo == 'gthread':
+    worker_class = 'gthread'
+    threads = int(os.environ.get('GUNICORN_HILOS', 64))
+else:
+    worker_class = 'sync'
+
+# Las conexiones /eventos quedan abiertas; el keep-alive evita renegociar TLS
+# en cada consulta de los teléfonos detrás del proxy de Render
+keepalive = 75
@@ -0,0 +1,129 @@
+"""Claves de idempotencia para reintentos seguros de /registrar.
+
+El cliente manda un encabezado Idempotency-Key por envío. La primera petición
+con esa clave la reserva; las repeticiones reciben la respuesta original sin
+tocar la base. Las claves recientes están en una LRU en memoria y todas se
+persisten en un índice SQLite local (compartido entre workers) durante
+IDEMPOTENCIA_TTL segundos.
+"""
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+ESQUEMA_IDEMPOTENCIA = '''
+    CREATE TABLE IF NOT EXISTS claves (
+        clave TEXT PRIMARY KEY,
+        huella TEXT NOT NULL,
+        estado TEXT NOT NULL,
+        status INTEGER,
+        cuerpo BLOB,
+        creado REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_claves_creado ON claves(creado);
+'''
+
+NUEVA = 'nueva'
+REPETIDA = 'repetida'
+EN_CURSO = 'en_curso'
+CONFLICTO = 'conflicto'
+
+
+class RegistroIdempotencia:
+    """Índice de claves de idempotencia con LRU en memoria y respaldo SQLite"""
+
+    def __init__(self, ruta='idempotencia.db', capacidad=1000, ttl=86400,
+                 plazo_en_curso=60, limpiar_cada=500):
+        self.ruta = ruta
+        self.capacidad = capacidad
+        self.ttl = ttl
+        self.plazo_en_curso = plazo_en_curso
+        self.limpiar_cada = limpiar_cada
+        self._recientes = OrderedDict()  # clave -> (huella, status, cuerpo, creado)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._reservas = 0
+        self._conexion().executescript(ESQUEMA_IDEMPOTENCIA)
+
+    def _conexion(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.ruta, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA busy_timeout=5000')
+            self._local.conn = conn
+        return conn
+
+    def reservar(self, clave, huella):
+        """Reserva la clave para una petición nueva o devuelve el resultado previo.
+
+        Devuelve (estado, respuesta) donde estado es NUEVA, REPETIDA (con la
+        respuesta (status, cuerpo) original), EN_CURSO o CONFLICTO (misma
+        clave con otro cuerpo).
+        """
+        with self._lock:
+            previa = self._recientes.get(clave)
+            # Mismo vencimiento que en SQLite: una clave vencida vale como nueva
+            if previa is not None and previa[3] < time.time() - self.ttl:
+                del self._recientes[clave]
+                previa = None
+            if previa is not None:
+                self._recientes.move_to_end(clave)
+                if previa[0] != huella:
+                    return CONFLICTO, None
+                return REPETIDA, previa[1:3]
+
+        conn = self._conexion()
+        ahora = time.time()
+        self._limpiar_si_toca(conn, ahora)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            fila = conn.execute(
+                'SELECT huella, estado, status, cuerpo, creado FROM claves WHERE clave = ?',
+                (clave,)).fetchone()
+            if fila is None or fila[4] < ahora - self.ttl or (
+                    fila[1] == EN_CURSO and fila[4] < ahora - self.plazo_en_curso):
+                # Clave nueva, vencida o abandonada por un proceso caído
+                conn.execute(
+                    'INSERT OR REPLACE INTO claves (clave, huella, estado, creado) '
+                    'VALUES (?, ?, ?, ?)', (clave, huella, EN_CURSO, ahora))
+                conn.execute('COMMIT')
+                return NUEVA, None
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        huella_previa, estado, status, cuerpo, creado = fila
+        if huella_previa != huella:
+            return CONFLICTO, None
+        if estado == EN_CURSO:
+            return EN_CURSO, None
+        self._recordar(clave, huella, status, cuerpo, creado)
+        return REPETIDA, (status, cuerpo)
+
+    def guardar(self, clave, huella, status, cuerpo):
+        """Guarda la respuesta final de una clave reservada"""
+        fila = self._conexion().execute(
+            'UPDATE claves SET estado = ?, status = ?, cuerpo = ? WHERE clave = ? RETURNING creado',
+            ('completa', status, cuerpo, clave)).fetchone()
+        self._recordar(clave, huella, status, cuerpo, fila[0] if fila else time.time())
+
+    def liberar(self, clave):
+        """Suelta una reserva cuya petición falló, para que se pueda reintentar"""
+        self._conexion().execute(
+            'DELETE FROM claves WHERE clave = ? AND estado = ?', (clave, EN_CURSO))
+
+    def _recordar(self, clave, huella, status, cuerpo, creado):
+        with self._lock:
+            self._recientes[clave] = (huella, status, cuerpo, creado)
+            self._recientes.move_to_end(clave)
+            while len(self._recientes) > self.capacidad:
+                self._recientes.popitem(last=False)
+
+    def _limpiar_si_toca(self, conn, ahora):
+        with self._lock:
+            self._reservas += 1
+            if self._reservas % self.limpiar_cada:
+                return
+        conn.execute('DELETE FROM claves WHERE creado < ?', (ahora - self.ttl,))
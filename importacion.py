@@ -0,0 +1,197 @@
+"""Importación masiva de registros históricos desde CSV o XLSX.
+
+El archivo se recorre fila por fila (csv.reader sobre el stream, o
+openpyxl en modo read_only para .xlsx), cada fila se valida contra el
+catálogo de módulos y los vocabularios de tipo y sistema con búsquedas en
+conjuntos, y las válidas se insertan por lotes de tamaño fijo. Las filas
+inválidas no detienen la carga: se informan como errores con su número de
+línea.
+
+Cada fila recibe un uuid derivado del contenido del archivo y de su línea, así
+volver a subir el mismo archivo (por ejemplo tras un corte a mitad de carga)
+no duplica lo que ya entró: esas filas se informan como ya importadas.
+"""
+import csv
+import hashlib
+import io
+import time
+import uuid
+from datetime import date, datetime, time as hora_del_dia
+
+from columnar import ZONA_ECUADOR
+
+LOTE_IMPORTACION = 1000
+EXTENSIONES = ('.csv', '.xlsx')
+
+TIPOS_RIEGO = frozenset({'agua', 'comida'})
+SISTEMAS_RIEGO = frozenset({'ducha', 'goteo'})
+# Encabezados aceptados -> columna de riegos
+ALIAS = {
+    'fecha': 'fecha',
+    'modulo': 'modulo',
+    'módulo': 'modulo',
+    'tipo_riego': 'tipo_riego',
+    'tipo': 'tipo_riego',
+    'sistema_riego': 'sistema_riego',
+    'sistema': 'sistema_riego',
+    'tiempo_minutos': 'tiempo_minutos',
+    'tiempo': 'tiempo_minutos',
+    'minutos': 'tiempo_minutos',
+    'hora': 'hora',
+}
+TIPOS_ALIAS = {'agua': 'agua', 'comida': 'comida', 'fertilizante': 'comida'}
+ESPACIO_UUID = uuid.UUID('6f1c2a8e-3d4b-5e6f-8a9b-0c1d2e3f4a5b')
+
+
+def huella_archivo(archivo):
+    """sha256 del contenido; deja el archivo al principio"""
+    archivo.seek(0)
+    huella = hashlib.sha256()
+    for bloque in iter(lambda: archivo.read(1024 * 1024), b''):
+        huella.update(bloque)
+    archivo.seek(0)
+    return huella.hexdigest()
+
+
+def _encabezados(fila):
+    return [ALIAS.get(str(celda or '').strip().lower()) for celda in fila]
+
+
+def leer_filas(archivo, nombre):
+    """Genera (línea, {columna: valor}) de un .csv o .xlsx, sin cargarlo entero"""
+    if nombre.lower().endswith('.xlsx'):
+        from openpyxl import load_workbook
+        libro = load_workbook(archivo, read_only=True, data_only=True)
+        try:
+            filas = libro.active.iter_rows(values_only=True)
+            columnas = _encabezados(next(filas, ()))
+            for linea, fila in enumerate(filas, 2):
+                if any(valor not in (None, '') for valor in fila):
+                    yield linea, {c: v for c, v in zip(columnas, fila) if c}
+        finally:
+            libro.close()
+        return
+
+    texto = io.TextIOWrapper(archivo, encoding='utf-8-sig', newline='')
+    primera = texto.readline()
+    # Las planillas en español suelen exportar CSV separado por punto y coma
+    separador = ';' if primera.count(';') > primera.count(',') else ','
+    columnas = _encabezados(next(csv.reader([primera], delimiter=separador), []))
+    for linea, fila in enumerate(csv.reader(texto, delimiter=separador), 2):
+        if any(valor.strip() for valor in fila):
+            yield linea, {c: v for c, v in zip(columnas, fila) if c}
+    texto.detach()
+
+
+def _fecha(valor):
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    texto = str(valor or '').strip()
+    if '/' in texto:
+        return datetime.strptime(texto, '%d/%m/%Y').date()
+    return date.fromisoformat(texto[:10])
+
+
+def _hora(valor):
+    if valor in (None, ''):
+        return hora_del_dia(0, 0)
+    if isinstance(valor, datetime):
+        return valor.time()
+    if isinstance(valor, hora_del_dia):
+        return valor
+    return hora_del_dia.fromisoformat(str(valor).strip())
+
+
+def validar_fila(fila, modulos):
+    """Registro listo para insertar a partir de una fila del archivo.
+
+    Lanza ValueError con un mensaje para el informe de errores.
+    """
+    try:
+        fecha = _fecha(fila.get('fecha'))
+    except ValueError:
+        raise ValueError(f"Fecha inválida: {fila.get('fecha')!r}")
+
+    modulo = str(fila.get('modulo') or '').strip()
+    if isinstance(fila.get('modulo'), float) and fila['modulo'].is_integer():
+        modulo = str(int(fila['modulo']))  # Excel guarda 11 como 11.0
+    if modulo not in modulos:
+        raise ValueError(f'Módulo desconocido: {modulo!r}')
+
+    tipo_riego = TIPOS_ALIAS.get(str(fila.get('tipo_riego') or '').strip().lower())
+    if tipo_riego not in TIPOS_RIEGO:
+        raise ValueError(f"Tipo de riego inválido: {fila.get('tipo_riego')!r}")
+
+    sistema_riego = str(fila.get('sistema_riego') or '').strip().lower() or None
+    if sistema_riego is not None and sistema_riego not in SISTEMAS_RIEGO:
+        raise ValueError(f"Sistema de riego inválido: {fila.get('sistema_riego')!r}")
+
+    tiempo_minutos = fila.get('tiempo_minutos')
+    if tiempo_minutos in (None, ''):
+        tiempo_minutos = None
+    else:
+        try:
+            tiempo_minutos = int(float(tiempo_minutos))
+        except (TypeError, ValueError):
+            raise ValueError(f'Tiempo inválido: {tiempo_minutos!r}')
+        if tiempo_minutos <= 0:
+            raise ValueError(f'Tiempo inválido: {tiempo_minutos!r}')
+
+    try:
+        hora = _hora(fila.get('hora'))
+    except ValueError:
+        raise ValueError(f"Hora inválida: {fila.get('hora')!r}")
+
+    return {
+        'fecha': fecha.isoformat(),
+        'modulo': modulo,
+        'tipo_riego': tipo_riego,
+        'sistema_riego': sistema_riego,
+        'tiempo_minutos': tiempo_minutos,
+        'timestamp': datetime.combine(fecha, hora, tzinfo=ZONA_ECUADOR).isoformat(),
+    }
+
+
+def importar(repo, archivo, nombre, modulos, lote=LOTE_IMPORTACION, al_insertar=None):
+    """Importa un archivo y genera eventos de avance para la respuesta en NDJSON.
+
+    Eventos: {'tipo': 'error', 'linea', 'error'} por cada fila rechazada,
+    {'tipo': 'progreso', ...} tras cada lote y {'tipo': 'fin', ...} al terminar.
+    al_insertar recibe las filas de cada lote insertado.
+    """
+    inicio = time.monotonic()
+    prefijo = huella_archivo(archivo)
+    modulos = frozenset(modulos)
+    totales = {'procesadas': 0, 'insertadas': 0, 'rechazadas': 0, 'ya_importadas': 0}
+    pendientes = []
+
+    def volcar():
+        # Las filas cuyo uuid ya existe (importadas antes) se omiten en la base
+        insertados = repo.insertar(pendientes, ignorar_duplicados=True)
+        if al_insertar and insertados:
+            al_insertar(insertados)
+        totales['insertadas'] += len(insertados)
+        totales['ya_importadas'] += len(pendientes) - len(insertados)
+        pendientes.clear()
+        return dict(totales, tipo='progreso')
+
+    for linea, fila in leer_filas(archivo, nombre):
+        totales['procesadas'] += 1
+        try:
+            registro = validar_fila(fila, modulos)
+        except ValueError as e:
+            totales['rechazadas'] += 1
+            yield {'tipo': 'error', 'linea': linea, 'error': str(e)}
+            continue
+        registro['uuid'] = str(uuid.uuid5(ESPACIO_UUID, f'{prefijo}:{linea}'))
+        pendientes.append(registro)
+        if len(pendientes) >= lote:
+            yield volcar()
+            # Punto de cesión: con workers de gevent deja avanzar otras peticiones
+            time.sleep(0)
+
+    if pendientes:
+        yield volcar()
+    yield dict(totales, tipo='fin', segundos=round(time.monotonic() - inicio, 2))
@@ -0,0 +1,143 @@
+"""Logging estructurado y métricas de latencia.
+
+- configurar_logging(): los handlers de la app escriben a una cola en memoria
+  y un hilo aparte formatea y escribe a stderr, así una petición nunca espera
+  por la E/S del log. El nivel sale de LOG_LEVEL.
+- RegistroMetricas: histogramas de latencia por ruta y por operación de base,
+  exportados en formato de texto de Prometheus para /metrics.
+- RepositorioInstrumentado: envuelve el repositorio y mide cada operación.
+"""
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from bisect import bisect_left
+
+LIMITES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class FormateadorEstructurado(logging.Formatter):
+    """Una línea clave=valor por evento; los campos extra van en record.datos"""
+
+    def format(self, record):
+        partes = [
+            f'ts={self.formatTime(record, "%Y-%m-%dT%H:%M:%S")}',
+            f'nivel={record.levelname}',
+            f'logger={record.name}',
+            f'msg="{record.getMessage()}"',
+        ]
+        for clave, valor in getattr(record, 'datos', {}).items():
+            partes.append(f'{clave}={valor}')
+        linea = ' '.join(partes)
+        if record.exc_info:
+            linea += '\n' + self.formatException(record.exc_info)
+        return linea
+
+
+def configurar_logging(nombre='riegos'):
+    """Configura el logger raíz de la app con un QueueHandler no bloqueante"""
+    logger = logging.getLogger(nombre)
+    if getattr(logger, '_configurado', False):
+        return logger
+
+    logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+    cola = queue.SimpleQueue()
+    salida = logging.StreamHandler()
+    salida.setFormatter(FormateadorEstructurado())
+    listener = logging.handlers.QueueListener(cola, salida, respect_handler_level=True)
+    listener.start()
+    logger.addHandler(logging.handlers.QueueHandler(cola))
+    logger.propagate = False
+    logger._configurado = True
+    logger._listener = listener
+    return logger
+
+
+class Histograma:
+    """Histograma acumulativo con límites fijos, al estilo Prometheus"""
+
+    def __init__(self, limites=LIMITES_SEGUNDOS):
+        self.limites = limites
+        self.cubetas = [0] * (len(limites) + 1)
+        self.suma = 0.0
+        self.cuenta = 0
+
+    def observar(self, valor):
+        self.cubetas[bisect_left(self.limites, valor)] += 1
+        self.suma += valor
+        self.cuenta += 1
+
+
+class RegistroMetricas:
+    """Histogramas etiquetados y su exportación en formato Prometheus"""
+
+    def __init__(self):
+        self._metricas = {}  # nombre -> (ayuda, {etiquetas: Histograma})
+        self._lock = threading.Lock()
+
+    def registrar(self, nombre, ayuda):
+        with self._lock:
+            self._metricas.setdefault(nombre, (ayuda, {}))
+
+    def observar(self, nombre, valor, **etiquetas):
+        clave = tuple(sorted(etiquetas.items()))
+        with self._lock:
+            _, series = self._metricas[nombre]
+            histograma = series.get(clave)
+            if histograma is None:
+                histograma = series[clave] = Histograma()
+            histograma.observar(valor)
+
+    def exportar(self):
+        """Texto de exposición de Prometheus (versión 0.0.4)"""
+        lineas = []
+        with self._lock:
+            for nombre, (ayuda, series) in sorted(self._metricas.items()):
+                lineas.append(f'# HELP {nombre} {ayuda}')
+                lineas.append(f'# TYPE {nombre} histogram')
+                for clave, histograma in sorted(series.items()):
+                    base = ','.join(f'{k}="{_escapar(v)}"' for k, v in clave)
+                    acumulado = 0
+                    for limite, cantidad in zip(histograma.limites + ('+Inf',), histograma.cubetas):
+                        acumulado += cantidad
+                        le = f'le="{limite}"'
+                        etiquetas = f'{base},{le}' if base else le
+                        lineas.append(f'{nombre}_bucket{{{etiquetas}}} {acumulado}')
+                    sufijo = f'{{{base}}}' if base else ''
+                    lineas.append(f'{nombre}_sum{sufijo} {histograma.suma:.6f}')
+                    lineas.append(f'{nombre}_count{sufijo} {histograma.cuenta}')
+        return '\n'.join(lineas) + '\n'
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class RepositorioInstrumentado:
+    """Proxy del repositorio que mide la latencia de cada operación pública"""
+
+    def __init__(self, repo, metricas, al_medir=None, nombre_metrica='riegos_db_duracion_segundos'):
+        self._repo = repo
+        self._metricas = metricas
+        self._al_medir = al_medir
+        self._nombre_metrica = nombre_metrica
+        metricas.registrar(nombre_metrica, 'Latencia de las operaciones del repositorio de riegos')
+
+    def __getattr__(self, nombre):
+        atributo = getattr(self._repo, nombre)
+        if nombre.startswith('_') or not callable(atributo):
+            return atributo
+
+        def medido(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return atributo(*args, **kwargs)
+            finally:
+                duracion = time.perf_counter() - inicio
+                self._metricas.observar(self._nombre_metrica, duracion,
+                                        backend=self._repo.nombre, operacion=nombre)
+                if self._al_medir:
+                    self._al_medir(nombre, duracion)
+        return medido
@@ -1,43 +1,224 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
+import queue
 import sqlite3
+import threading
+import uuid
 from datetime import datetime
 import os
 
+from catalogo import CatalogoModulos
+from columnar import hora_ecuador
+from sincronizacion import SincronizadorLocal, instante_utc, normalizar_instante
+
+RUTA_DB = 'riegos.db'
+
+# Mismo esquema que la tabla riegos de la web, más lo que necesita la
+# sincronización: uuid estable, marca de modificación, borrado lógico (la
+# lápida se sube al servidor) y el registro de cambios aún no subidos
+ESQUEMA_LOCAL = '''
+    CREATE TABLE IF NOT EXISTS riegos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        fecha DATE NOT NULL,
+        modulo TEXT NOT NULL,
+        tipo_riego TEXT NOT NULL,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        sistema_riego TEXT,
+        tiempo_minutos INTEGER,
+        uuid TEXT,
+        actualizado_en TEXT,
+        borrado INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_riegos_uuid ON riegos (uuid);
+    -- Índices para el historial: filtro por fecha y orden/paginación por (timestamp, id)
+    CREATE INDEX IF NOT EXISTS idx_riegos_fecha ON riegos (fecha);
+    CREATE INDEX IF NOT EXISTS idx_riegos_timestamp ON riegos (timestamp, id);
+
+    CREATE TABLE IF NOT EXISTS cambios_pendientes (uuid TEXT PRIMARY KEY);
+    CREATE TABLE IF NOT EXISTS sync_estado (clave TEXT PRIMARY KEY, valor TEXT);
+'''
+
+
+def migrar_esquema(conn):
+    """Lleva una riegos.db del esquema viejo (columna bloque) al de la web.
+
+    Las filas existentes reciben uuid y marca de modificación y quedan
+    pendientes de subir en la próxima sincronización.
+    """
+    columnas = {fila[1] for fila in conn.execute('PRAGMA table_info(riegos)')}
+    if 'bloque' in columnas:
+        with conn:
+            conn.execute('ALTER TABLE riegos RENAME COLUMN bloque TO modulo')
+            for columna in ('sistema_riego TEXT', 'tiempo_minutos INTEGER', 'uuid TEXT',
+                            'actualizado_en TEXT', 'borrado INTEGER NOT NULL DEFAULT 0'):
+                conn.execute(f'ALTER TABLE riegos ADD COLUMN {columna}')
+    conn.executescript(ESQUEMA_LOCAL)
+    
+    viejos = conn.execute('SELECT id, timestamp FROM riegos WHERE uuid IS NULL').fetchall()
+    if viejos:
+        # CURRENT_TIMESTAMP guardaba la hora UTC sin zona
+        filas = []
+        for id_registro, timestamp in viejos:
+            instante = normalizar_instante(timestamp) if timestamp else instante_utc()
+            filas.append((str(uuid.uuid4()), instante, instante, id_registro))
+        with conn:
+            conn.executemany(
+                'UPDATE riegos SET uuid = ?, actualizado_en = ?, timestamp = ? WHERE id = ?', filas)
+            conn.executemany('INSERT OR IGNORE INTO cambios_pendientes (uuid) VALUES (?)',
+                             [(fila[0],) for fila in filas])
+    
+    # timestamp se guarda siempre como instante UTC (instante_utc) para que el
+    # orden y la paginación por (timestamp, id) funcionen comparando texto;
+    # las versiones anteriores dejaban una mezcla de -05:00 y +00:00. Es el
+    # mismo instante, así que no hace falta volver a subir esas filas
+    mezclados = conn.execute(
+        "SELECT id, timestamp FROM riegos WHERE timestamp IS NOT NULL AND timestamp NOT LIKE '%Z'").fetchall()
+    if mezclados:
+        with conn:
+            conn.executemany('UPDATE riegos SET timestamp = ? WHERE id = ?',
+                             [(normalizar_instante(timestamp), id_registro)
+                              for id_registro, timestamp in mezclados])
+
+
+def insertar_riegos(conn, filas):
+    """Inserta los riegos y los anota como pendientes de subir, en una transacción"""
+    with conn:
+        conn.executemany('''
+            INSERT INTO riegos (uuid, fecha, modulo, tipo_riego, sistema_riego,
+                                tiempo_minutos, timestamp, actualizado_en)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', filas)
+        conn.executemany('INSERT OR IGNORE INTO cambios_pendientes (uuid) VALUES (?)',
+                         [(fila[0],) for fila in filas])
+    return len(filas)
+
+
+def leer_riegos_dia(conn, fecha, desde_id=0):
+    """Riegos de una fecha con id mayor que desde_id, del más viejo al más nuevo"""
+    return conn.execute('''
+        SELECT id, timestamp, modulo, tipo_riego
+        FROM riegos
+        WHERE fecha = ? AND borrado = 0 AND id > ?
+        ORDER BY timestamp, id
+    ''', (fecha, desde_id)).fetchall()
+
+
+def contar_pendientes(conn):
+    return conn.execute('SELECT COUNT(*) FROM cambios_pendientes').fetchone()[0]
+
+
+def leer_pagina(conn, sql, parametros):
+    return conn.execute(sql, parametros).fetchall()
+
+
+class TrabajadorDB(threading.Thread):
+    """Hilo dueño de la conexión a riegos.db.
+    
+    La ventana le encarga tareas (funciones que reciben la conexión) por una
+    cola y recibe los resultados por otra que revisa con after(), así ninguna
+    consulta ni escritura corre en el hilo de Tk. Las tareas se ejecutan en
+    el orden en que se encargan.
+    """
+    
+    INTERVALO_MS = 50
+    
+    def __init__(self, root, ruta=RUTA_DB, al_fallar=None):
+        super().__init__(name='riegos-db', daemon=True)
+        self.root = root
+        self.ruta = ruta
+        self.al_fallar = al_fallar
+        self.pedidos = queue.Queue()
+        self.respuestas = queue.Queue()
+        self.start()
+        self.root.after(self.INTERVALO_MS, self.revisar_respuestas)
+    
+    def run(self):
+        conn = sqlite3.connect(self.ruta)
+        # WAL: la sincronización escribe con su propia conexión sin bloquear las lecturas
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        try:
+            while True:
+                pedido = self.pedidos.get()
+                if pedido is None:
+                    break
+                tarea, args, al_terminar, al_fallar = pedido
+                try:
+                    resultado = tarea(conn, *args)
+                except Exception as e:
+                    conn.rollback()
+                    self.respuestas.put((al_fallar or self.al_fallar, e))
+                else:
+                    self.respuestas.put((al_terminar, resultado))
+        finally:
+            conn.close()
+    
+    def encargar(self, tarea, *args, al_terminar=None, al_fallar=None):
+        """Pone una tarea en la cola; al_terminar recibe su resultado en el hilo de Tk"""
+        self.pedidos.put((tarea, args, al_terminar, al_fallar))
+    
+    def avisar(self, callback, valor):
+        """Entrega un valor a la ventana desde cualquier hilo"""
+        self.respuestas.put((callback, valor))
+    
+    def revisar_respuestas(self):
+        try:
+            while True:
+                try:
+                    callback, valor = self.respuestas.get_nowait()
+                except queue.Empty:
+                    break
+                if callback is not None:
+                    callback(valor)
+        finally:
+            self.root.after(self.INTERVALO_MS, self.revisar_respuestas)
+    
+    def detener(self, espera=5):
+        """Termina las tareas pendientes y cierra la conexión"""
+        self.pedidos.put(None)
+        self.join(espera)
+
 
 class RiegosApp:
     def __init__(self, root):
         self.root = root
         self.root.title("Registro de Riegos - Finca")
-        self.root.geometry("800x600")
+        self.root.geometry("800x700")
         
         # Inicializar base de datos
         self.init_database()
         
         # Variables
-        self.selected_blocks = {}
+        self.catalogo = CatalogoModulos('modulos.csv')
         self.tipo_riego_var = tk.StringVar(value="agua")
+        self.sistema_riego_var = tk.StringVar(value="ducha")
+        self.tiempo_var = tk.StringVar(value="10")
+        self.sincronizando = False
+        self.hoy_fecha = None
+        self.hoy_ultimo_id = 0
+        self.hoy_generacion = 0
+        
+        # Servidor web para sincronizar (p. ej. https://riegos.onrender.com);
+        # sin él la app funciona solo con la base local
+        self.servidor = os.environ.get('RIEGOS_SERVIDOR', '').strip()
+        self.sync_minutos = int(os.environ.get('RIEGOS_SYNC_MINUTOS', 5))
+        # Finca de esta instalación cuando el servidor atiende varias
+        self.finca = os.environ.get('RIEGOS_FINCA', '').strip() or None
         
         # Crear interfaz
         self.create_widgets()
         self.load_today_data()
+        self.actualizar_pendientes()
+        if self.servidor and self.sync_minutos > 0:
+            self.root.after(2000, self.sincronizar_periodicamente)
     
     def init_database(self):
-        """Inicializa la base de datos SQLite"""
-        self.conn = sqlite3.connect('riegos.db')
-        self.cursor = self.conn.cursor()
-        
-        # Crear tabla de riegos
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS riegos (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                fecha DATE NOT NULL,
-                bloque TEXT NOT NULL,
-                tipo_riego TEXT NOT NULL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        self.conn.commit()
+        """Inicializa la base de datos SQLite en el hilo de base de datos"""
+        self.db = TrabajadorDB(self.root, RUTA_DB, al_fallar=self.mostrar_error)
+        self.db.encargar(migrar_esquema)
+    
+    def mostrar_error(self, error):
+        messagebox.showerror("Error", f"Error en la base de datos: {error}")
     
     def create_widgets(self):
         """Crea los widgets de la interfaz"""
@@ -67,21 +248,31 @@ class RiegosApp:
                        variable=self.tipo_riego_var, 
                        value="comida").grid(row=0, column=1, padx=10)
         
-        # Frame para bloques
-        bloques_frame = ttk.LabelFrame(main_frame, text="Seleccionar Bloques", padding="10")
+        # Sistema y tiempo de riego (mismos valores que la web)
+        ttk.Radiobutton(tipo_frame, text="Ducha", 
+                       variable=self.sistema_riego_var, 
+                       value="ducha").grid(row=1, column=0, padx=10, pady=(5, 0))
+        ttk.Radiobutton(tipo_frame, text="Goteo", 
+                       variable=self.sistema_riego_var, 
+                       value="goteo").grid(row=1, column=1, padx=10, pady=(5, 0))
+        ttk.Label(tipo_frame, text="Minutos:").grid(row=1, column=2, padx=(10, 5), pady=(5, 0))
+        ttk.Combobox(tipo_frame, textvariable=self.tiempo_var, state='readonly', width=5,
+                     values=["5", "7", "10", "14", "15"]).grid(row=1, column=3, pady=(5, 0))
+        
+        # Frame para módulos (catálogo de modulos.csv, selección múltiple)
+        bloques_frame = ttk.LabelFrame(main_frame, text="Seleccionar Módulos", padding="10")
         bloques_frame.grid(row=3, column=0, columnspan=2, pady=10, sticky=(tk.W, tk.E, tk.N, tk.S))
         
-        # Crear checkboxes para bloques (ejemplo: Bloque A-J)
-        self.bloques = ['Bloque A', 'Bloque B', 'Bloque C', 'Bloque D', 'Bloque E',
-                        'Bloque F', 'Bloque G', 'Bloque H', 'Bloque I', 'Bloque J']
-        
-        for i, bloque in enumerate(self.bloques):
-            var = tk.BooleanVar()
-            self.selected_blocks[bloque] = var
-            row = i // 3
-            col = i % 3
-            ttk.Checkbutton(bloques_frame, text=bloque, variable=var).grid(
-                row=row, column=col, padx=10, pady=5, sticky=tk.W)
+        self.bloques = self.catalogo.todos()
+        self.modulos_list = tk.Listbox(bloques_frame, selectmode=tk.MULTIPLE, height=8,
+                                       exportselection=False)
+        self.modulos_list.insert(tk.END, *self.bloques)
+        self.modulos_list.grid(row=0, column=0, sticky=(tk.W, tk.E))
+        modulos_scroll = ttk.Scrollbar(bloques_frame, orient=tk.VERTICAL,
+                                       command=self.modulos_list.yview)
+        modulos_scroll.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        self.modulos_list.configure(yscrollcommand=modulos_scroll.set)
+        bloques_frame.columnconfigure(0, weight=1)
         
         # Botones
         button_frame = ttk.Frame(main_frame)
@@ -93,13 +284,18 @@ class RiegosApp:
                   command=self.ver_historial).grid(row=0, column=1, padx=5)
         ttk.Button(button_frame, text="Limpiar Selección", 
                   command=self.limpiar_seleccion).grid(row=0, column=2, padx=5)
+        ttk.Button(button_frame, text="Sincronizar", 
+                  command=self.sincronizar).grid(row=0, column=3, padx=5)
+        
+        self.sync_label = ttk.Label(button_frame, text="")
+        self.sync_label.grid(row=1, column=0, columnspan=4, pady=(5, 0))
         
         # Frame para mostrar registros del día
         historial_frame = ttk.LabelFrame(main_frame, text="Registros de Hoy", padding="10")
         historial_frame.grid(row=5, column=0, columnspan=2, pady=10, sticky=(tk.W, tk.E, tk.N, tk.S))
         
         # Treeview para mostrar registros
-        columns = ('Hora', 'Bloque', 'Tipo de Riego')
+        columns = ('Hora', 'Módulo', 'Tipo de Riego')
         self.tree = ttk.Treeview(historial_frame, columns=columns, show='headings', height=8)
         
         for col in columns:
@@ -121,123 +317,315 @@ class RiegosApp:
     
     def registrar_riego(self):
         """Registra los riegos seleccionados en la base de datos"""
-        bloques_seleccionados = [bloque for bloque, var in self.selected_blocks.items() 
-                                if var.get()]
+        bloques_seleccionados = [self.bloques[i] for i in self.modulos_list.curselection()]
         
         if not bloques_seleccionados:
             messagebox.showwarning("Advertencia", 
-                                  "Por favor seleccione al menos un bloque")
+                                  "Por favor seleccione al menos un módulo")
             return
         
         tipo_riego = self.tipo_riego_var.get()
+        sistema_riego = self.sistema_riego_var.get()
+        tiempo_minutos = int(self.tiempo_var.get())
         fecha_hoy = datetime.now().strftime('%Y-%m-%d')
+        # Instante UTC, como todas las marcas de la base; se muestra en hora de Ecuador
+        timestamp = actualizado_en = instante_utc()
         
-        try:
-            for bloque in bloques_seleccionados:
-                self.cursor.execute('''
-                    INSERT INTO riegos (fecha, bloque, tipo_riego)
-                    VALUES (?, ?, ?)
-                ''', (fecha_hoy, bloque, tipo_riego))
-            
-            self.conn.commit()
-            
+        filas = [(str(uuid.uuid4()), fecha_hoy, bloque, tipo_riego, sistema_riego,
+                  tiempo_minutos, timestamp, actualizado_en)
+                 for bloque in bloques_seleccionados]
+        
+        def registrados(_):
+            # Primero se piden las filas nuevas: el aviso es modal
+            self.load_today_data()
+            self.actualizar_pendientes()
             tipo_texto = "Agua" if tipo_riego == "agua" else "Comida (Fertilizante)"
             messagebox.showinfo("Éxito", 
                               f"Riego registrado correctamente\n" +
-                              f"Bloques: {', '.join(bloques_seleccionados)}\n" +
+                              f"Módulos: {', '.join(bloques_seleccionados)}\n" +
                               f"Tipo: {tipo_texto}")
-            
-            self.limpiar_seleccion()
-            self.load_today_data()
-            
-        except Exception as e:
+        
+        def fallido(e):
             messagebox.showerror("Error", f"Error al registrar: {str(e)}")
+        
+        self.db.encargar(insertar_riegos, filas, al_terminar=registrados, al_fallar=fallido)
+        self.limpiar_seleccion()
     
-    def load_today_data(self):
-        """Carga los datos del día actual en el treeview"""
-        # Limpiar treeview
-        for item in self.tree.get_children():
-            self.tree.delete(item)
+    def load_today_data(self, completo=False):
+        """Carga en el treeview los riegos de hoy que aún no muestra.
         
+        Solo pide las filas con id mayor que la última mostrada; la lista se
+        rehace entera al cambiar de día o con completo=True (tras sincronizar,
+        cuando pueden haber cambiado filas ya mostradas).
+        """
         fecha_hoy = datetime.now().strftime('%Y-%m-%d')
-        
-        self.cursor.execute('''
-            SELECT timestamp, bloque, tipo_riego 
-            FROM riegos 
-            WHERE fecha = ?
-            ORDER BY timestamp DESC
-        ''', (fecha_hoy,))
-        
-        registros = self.cursor.fetchall()
-        
-        for registro in registros:
-            timestamp, bloque, tipo_riego = registro
-            hora = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S').strftime('%H:%M:%S')
-            tipo_texto = "Agua" if tipo_riego == "agua" else "Comida (Fertilizante)"
-            self.tree.insert('', 0, values=(hora, bloque, tipo_texto))
+        if completo or fecha_hoy != self.hoy_fecha:
+            self.tree.delete(*self.tree.get_children())
+            self.hoy_fecha = fecha_hoy
+            self.hoy_ultimo_id = 0
+            # Una respuesta pedida antes de vaciar la lista ya no vale
+            self.hoy_generacion += 1
+        generacion = self.hoy_generacion
+        
+        def mostrar(registros):
+            if generacion != self.hoy_generacion:
+                return
+            for id_registro, timestamp, bloque, tipo_riego in registros:
+                if id_registro <= self.hoy_ultimo_id:
+                    continue
+                tipo_texto = "Agua" if tipo_riego == "agua" else "Comida (Fertilizante)"
+                self.tree.insert('', tk.END, values=(hora_ecuador(timestamp or ''), bloque, tipo_texto))
+            if registros:
+                self.hoy_ultimo_id = max(self.hoy_ultimo_id, max(r[0] for r in registros))
+        
+        self.db.encargar(leer_riegos_dia, fecha_hoy, self.hoy_ultimo_id, al_terminar=mostrar)
+    
+    def actualizar_pendientes(self):
+        self.db.encargar(contar_pendientes,
+                         al_terminar=lambda n: self.sync_label.config(text=self.texto_pendientes(n)))
+    
+    def texto_pendientes(self, pendientes):
+        if not self.servidor:
+            return f"Sin servidor configurado (RIEGOS_SERVIDOR) - {pendientes} cambio(s) sin subir"
+        return f"{pendientes} cambio(s) pendientes de sincronizar"
+    
+    def sincronizar(self, silencioso=False):
+        """Sincroniza con el servidor en un hilo aparte para no congelar la ventana"""
+        if not self.servidor:
+            if not silencioso:
+                messagebox.showwarning("Advertencia", 
+                                      "Configure RIEGOS_SERVIDOR con la URL de la app web")
+            return
+        if self.sincronizando:
+            return
+        self.sincronizando = True
+        self.sync_label.config(text="Sincronizando...")
+        
+        def trabajar():
+            try:
+                resumen = SincronizadorLocal(RUTA_DB, self.servidor, finca=self.finca).sincronizar()
+                error = None
+            except Exception as e:
+                resumen, error = None, e
+            self.db.avisar(self.sincronizacion_terminada, (resumen, error, silencioso))
+        
+        threading.Thread(target=trabajar, name='sincronizacion', daemon=True).start()
+    
+    def sincronizacion_terminada(self, resultado):
+        resumen, error, silencioso = resultado
+        self.sincronizando = False
+        if error is not None:
+            # Sin conexión no es un error: los cambios quedan pendientes
+            self.db.encargar(contar_pendientes, al_terminar=lambda n: self.sync_label.config(
+                text=f"Sin conexión con el servidor - {self.texto_pendientes(n)}"))
+            if not silencioso:
+                messagebox.showerror("Error", f"Error al sincronizar: {error}")
+            return
+        self.sync_label.config(text=(
+            f"Sincronizado: {resumen['enviados']} enviados, {resumen['recibidos']} recibidos, "
+            f"{resumen['borrados']} borrados en {resumen['viajes']} viaje(s)"))
+        if resumen['recibidos'] or resumen['borrados']:
+            self.load_today_data(completo=True)
+    
+    def sincronizar_periodicamente(self):
+        self.sincronizar(silencioso=True)
+        self.root.after(self.sync_minutos * 60 * 1000, self.sincronizar_periodicamente)
     
     def ver_historial(self):
         """Abre una ventana con el historial completo"""
         historial_window = tk.Toplevel(self.root)
         historial_window.title("Historial de Riegos")
         historial_window.geometry("700x500")
-        
-        # Frame principal
-        frame = ttk.Frame(historial_window, padding="10")
+        HistorialPaginado(historial_window, self.db, self.bloques)
+    
+    def limpiar_seleccion(self):
+        """Limpia la selección de módulos"""
+        self.modulos_list.selection_clear(0, tk.END)
+    
+    def __del__(self):
+        """Cierra la conexión a la base de datos al cerrar la aplicación"""
+        if hasattr(self, 'db'):
+            self.db.detener()
+
+
+def _formatear_fecha(fecha):
+    """'AAAA-MM-DD' -> 'DD/MM/AAAA' sin pasar por strptime"""
+    return f"{fecha[8:10]}/{fecha[5:7]}/{fecha[:4]}"
+
+
+def _leer_fecha(texto):
+    """Fecha de un filtro en DD/MM/AAAA (o AAAA-MM-DD) como 'AAAA-MM-DD'; None si está vacío"""
+    texto = texto.strip()
+    if not texto:
+        return None
+    for formato in ('%d/%m/%Y', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(texto, formato).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    raise ValueError(f"Fecha inválida: {texto} (use DD/MM/AAAA)")
+
+
+class HistorialPaginado:
+    """Historial que se carga por páginas a medida que se desplaza la lista.
+    
+    Cada página es una consulta por clave (timestamp, id) con LIMIT, así que
+    abrir la ventana cuesta lo mismo con una semana o con años de registros.
+    Los filtros de fecha y módulo van en el WHERE de la consulta.
+    """
+    
+    TAMANO_PAGINA = 200
+    
+    def __init__(self, ventana, db, bloques):
+        self.ventana = ventana
+        self.db = db
+        self.generacion = 0
+        self.ultima_clave = None
+        self.cargados = 0
+        self.agotado = False
+        self.cargando = False
+        self.filtros = (None, None, None)
+        
+        frame = ttk.Frame(ventana, padding="10")
         frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         
+        # Filtros
+        filtros_frame = ttk.Frame(frame)
+        filtros_frame.grid(row=0, column=0, columnspan=2, pady=(0, 10), sticky=(tk.W, tk.E))
+        
+        ttk.Label(filtros_frame, text="Desde:").grid(row=0, column=0, padx=(0, 5))
+        self.desde_var = tk.StringVar()
+        ttk.Entry(filtros_frame, textvariable=self.desde_var, width=12).grid(row=0, column=1)
+        ttk.Label(filtros_frame, text="Hasta:").grid(row=0, column=2, padx=(10, 5))
+        self.hasta_var = tk.StringVar()
+        ttk.Entry(filtros_frame, textvariable=self.hasta_var, width=12).grid(row=0, column=3)
+        ttk.Label(filtros_frame, text="Módulo:").grid(row=0, column=4, padx=(10, 5))
+        self.bloque_var = tk.StringVar(value="Todos")
+        ttk.Combobox(filtros_frame, textvariable=self.bloque_var, state='readonly', width=12,
+                     values=["Todos"] + list(bloques)).grid(row=0, column=5)
+        ttk.Button(filtros_frame, text="Filtrar",
+                   command=self.aplicar_filtros).grid(row=0, column=6, padx=(10, 0))
+        
         # Treeview
-        columns = ('Fecha', 'Hora', 'Bloque', 'Tipo de Riego')
-        tree = ttk.Treeview(frame, columns=columns, show='headings', height=20)
+        columns = ('Fecha', 'Hora', 'Módulo', 'Tipo de Riego')
+        self.tree = ttk.Treeview(frame, columns=columns, show='headings', height=20)
         
         for col in columns:
-            tree.heading(col, text=col)
-            tree.column(col, width=150)
-        
-        tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
-        
-        # Scrollbar
-        scrollbar = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=tree.yview)
-        scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
-        tree.configure(yscrollcommand=scrollbar.set)
+            self.tree.heading(col, text=col)
+            self.tree.column(col, width=150)
         
-        # Cargar datos
-        self.cursor.execute('''
-            SELECT fecha, timestamp, bloque, tipo_riego 
-            FROM riegos 
-            ORDER BY timestamp DESC
-        ''')
+        self.tree.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         
-        registros = self.cursor.fetchall()
+        # Scrollbar: al acercarse al final se pide la página siguiente
+        self.scrollbar = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.scrollbar.grid(row=1, column=1, sticky=(tk.N, tk.S))
+        self.tree.configure(yscrollcommand=self.al_desplazar)
         
-        for registro in registros:
-            fecha, timestamp, bloque, tipo_riego = registro
-            fecha_format = datetime.strptime(fecha, '%Y-%m-%d').strftime('%d/%m/%Y')
-            hora = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S').strftime('%H:%M:%S')
-            tipo_texto = "Agua" if tipo_riego == "agua" else "Comida (Fertilizante)"
-            tree.insert('', tk.END, values=(fecha_format, hora, bloque, tipo_texto))
+        self.estado_label = ttk.Label(frame, text="")
+        self.estado_label.grid(row=2, column=0, columnspan=2, pady=(5, 0), sticky=tk.W)
         
         # Configurar pesos
-        historial_window.columnconfigure(0, weight=1)
-        historial_window.rowconfigure(0, weight=1)
+        ventana.columnconfigure(0, weight=1)
+        ventana.rowconfigure(0, weight=1)
         frame.columnconfigure(0, weight=1)
-        frame.rowconfigure(0, weight=1)
+        frame.rowconfigure(1, weight=1)
+        
+        self.cargar_pagina()
     
-    def limpiar_seleccion(self):
-        """Limpia la selección de bloques"""
-        for var in self.selected_blocks.values():
-            var.set(False)
+    def aplicar_filtros(self):
+        """Vacía la lista y la vuelve a cargar desde la primera página con los filtros"""
+        try:
+            desde = _leer_fecha(self.desde_var.get())
+            hasta = _leer_fecha(self.hasta_var.get())
+        except ValueError as e:
+            messagebox.showwarning("Advertencia", str(e), parent=self.ventana)
+            return
+        bloque = self.bloque_var.get()
+        self.filtros = (desde, hasta, None if bloque == "Todos" else bloque)
+        self.tree.delete(*self.tree.get_children())
+        self.ultima_clave = None
+        self.cargados = 0
+        self.agotado = False
+        self.cargando = False
+        self.generacion += 1
+        self.cargar_pagina()
     
-    def __del__(self):
-        """Cierra la conexión a la base de datos al cerrar la aplicación"""
-        if hasattr(self, 'conn'):
-            self.conn.close()
+    def al_desplazar(self, primero, ultimo):
+        self.scrollbar.set(primero, ultimo)
+        if float(ultimo) > 0.9:
+            self.cargar_pagina()
+    
+    def consulta_pagina(self):
+        """SQL y parámetros de la página siguiente a self.ultima_clave"""
+        desde, hasta, bloque = self.filtros
+        condiciones, parametros = ['borrado = 0'], []
+        if desde:
+            condiciones.append('fecha >= ?')
+            parametros.append(desde)
+        if hasta:
+            condiciones.append('fecha <= ?')
+            parametros.append(hasta)
+        if bloque:
+            condiciones.append('modulo = ?')
+            parametros.append(bloque)
+        if self.ultima_clave is not None:
+            condiciones.append('(timestamp, id) < (?, ?)')
+            parametros.extend(self.ultima_clave)
+        where = f"WHERE {' AND '.join(condiciones)}"
+        sql = f'''
+            SELECT id, fecha, timestamp, modulo, tipo_riego
+            FROM riegos
+            {where}
+            ORDER BY timestamp DESC, id DESC
+            LIMIT ?
+        '''
+        return sql, parametros + [self.TAMANO_PAGINA]
+    
+    def cargar_pagina(self):
+        """Pide la página siguiente; llega a pagina_cargada por el hilo de base de datos"""
+        if self.agotado or self.cargando:
+            return
+        self.cargando = True
+        sql, parametros = self.consulta_pagina()
+        generacion = self.generacion
+        self.db.encargar(leer_pagina, sql, parametros,
+                         al_terminar=lambda registros: self.pagina_cargada(generacion, registros),
+                         al_fallar=lambda error: self.pagina_fallida(generacion, error))
+    
+    def pagina_cargada(self, generacion, registros):
+        """Agrega la página al final de la lista"""
+        # Ventana cerrada, o filtros cambiados mientras la página viajaba
+        if generacion != self.generacion or not self.ventana.winfo_exists():
+            return
+        for id_registro, fecha, timestamp, bloque, tipo_riego in registros:
+            tipo_texto = "Agua" if tipo_riego == "agua" else "Comida (Fertilizante)"
+            self.tree.insert('', tk.END, values=(_formatear_fecha(fecha), hora_ecuador(timestamp or ''),
+                                                 bloque, tipo_texto))
+        
+        if registros:
+            ultimo = registros[-1]
+            self.ultima_clave = (ultimo[2], ultimo[0])
+        self.cargados += len(registros)
+        self.agotado = len(registros) < self.TAMANO_PAGINA
+        self.cargando = False
+        
+        sufijo = "" if self.agotado else " (desplace para ver más)"
+        self.estado_label.config(text=f"{self.cargados} registros{sufijo}")
+    
+    def pagina_fallida(self, generacion, error):
+        """Muestra el error y deja pedir la página de nuevo al desplazar"""
+        if generacion != self.generacion or not self.ventana.winfo_exists():
+            return
+        self.cargando = False
+        self.estado_label.config(text=f"{self.cargados} registros - error al cargar: {error}")
 
 
 def main():
     root = tk.Tk()
     app = RiegosApp(root)
     root.mainloop()
+    # Las escrituras encoladas se terminan antes de salir
+    app.db.detener()
 
 
 if __name__ == "__main__":
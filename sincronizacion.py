@@ -0,0 +1,223 @@
+"""Sincronización entre la app de escritorio (riegos_app.py) y el servidor.
+
+El escritorio guarda todo en su riegos.db y anota cada cambio local en
+cambios_pendientes, así puede registrar riegos sin conexión. Al sincronizar,
+cada viaje a POST /sync hace las dos cosas a la vez:
+
+- sube hasta un lote de cambios pendientes (filas y borrados), y
+- baja la página siguiente de cambios del servidor desde la última versión vista.
+
+Los cuerpos van como JSON comprimido con gzip. Los conflictos se resuelven con
+"gana la última escritura" según actualizado_en (instante UTC con milisegundos),
+y los borrados viajan como lápidas (uuid, actualizado_en) para que una copia
+vieja no reviva una fila borrada. Varias semanas sin conexión cuestan
+max(pendientes, cambios remotos) / lote viajes.
+"""
+import gzip
+import json
+import sqlite3
+import urllib.request
+import uuid as uuidlib
+from datetime import date, datetime, timezone
+
+LOTE = 1000
+LOTE_MAX = 5000
+
+COLUMNAS = ('uuid', 'fecha', 'modulo', 'tipo_riego', 'sistema_riego',
+            'tiempo_minutos', 'timestamp', 'actualizado_en')
+TIPOS_RIEGO = {'agua', 'comida'}
+SISTEMAS_RIEGO = {'ducha', 'goteo', 'N/A'}
+
+
+def instante_utc(momento=None):
+    """Instante UTC 'AAAA-MM-DDTHH:MM:SS.mmmZ' (ahora si no se indica)"""
+    momento = (momento or datetime.now(timezone.utc)).astimezone(timezone.utc)
+    return momento.strftime('%Y-%m-%dT%H:%M:%S.') + f'{momento.microsecond // 1000:03d}Z'
+
+
+def normalizar_instante(texto):
+    """Lleva un instante ISO cualquiera (UTC si no trae zona) al formato de instante_utc.
+
+    Con un mismo formato las marcas se comparan como texto, en Python y en SQLite.
+    """
+    momento = datetime.fromisoformat(str(texto).replace('Z', '+00:00'))
+    if momento.tzinfo is None:
+        momento = momento.replace(tzinfo=timezone.utc)
+    return instante_utc(momento)
+
+
+def validar_fila(fila, modulos=None):
+    """Fila entrante normalizada; lanza ValueError si no sirve.
+
+    Con modulos (el catálogo de la finca) se rechazan los módulos que no
+    están en él, como los bloques de texto libre de las riegos.db viejas.
+    """
+    if not isinstance(fila, dict):
+        raise ValueError('La fila debe ser un objeto')
+    tipo_riego = fila.get('tipo_riego')
+    sistema_riego = fila.get('sistema_riego')
+    tiempo_minutos = fila.get('tiempo_minutos')
+    modulo = fila.get('modulo')
+    if tipo_riego not in TIPOS_RIEGO:
+        raise ValueError(f'tipo_riego inválido: {tipo_riego}')
+    if sistema_riego is not None and sistema_riego not in SISTEMAS_RIEGO:
+        raise ValueError(f'sistema_riego inválido: {sistema_riego}')
+    if tiempo_minutos is not None and (isinstance(tiempo_minutos, bool) or not isinstance(tiempo_minutos, int)):
+        raise ValueError(f'tiempo_minutos inválido: {tiempo_minutos}')
+    if not isinstance(modulo, str) or not modulo.strip():
+        raise ValueError('Falta el módulo')
+    if modulos is not None and modulo.strip() not in modulos:
+        raise ValueError(f'Módulo desconocido: {modulo.strip()!r}')
+    return {
+        'uuid': str(uuidlib.UUID(str(fila.get('uuid')))),
+        'fecha': date.fromisoformat(str(fila.get('fecha'))[:10]).isoformat(),
+        'modulo': modulo.strip(),
+        'tipo_riego': tipo_riego,
+        'sistema_riego': sistema_riego,
+        'tiempo_minutos': tiempo_minutos,
+        'timestamp': normalizar_instante(fila['timestamp']) if fila.get('timestamp') else None,
+        'actualizado_en': normalizar_instante(fila.get('actualizado_en')),
+    }
+
+
+def validar_borrado(borrado):
+    """Lápida entrante normalizada; lanza ValueError si no sirve"""
+    if not isinstance(borrado, dict):
+        raise ValueError('El borrado debe ser un objeto')
+    return {
+        'uuid': str(uuidlib.UUID(str(borrado.get('uuid')))),
+        'actualizado_en': normalizar_instante(borrado.get('actualizado_en')),
+    }
+
+
+def codificar(datos):
+    """Cuerpo gzip de un objeto JSON"""
+    return gzip.compress(json.dumps(datos, separators=(',', ':'), default=str).encode('utf-8'))
+
+
+def decodificar(cuerpo, codificacion=None):
+    """Objeto JSON de un cuerpo, descomprimido si viene con gzip"""
+    if codificacion == 'gzip':
+        try:
+            cuerpo = gzip.decompress(cuerpo)
+        except (OSError, EOFError) as e:
+            raise ValueError(f'Cuerpo gzip inválido: {e}') from e
+    try:
+        return json.loads(cuerpo or b'{}')
+    except ValueError as e:
+        raise ValueError(f'JSON inválido: {e}') from e
+
+
+class SincronizadorLocal:
+    """Lado del escritorio: sube cambios_pendientes y aplica los cambios del servidor"""
+
+    def __init__(self, ruta_db, url_servidor, lote=LOTE, timeout=60, finca=None):
+        self.ruta_db = ruta_db
+        self.url = url_servidor.rstrip('/') + '/sync'
+        self.lote = lote
+        self.timeout = timeout
+        # Sin finca el servidor usa su finca por defecto
+        self.finca = finca
+
+    def _viaje(self, datos):
+        encabezados = {
+            'Content-Type': 'application/json',
+            'Content-Encoding': 'gzip',
+            'Accept-Encoding': 'gzip',
+        }
+        if self.finca:
+            encabezados['X-Finca'] = self.finca
+        peticion = urllib.request.Request(self.url, data=codificar(datos), method='POST', headers=encabezados)
+        with urllib.request.urlopen(peticion, timeout=self.timeout) as respuesta:
+            return decodificar(respuesta.read(), respuesta.headers.get('Content-Encoding'))
+
+    def _pendientes(self, conn):
+        filas = conn.execute('''
+            SELECT r.uuid, r.fecha, r.modulo, r.tipo_riego, r.sistema_riego,
+                   r.tiempo_minutos, r.timestamp, r.actualizado_en, r.borrado
+            FROM cambios_pendientes c JOIN riegos r ON r.uuid = c.uuid
+            ORDER BY c.rowid
+            LIMIT ?
+        ''', (self.lote,)).fetchall()
+        subir, borrar = [], []
+        for fila in filas:
+            if fila[-1]:
+                borrar.append({'uuid': fila[0], 'actualizado_en': fila[7]})
+            else:
+                subir.append(dict(zip(COLUMNAS, fila[:-1])))
+        return subir, borrar
+
+    @staticmethod
+    def _aplicar(conn, respuesta):
+        # Lo que manda el servidor ya pasó por validar_fila al entrar; solo se
+        # llevan las marcas al formato local para poder compararlas y
+        # ordenarlas como texto
+        filas = [dict({c: f.get(c) for c in COLUMNAS},
+                      timestamp=normalizar_instante(f['timestamp']) if f.get('timestamp') else None,
+                      actualizado_en=normalizar_instante(f['actualizado_en']))
+                 for f in respuesta.get('filas', [])]
+        borrados = [validar_borrado(b) for b in respuesta.get('borrados', [])]
+        # Gana la marca más reciente; el eco de lo que acabamos de subir no cambia nada
+        conn.executemany('''
+            INSERT INTO riegos (uuid, fecha, modulo, tipo_riego, sistema_riego,
+                                tiempo_minutos, timestamp, actualizado_en, borrado)
+            VALUES (:uuid, :fecha, :modulo, :tipo_riego, :sistema_riego,
+                    :tiempo_minutos, :timestamp, :actualizado_en, 0)
+            ON CONFLICT (uuid) DO UPDATE SET
+                fecha = excluded.fecha,
+                modulo = excluded.modulo,
+                tipo_riego = excluded.tipo_riego,
+                sistema_riego = excluded.sistema_riego,
+                tiempo_minutos = excluded.tiempo_minutos,
+                timestamp = excluded.timestamp,
+                actualizado_en = excluded.actualizado_en,
+                borrado = 0
+            WHERE excluded.actualizado_en > riegos.actualizado_en
+        ''', filas)
+        conn.executemany('''
+            UPDATE riegos SET borrado = 1, actualizado_en = :actualizado_en
+            WHERE uuid = :uuid AND actualizado_en <= :actualizado_en
+        ''', borrados)
+        return len(filas), len(borrados)
+
+    def sincronizar(self):
+        """Sincroniza hasta que no quedan pendientes ni cambios remotos.
+
+        Devuelve {'enviados', 'recibidos', 'borrados', 'rechazados', 'viajes'}.
+        """
+        resumen = {'enviados': 0, 'recibidos': 0, 'borrados': 0, 'rechazados': 0, 'viajes': 0}
+        conn = sqlite3.connect(self.ruta_db, timeout=30)
+        try:
+            while True:
+                fila = conn.execute(
+                    "SELECT valor FROM sync_estado WHERE clave = 'version_servidor'").fetchone()
+                version = int(fila[0]) if fila else 0
+                subir, borrar = self._pendientes(conn)
+                # Marcas de lo enviado: si el usuario vuelve a editar una fila
+                # mientras viaja, su cambio sigue pendiente para el próximo viaje
+                enviados = [(c['uuid'], c['actualizado_en']) for c in subir + borrar]
+
+                respuesta = self._viaje({'desde': version, 'limite': self.lote,
+                                         'filas': subir, 'borrados': borrar})
+                resumen['viajes'] += 1
+
+                with conn:
+                    # Antes de aplicar lo recibido: un cambio local que perdió el
+                    # conflicto también sale de pendientes
+                    conn.executemany('''
+                        DELETE FROM cambios_pendientes
+                        WHERE uuid = ? AND uuid IN (SELECT uuid FROM riegos WHERE actualizado_en = ?)
+                    ''', enviados)
+                    recibidos, borrados = self._aplicar(conn, respuesta)
+                    conn.execute(
+                        "INSERT OR REPLACE INTO sync_estado (clave, valor) VALUES ('version_servidor', ?)",
+                        (str(respuesta.get('version', version)),))
+
+                resumen['enviados'] += len(enviados) - len(respuesta.get('rechazados', []))
+                resumen['rechazados'] += len(respuesta.get('rechazados', []))
+                resumen['recibidos'] += recibidos
+                resumen['borrados'] += borrados
+                if len(enviados) < self.lote and not respuesta.get('mas'):
+                    return resumen
+        finally:
+            conn.close()
@@ -0,0 +1,127 @@
+// Página historial
+
+let todosRegistros = [];
+let siguienteCursor = null;
+let cargandoPagina = false;
+let tamanoPrimeraPagina = 0;
+
+// Cargar estadísticas
+async function cargarEstadisticas() {
+    try {
+        const stats = await fetchConValidador('/estadisticas');
+
+        document.getElementById('registrosHoy').textContent = stats.registros_hoy;
+        document.getElementById('totalRegistros').textContent = stats.total_registros;
+    } catch (error) {
+        console.error('Error:', error);
+    }
+}
+
+// Pedir una página del historial (sin cursor = la más reciente)
+async function pedirPagina(cursor) {
+    let url = '/historial-completo?format=columnar';
+    if (cursor) {
+        url += `&cursor=${encodeURIComponent(cursor)}`;
+    }
+    const pagina = await fetchConValidador(url);
+    return { registros: decodificarColumnar(pagina.registros), siguiente: pagina.siguiente };
+}
+
+// Cargar (o refrescar) la primera página conservando las ya cargadas
+async function cargarHistorial() {
+    try {
+        const pagina = await pedirPagina(null);
+        const ids = new Set(pagina.registros.map(reg => reg.id));
+        const anteriores = todosRegistros.slice(tamanoPrimeraPagina).filter(reg => !ids.has(reg.id));
+
+        todosRegistros = pagina.registros.concat(anteriores);
+        tamanoPrimeraPagina = pagina.registros.length;
+        if (anteriores.length === 0) {
+            siguienteCursor = pagina.siguiente;
+        }
+
+        aplicarBusqueda();
+    } catch (error) {
+        console.error('Error:', error);
+        document.getElementById('historialBody').innerHTML = 
+            '<tr><td colspan="4" class="no-data">Error al cargar el historial</td></tr>';
+    }
+}
+
+// Cargar la siguiente página bajo demanda
+async function cargarMasHistorial() {
+    if (!siguienteCursor || cargandoPagina) {
+        return;
+    }
+    cargandoPagina = true;
+    try {
+        const pagina = await pedirPagina(siguienteCursor);
+        const ids = new Set(todosRegistros.map(reg => reg.id));
+        todosRegistros = todosRegistros.concat(pagina.registros.filter(reg => !ids.has(reg.id)));
+        siguienteCursor = pagina.siguiente;
+        aplicarBusqueda();
+    } catch (error) {
+        console.error('Error:', error);
+    } finally {
+        cargandoPagina = false;
+    }
+}
+
+// Mostrar registros en la tabla
+function mostrarRegistros(registros) {
+    const tbody = document.getElementById('historialBody');
+
+    if (registros.length === 0) {
+        tbody.innerHTML = '<tr><td colspan="4" class="no-data">No hay registros</td></tr>';
+    } else {
+        tbody.innerHTML = registros.map(reg => `
+            <tr>
+                <td>${reg.fecha}</td>
+                <td>${reg.hora}</td>
+                <td><span class="badge">${reg.modulo}</span></td>
+                <td><span class="badge ${reg.tipo_riego === 'Agua' ? 'badge-agua' : 'badge-comida'}">${reg.tipo_riego}</span></td>
+            </tr>
+        `).join('');
+    }
+}
+
+// Buscar en historial (sobre las páginas ya cargadas)
+function aplicarBusqueda() {
+    const search = document.getElementById('searchHistorial').value.toLowerCase();
+
+    const filtrados = search === '' ? todosRegistros : todosRegistros.filter(reg => 
+        reg.fecha.toLowerCase().includes(search) ||
+        reg.modulo.toLowerCase().includes(search) ||
+        reg.tipo_riego.toLowerCase().includes(search)
+    );
+
+    mostrarRegistros(filtrados);
+    document.getElementById('cargarMasContainer').style.display = siguienteCursor ? 'flex' : 'none';
+}
+
+document.getElementById('searchHistorial').addEventListener('input', aplicarBusqueda);
+
+// Cargar la siguiente página al llegar al final de la tabla
+if ('IntersectionObserver' in window) {
+    new IntersectionObserver(entries => {
+        if (entries.some(entry => entry.isIntersecting)) {
+            cargarMasHistorial();
+        }
+    }).observe(document.getElementById('cargarMasContainer'));
+}
+
+// Cargar datos al iniciar
+cargarEstadisticas();
+cargarHistorial();
+
+// Recibir los cambios en vivo; si no hay EventSource, actualizar cada 30 segundos
+function actualizarTodo() {
+    cargarEstadisticas();
+    cargarHistorial();
+}
+
+if (suscribirEventos('/eventos', actualizarTodo)) {
+    setInterval(actualizarTodo, 300000);
+} else {
+    setInterval(actualizarTodo, 30000);
+}
@@ -0,0 +1,460 @@
+// Página principal
+
+// Cargar fecha actual
+const fecha = new Date().toLocaleDateString('es-ES', { 
+    weekday: 'long', 
+    year: 'numeric', 
+    month: 'long', 
+    day: 'numeric' 
+});
+document.querySelector('.fecha').textContent = fecha.charAt(0).toUpperCase() + fecha.slice(1);
+
+// Gestión de campos dinámicos
+const checkAgua = document.getElementById('checkAgua');
+const checkComida = document.getElementById('checkComida');
+const sistemaCard = document.getElementById('sistemaCard');
+const tiempoCard = document.getElementById('tiempoCard');
+const sistemaDucha = document.getElementById('sistemaDucha');
+const sistemaGoteo = document.getElementById('sistemaGoteo');
+
+// Mostrar/ocultar campos según selección de tipo de riego
+function actualizarCamposDinamicos() {
+    const algunoSeleccionado = checkAgua.checked || checkComida.checked;
+
+    if (algunoSeleccionado) {
+        sistemaCard.style.display = 'block';
+    } else {
+        sistemaCard.style.display = 'none';
+        tiempoCard.style.display = 'none';
+        // Limpiar selecciones
+        document.querySelectorAll('input[name="sistema_riego"]').forEach(r => r.checked = false);
+        document.querySelectorAll('input[name="tiempo_riego"]').forEach(r => r.checked = false);
+    }
+}
+
+// Mostrar tiempo cuando se selecciona sistema
+function actualizarCampoTiempo() {
+    const sistemaSeleccionado = document.querySelector('input[name="sistema_riego"]:checked');
+
+    if (sistemaSeleccionado) {
+        tiempoCard.style.display = 'block';
+    } else {
+        tiempoCard.style.display = 'none';
+        document.querySelectorAll('input[name="tiempo_riego"]').forEach(r => r.checked = false);
+    }
+}
+
+// Event listeners para tipo de riego
+checkAgua.addEventListener('change', actualizarCamposDinamicos);
+checkComida.addEventListener('change', actualizarCamposDinamicos);
+
+// Event listeners para sistema de riego
+sistemaDucha.addEventListener('change', actualizarCampoTiempo);
+sistemaGoteo.addEventListener('change', actualizarCampoTiempo);
+
+// Gestión de módulos seleccionados
+let modulosSeleccionados = new Set();
+
+const moduloInput = document.getElementById('moduloInput');
+const dropdown = document.getElementById('moduloDropdown');
+
+// Busca en el catálogo del servidor los módulos que empiezan con el
+// texto escrito; las respuestas se revalidan por ETag
+let busquedaPendiente = null;
+let ultimaBusqueda = 0;
+
+function buscarModulos(texto) {
+    clearTimeout(busquedaPendiente);
+    busquedaPendiente = setTimeout(async () => {
+        const numero = ++ultimaBusqueda;
+        try {
+            const datos = await fetchConValidador(`/modulos?q=${encodeURIComponent(texto.trim())}`);
+            // Ignorar respuestas de búsquedas ya reemplazadas por otra
+            if (numero === ultimaBusqueda) {
+                mostrarResultados(datos.grupos);
+            }
+        } catch (error) {
+            console.error('Error buscando módulos:', error);
+        }
+    }, texto ? 120 : 0);
+}
+
+// Los bloques con varios módulos (31, 31A–31G) llevan un encabezado
+// que agrega el bloque completo
+function mostrarResultados(grupos) {
+    if (grupos.length === 0) {
+        dropdown.innerHTML = '';
+        dropdown.style.display = 'none';
+        return;
+    }
+    dropdown.innerHTML = grupos.map(grupo => {
+        const items = grupo.modulos.map(modulo =>
+            `<div class="dropdown-item" data-value="${modulo}">${modulo}</div>`).join('');
+        if (grupo.modulos.length === 1) {
+            return items;
+        }
+        return `<div class="dropdown-grupo" data-modulos="${grupo.modulos.join(',')}">
+                Bloque ${grupo.etiqueta} <span>(${grupo.modulos.length})</span>
+            </div>${items}`;
+    }).join('');
+    dropdown.style.display = 'block';
+}
+
+moduloInput.addEventListener('click', () => buscarModulos(moduloInput.value));
+moduloInput.addEventListener('focus', () => buscarModulos(moduloInput.value));
+moduloInput.addEventListener('input', e => buscarModulos(e.target.value));
+
+// Seleccionar un módulo o un bloque completo del dropdown
+dropdown.addEventListener('click', function(e) {
+    const grupo = e.target.closest('.dropdown-grupo');
+    const item = e.target.closest('.dropdown-item');
+    if (grupo) {
+        grupo.dataset.modulos.split(',').forEach(agregarModulo);
+    } else if (item) {
+        agregarModulo(item.dataset.value);
+    } else {
+        return;
+    }
+    moduloInput.value = '';
+    buscarModulos('');
+    moduloInput.focus();
+});
+
+// Agregar módulo a la lista
+function agregarModulo(modulo) {
+    if (!modulosSeleccionados.has(modulo)) {
+        modulosSeleccionados.add(modulo);
+        actualizarListaModulos();
+    }
+}
+
+// Remover módulo de la lista
+function removerModulo(modulo) {
+    modulosSeleccionados.delete(modulo);
+    actualizarListaModulos();
+}
+
+// Actualizar visualización de módulos seleccionados
+function actualizarListaModulos() {
+    const container = document.getElementById('selectedModulos');
+
+    if (modulosSeleccionados.size === 0) {
+        container.innerHTML = '<p class="no-selection">No hay módulos seleccionados</p>';
+    } else {
+        const modulosArray = Array.from(modulosSeleccionados);
+        container.innerHTML = modulosArray.map(modulo => {
+            return `<div class="selected-tag">
+                <span>${modulo}</span>
+                <button class="remove-btn" data-modulo="${modulo}" type="button">
+                    <i class="fas fa-times"></i>
+                </button>
+            </div>`;
+        }).join('');
+
+        // Agregar event listeners a los botones de remover
+        container.querySelectorAll('.remove-btn').forEach(btn => {
+            btn.addEventListener('click', function() {
+                const modulo = this.getAttribute('data-modulo');
+                removerModulo(modulo);
+            });
+        });
+    }
+}
+
+// Limpiar todos los módulos
+function limpiarModulos() {
+    modulosSeleccionados.clear();
+    actualizarListaModulos();
+}
+
+// Cerrar dropdown al hacer click fuera
+document.addEventListener('click', function(e) {
+    if (!e.target.closest('.select-container')) {
+        dropdown.style.display = 'none';
+    }
+});
+
+
+// Registrar riego
+async function registrarRiego() {
+    const modulos = Array.from(modulosSeleccionados);
+
+    const tiposRiego = Array.from(document.querySelectorAll('input[name="tipo_riego"]:checked'))
+        .map(cb => cb.value);
+
+    const sistemaRiego = document.querySelector('input[name="sistema_riego"]:checked')?.value;
+    const tiempoRiego = document.querySelector('input[name="tiempo_riego"]:checked')?.value;
+
+    if (modulos.length === 0) {
+        mostrarToast('Por favor seleccione al menos un módulo', 'error');
+        return;
+    }
+
+    if (tiposRiego.length === 0) {
+        mostrarToast('Por favor seleccione al menos un tipo de riego', 'error');
+        return;
+    }
+
+    if (!sistemaRiego) {
+        mostrarToast('Por favor seleccione el sistema de riego (Ducha o Goteo)', 'error');
+        return;
+    }
+
+    if (!tiempoRiego) {
+        mostrarToast('Por favor seleccione el tiempo de riego', 'error');
+        return;
+    }
+
+    try {
+        // La misma clave en todos los reintentos: el servidor no duplica el envío
+        const response = await fetchConReintentos('/registrar', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Idempotency-Key': nuevaClaveIdempotencia()
+            },
+            body: JSON.stringify({
+                modulos: modulos,
+                tipos_riego: tiposRiego,
+                sistema_riego: sistemaRiego,
+                tiempo_minutos: parseInt(tiempoRiego)
+            })
+        });
+
+        const data = await response.json();
+
+        if (response.ok) {
+            mostrarToast(data.message, 'success');
+            limpiarModulos();
+            document.querySelectorAll('input[name="tipo_riego"]').forEach(cb => cb.checked = false);
+            document.querySelectorAll('input[name="sistema_riego"]').forEach(r => r.checked = false);
+            document.querySelectorAll('input[name="tiempo_riego"]').forEach(r => r.checked = false);
+            sistemaCard.style.display = 'none';
+            tiempoCard.style.display = 'none';
+            cargarRegistrosHoy();
+        } else {
+            mostrarToast(data.error || 'Error al registrar', 'error');
+        }
+    } catch (error) {
+        mostrarToast('Error de conexión', 'error');
+        console.error('Error:', error);
+    }
+}
+
+// Cargar registros de hoy
+async function cargarRegistrosHoy() {
+    try {
+        const registros = decodificarColumnar(await fetchConValidador('/registros-hoy?format=columnar'));
+
+        const tbody = document.getElementById('registrosHoy');
+
+        if (registros.length === 0) {
+            tbody.innerHTML = '<tr><td colspan="6" class="no-data">No hay registros hoy</td></tr>';
+        } else {
+            tbody.innerHTML = registros.map(reg => `
+                <tr>
+                    <td>${reg.hora}</td>
+                    <td><span class="badge">${reg.modulo}</span></td>
+                    <td><span class="badge ${reg.tipo_riego === 'Agua' ? 'badge-agua' : 'badge-comida'}">${reg.tipo_riego}</span></td>
+                    <td><span class="badge badge-sistema">${reg.sistema_riego}</span></td>
+                    <td><span class="badge badge-tiempo">${reg.tiempo_minutos} min</span></td>
+                    <td>
+                        <button class="btn-edit" data-modulo="${reg.modulo}" data-fecha="${reg.fecha}" title="Editar registro">
+                            <i class="fas fa-edit"></i>
+                        </button>
+                        <button class="btn-delete" data-id="${reg.id}" title="Eliminar registro">
+                            <i class="fas fa-trash"></i>
+                        </button>
+                    </td>
+                </tr>
+            `).join('');
+
+            // Agregar event listeners a los botones
+            document.querySelectorAll('.btn-edit').forEach(btn => {
+                btn.addEventListener('click', function() {
+                    const modulo = this.getAttribute('data-modulo');
+                    const fecha = this.getAttribute('data-fecha');
+                    abrirModalEditar(modulo, fecha);
+                });
+            });
+
+            document.querySelectorAll('.btn-delete').forEach(btn => {
+                btn.addEventListener('click', function() {
+                    const id = this.getAttribute('data-id');
+                    eliminarRegistro(id);
+                });
+            });
+        }
+    } catch (error) {
+        console.error('Error:', error);
+    }
+}
+
+// Eliminar registro
+async function eliminarRegistro(id) {
+    if (!confirm('¿Está seguro de eliminar este registro?')) {
+        return;
+    }
+
+    try {
+        const response = await fetch(`/eliminar/${id}`, {
+            method: 'DELETE'
+        });
+
+        const data = await response.json();
+
+        if (response.ok) {
+            mostrarToast(data.message, 'success');
+            cargarRegistrosHoy();
+        } else {
+            mostrarToast(data.error || 'Error al eliminar', 'error');
+        }
+    } catch (error) {
+        mostrarToast('Error de conexión', 'error');
+        console.error('Error:', error);
+    }
+}
+
+// Variables para edición
+let registroEditandoId = null;
+
+// Variables para edición
+let moduloEditando = null;
+let fechaEditando = null;
+
+// Las opciones del selector de edición se piden la primera vez que se abre
+let opcionesModulosCargadas = null;
+
+function cargarOpcionesModulos() {
+    if (!opcionesModulosCargadas) {
+        opcionesModulosCargadas = fetchConValidador('/modulos').then(datos => {
+            document.getElementById('editModulo').innerHTML = datos.modulos
+                .map(m => `<option value="${m}">${m}</option>`).join('');
+        }).catch(error => {
+            opcionesModulosCargadas = null;
+            throw error;
+        });
+    }
+    return opcionesModulosCargadas;
+}
+
+// Abrir modal de edición
+async function abrirModalEditar(modulo, fecha) {
+    moduloEditando = modulo;
+    fechaEditando = fecha;
+
+    try {
+        await cargarOpcionesModulos();
+    } catch (error) {
+        console.error('Error al cargar módulos:', error);
+        mostrarToast('Error al cargar los módulos', 'error');
+        return;
+    }
+    document.getElementById('editModulo').value = modulo;
+
+    // Limpiar checkboxes
+    document.getElementById('editCheckAgua').checked = false;
+    document.getElementById('editCheckComida').checked = false;
+
+    // Cargar los tipos de riego actuales del módulo en esa fecha
+    try {
+        const registros = decodificarColumnar(await fetchConValidador(`/registros-hoy?fecha=${fecha}&format=columnar`));
+
+        // Filtrar los registros de este módulo en esta fecha
+        const registrosModulo = registros.filter(r => r.modulo === modulo && r.fecha === fecha);
+
+        // Marcar los tipos de riego existentes
+        registrosModulo.forEach(reg => {
+            const tipo = reg.tipo_riego === 'Agua' ? 'agua' : 'comida';
+            if (tipo === 'agua') {
+                document.getElementById('editCheckAgua').checked = true;
+            } else if (tipo === 'comida') {
+                document.getElementById('editCheckComida').checked = true;
+            }
+        });
+
+        document.getElementById('editModal').style.display = 'flex';
+    } catch (error) {
+        console.error('Error al cargar tipos de riego:', error);
+        mostrarToast('Error al cargar los datos', 'error');
+    }
+}
+
+// Cerrar modal
+function cerrarModal() {
+    document.getElementById('editModal').style.display = 'none';
+    moduloEditando = null;
+    fechaEditando = null;
+}
+
+// Guardar edición
+async function guardarEdicion() {
+    const modulo = document.getElementById('editModulo').value;
+    const checkboxes = document.querySelectorAll('input[name="editTipoRiego"]:checked');
+    const tiposSeleccionados = Array.from(checkboxes).map(cb => cb.value);
+
+    if (tiposSeleccionados.length === 0) {
+        mostrarToast('Por favor seleccione al menos un tipo de riego', 'error');
+        return;
+    }
+
+    try {
+        // Reemplazar en una sola operación los registros del módulo en esa fecha
+        const response = await fetch('/reemplazar-modulo-dia', {
+            method: 'PUT',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+                fecha: fechaEditando,
+                modulo: moduloEditando,
+                modulo_nuevo: modulo,
+                tipos_riego: tiposSeleccionados
+            })
+        });
+
+        const data = await response.json();
+
+        if (response.ok) {
+            mostrarToast(data.message, 'success');
+            cerrarModal();
+            cargarRegistrosHoy();
+        } else {
+            mostrarToast(data.error || 'Error al actualizar', 'error');
+        }
+    } catch (error) {
+        mostrarToast('Error de conexión', 'error');
+        console.error('Error:', error);
+    }
+}
+
+// Cerrar modal al hacer click fuera
+window.onclick = function(event) {
+    const modal = document.getElementById('editModal');
+    if (event.target === modal) {
+        cerrarModal();
+    }
+}
+
+// Mostrar toast
+function mostrarToast(mensaje, tipo = 'info') {
+    const toast = document.getElementById('toast');
+    toast.textContent = mensaje;
+    toast.className = `toast show ${tipo}`;
+
+    setTimeout(() => {
+        toast.className = 'toast';
+    }, 3000);
+}
+
+// Cargar registros al iniciar
+cargarRegistrosHoy();
+
+// Recibir los cambios en vivo; si no hay EventSource, actualizar cada 30 segundos.
+// Con eventos, una revalidación cada 5 minutos (304 si nada cambió) cubre
+// escrituras hechas fuera de este servidor.
+if (suscribirEventos(`/eventos?fecha=${document.body.dataset.fecha}`, cargarRegistrosHoy)) {
+    setInterval(cargarRegistrosHoy, 300000);
+} else {
+    setInterval(cargarRegistrosHoy, 30000);
+}
@@ -0,0 +1,117 @@
+// Página resumen
+
+let semanaActual = '';
+
+// Establecer la semana actual al cargar
+window.onload = function() {
+    const hoy = new Date();
+    const year = hoy.getFullYear();
+    const weekNum = getWeekNumber(hoy);
+    const semanaStr = `${year}-W${weekNum.toString().padStart(2, '0')}`;
+    document.getElementById('semana').value = semanaStr;
+    cargarResumen();
+};
+
+// Función para obtener el número de semana
+function getWeekNumber(date) {
+    const d = new Date(Date.UTC(date.getFullYear(), date.getMonth(), date.getDate()));
+    const dayNum = d.getUTCDay() || 7;
+    d.setUTCDate(d.getUTCDate() + 4 - dayNum);
+    const yearStart = new Date(Date.UTC(d.getUTCFullYear(), 0, 1));
+    return Math.ceil((((d - yearStart) / 86400000) + 1) / 7);
+}
+
+// Función para cargar el resumen
+async function cargarResumen() {
+    const semanaInput = document.getElementById('semana').value;
+    if (!semanaInput) {
+        alert('Por favor selecciona una semana');
+        return;
+    }
+
+    // Convertir formato de input (2025-W50) a formato API (2025-50)
+    const [year, week] = semanaInput.split('-W');
+    const semana = `${year}-${week}`;
+    semanaActual = semana;
+
+    document.getElementById('loading').style.display = 'block';
+    document.getElementById('tablaResumen').style.display = 'none';
+    document.getElementById('noDatos').style.display = 'none';
+    document.getElementById('semanaInfo').style.display = 'none';
+
+    try {
+        const response = await fetch(`/resumen-semanal?semana=${semana}`);
+        const data = await response.json();
+
+        if (data.datos && data.datos.length > 0) {
+            mostrarResumen(data.datos);
+            document.getElementById('semanaInfo').textContent = `Semana ${week} del año ${year}`;
+            document.getElementById('semanaInfo').style.display = 'block';
+        } else {
+            document.getElementById('loading').style.display = 'none';
+            document.getElementById('noDatos').style.display = 'block';
+        }
+    } catch (error) {
+        console.error('Error:', error);
+        document.getElementById('loading').style.display = 'none';
+        alert('Error al cargar el resumen');
+    }
+}
+
+// Función para mostrar el resumen
+function mostrarResumen(datos) {
+    const tbody = document.getElementById('tablaBody');
+    tbody.innerHTML = '';
+
+    datos.forEach(item => {
+        const tr = document.createElement('tr');
+        tr.innerHTML = `
+            <td>${item.semana}</td>
+            <td>${item.dia}</td>
+            <td>${item.modulo}</td>
+            <td class="${item.agua ? 'check-icon' : 'cross-icon'}">${item.agua ? '✓' : '✗'}</td>
+            <td class="${item.comida ? 'check-icon' : 'cross-icon'}">${item.comida ? '✓' : '✗'}</td>
+        `;
+        tbody.appendChild(tr);
+    });
+
+    document.getElementById('loading').style.display = 'none';
+    document.getElementById('tablaResumen').style.display = 'table';
+}
+
+// Función para exportar a Excel
+function exportarExcel() {
+    if (!semanaActual) {
+        alert('Por favor carga primero un resumen');
+        return;
+    }
+
+    window.location.href = `/exportar-excel?semana=${semanaActual}`;
+}
+
+// Función para exportar un rango de fechas (una hoja por semana)
+function exportarRango() {
+    const desde = document.getElementById('desde').value;
+    const hasta = document.getElementById('hasta').value;
+    if (!desde || !hasta) {
+        alert('Por favor selecciona las fechas desde y hasta');
+        return;
+    }
+    if (hasta < desde) {
+        alert('La fecha hasta debe ser posterior a desde');
+        return;
+    }
+
+    window.location.href = `/exportar-excel?desde=${desde}&hasta=${hasta}`;
+}
+
+// Traducir días al español
+const diasEspanol = {
+    'Monday': 'Lunes',
+    'Tuesday': 'Martes',
+    'Wednesday': 'Miércoles',
+    'Thursday': 'Jueves',
+    'Friday': 'Viernes',
+    'Saturday': 'Sábado',
+    'Sunday': 'Domingo'
+};
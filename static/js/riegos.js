@@ -0,0 +1,107 @@
+// Utilidades compartidas por las páginas de riegos
+
+// Respuestas ya recibidas por URL, con su ETag, para reutilizarlas en un 304
+const respuestasValidadas = new Map();
+
+// GET de JSON que devuelve el validador al servidor (If-None-Match).
+// Si el servidor responde 304 se reutiliza la última respuesta sin volver a
+// descargarla ni parsearla.
+async function fetchConValidador(url) {
+    const anterior = respuestasValidadas.get(url);
+    const headers = {};
+    if (anterior) {
+        headers['If-None-Match'] = anterior.etag;
+    }
+
+    const response = await fetch(url, { headers: headers, cache: 'no-store' });
+
+    if (response.status === 304 && anterior) {
+        return anterior.datos;
+    }
+    if (!response.ok) {
+        throw new Error(`HTTP ${response.status}`);
+    }
+
+    const datos = await response.json();
+    const etag = response.headers.get('ETag');
+    if (etag) {
+        respuestasValidadas.set(url, { etag: etag, datos: datos });
+    } else {
+        respuestasValidadas.delete(url);
+    }
+    return datos;
+}
+
+// Se suscribe al canal SSE de cambios y llama a alCambiar cuando llega un
+// evento (agrupando ráfagas) o cuando la conexión se (re)abre, para no perder
+// lo ocurrido mientras estuvo caída. Devuelve false si el navegador no
+// soporta EventSource, para que la página vuelva a consultar por intervalo.
+function suscribirEventos(url, alCambiar) {
+    if (!window.EventSource) {
+        return false;
+    }
+
+    let pendiente = null;
+    const programar = () => {
+        if (pendiente === null) {
+            pendiente = setTimeout(() => {
+                pendiente = null;
+                alCambiar();
+            }, 300);
+        }
+    };
+
+    const fuente = new EventSource(url);
+    fuente.addEventListener('open', programar);
+    ['insertar', 'actualizar', 'eliminar', 'recargar'].forEach(tipo => {
+        fuente.addEventListener(tipo, programar);
+    });
+    return true;
+}
+
+// Convierte una respuesta ?format=columnar en la lista de objetos de siempre.
+// Las columnas codificadas traen índices sobre datos.diccionarios.
+function decodificarColumnar(datos) {
+    const diccionarios = datos.diccionarios || {};
+    const columnas = Object.keys(datos).filter(c => c !== 'n' && c !== 'diccionarios');
+    const filas = new Array(datos.n);
+
+    for (let i = 0; i < datos.n; i++) {
+        const fila = {};
+        for (const columna of columnas) {
+            const valor = datos[columna][i];
+            fila[columna] = diccionarios[columna] ? diccionarios[columna][valor] : valor;
+        }
+        filas[i] = fila;
+    }
+    return filas;
+}
+
+// Clave única por envío para el encabezado Idempotency-Key
+function nuevaClaveIdempotencia() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+}
+
+// fetch que reintenta con espera exponencial ante fallos de red, errores del
+// servidor o un 409 (el mismo envío aún en proceso). Solo es seguro para
+// peticiones idempotentes o que llevan Idempotency-Key.
+async function fetchConReintentos(url, opciones, intentos = 4) {
+    let espera = 1000;
+    for (let intento = 1; ; intento++) {
+        try {
+            const response = await fetch(url, opciones);
+            if ((response.status < 500 && response.status !== 409) || intento >= intentos) {
+                return response;
+            }
+        } catch (error) {
+            if (intento >= intentos) {
+                throw error;
+            }
+        }
+        await new Promise(resolve => setTimeout(resolve, espera));
+        espera *= 2;
+    }
+}
@@ -0,0 +1,44 @@
+"""Sellos de versión por conjunto de datos para GET condicionales.
+
+Cada escritura de la app incrementa la versión de los conjuntos que toca
+(la fecha de las filas y el historial). El ETag de una respuesta se arma con
+esas versiones antes de consultar la base, de modo que un If-None-Match que
+coincide se responde con 304 sin tocarla.
+
+Las versiones viven en el proceso: no ven escrituras hechas por otros
+procesos o directamente en Supabase. Por eso el sello incluye además una
+ventana de tiempo (ETAG_VENTANA segundos) que acota cuánto puede durar un
+ETag viejo.
+"""
+import hashlib
+import threading
+import time
+import uuid
+from collections import Counter
+
+
+class VersionesDatos:
+    """Contadores de versión por conjunto de datos"""
+
+    def __init__(self, ventana=300):
+        self.ventana = ventana
+        # Cambia en cada arranque para que un reinicio invalide todos los ETags
+        self._epoca = uuid.uuid4().hex[:8]
+        self._versiones = Counter()
+        self._lock = threading.Lock()
+
+    def incrementar(self, *claves):
+        """Marca como modificados los conjuntos indicados"""
+        with self._lock:
+            for clave in claves:
+                self._versiones[clave] += 1
+
+    def etag(self, *claves, variante=''):
+        """ETag de una respuesta que depende de los conjuntos indicados"""
+        bloque = int(time.time() // self.ventana) if self.ventana > 0 else 0
+        with self._lock:
+            partes = [str(self._versiones[clave]) for clave in claves]
+        sello = '-'.join([self._epoca, str(bloque)] + partes)
+        if variante:
+            sello += '-' + hashlib.sha1(variante.encode()).hexdigest()[:10]
+        return sello